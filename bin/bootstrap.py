@@ -0,0 +1,229 @@
+#!/usr/bin/env python3
+"""
+CLOI Environment Bootstrap
+
+This script brings up everything CLOI needs locally in one go: it starts the
+Ollama service and the CodeBERT embedding service at the same time, detects
+readiness of each with fast exponential backoff instead of fixed sleeps,
+checks the configured models through the Ollama HTTP API (/api/tags) and
+prints a breakdown of where startup time went.
+
+Usage:
+    python bin/bootstrap.py
+    python bin/bootstrap.py --model phi4 --model llama3.2:1b --pull
+    python bin/bootstrap.py --no-codebert --json
+"""
+
+import sys
+import json
+import time
+import argparse
+import subprocess
+from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+from ollama_setup import OllamaSetup, wait_until_ready, model_matches
+
+CODEBERT_PORT = 3090
+DEFAULT_TIMEOUT = 60
+# Cap on the readiness backoff, so a service is noticed at most this long after it is up
+POLL_MAX_DELAY = 0.25
+
+class ProcessExited(RuntimeError):
+    """A spawned service exited before it became ready"""
+
+class Bootstrap:
+    """Starts Ollama and the CodeBERT service concurrently and records startup timings"""
+
+    def __init__(self, models=('phi4',), ollama_url=None, codebert_url=None, timeout=DEFAULT_TIMEOUT,
+                 codebert=True, pull=False, ollama_command=None, codebert_command=None):
+        """
+        Args:
+            models: Ollama models that must be available
+            ollama_url: Base URL of the Ollama API (default: http://localhost:11434)
+            codebert_url: Base URL of the CodeBERT service (default: http://127.0.0.1:3090)
+            timeout: Seconds to wait for each service to become ready
+            codebert: Whether to start the CodeBERT service at all
+            pull: Pull missing models instead of only reporting them
+            ollama_command: Command that starts Ollama (default: ollama serve)
+            codebert_command: Command that starts the CodeBERT service
+        """
+        self.models = list(models)
+        self.ollama = OllamaSetup(self.models[0] if self.models else 'phi4', ollama_url)
+        self.codebert_url = (codebert_url or f"http://127.0.0.1:{CODEBERT_PORT}").rstrip('/')
+        self.timeout = timeout
+        self.codebert = codebert
+        self.pull = pull
+        self.ollama_command = ollama_command
+        self.codebert_command = codebert_command or [
+            sys.executable, str(Path(__file__).resolve().parent / 'codebert_service.py'),
+            '--port', str(CODEBERT_PORT), '--socket'
+        ]
+        self.session = requests.Session()
+        self.processes = []
+
+    def _spawn(self, command):
+        process = subprocess.Popen(command, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+                                   start_new_session=True)
+        self.processes.append(process)
+        return process
+
+    def _wait(self, check, process):
+        """Wait for check() with backoff, failing fast if the spawned process dies"""
+        def ready():
+            if check():
+                return True
+            if process.poll() is not None:
+                raise ProcessExited(f"exited with code {process.returncode} before becoming ready")
+            return False
+        return wait_until_ready(ready, self.timeout, max_delay=POLL_MAX_DELAY)
+
+    def _start_service(self, is_running, command):
+        """Shared start logic: reuse a running service, else spawn and wait for it"""
+        began = time.monotonic()
+        if is_running():
+            return {'status': 'running', 'check_seconds': time.monotonic() - began}
+        result = {'status': 'started'}
+        try:
+            spawn_began = time.monotonic()
+            process = self._spawn(command)
+            result['spawn_seconds'] = time.monotonic() - spawn_began
+            waited = self._wait(is_running, process)
+            if waited is None:
+                result.update(status='failed', error=f"not ready after {self.timeout}s")
+            else:
+                result['ready_seconds'] = waited
+        except (OSError, ProcessExited) as e:
+            result.update(status='failed', error=str(e))
+        result['total_seconds'] = time.monotonic() - began
+        return result
+
+    def start_ollama(self):
+        """Start Ollama if needed, then check the configured models"""
+        result = self._start_service(lambda: self.ollama.is_service_running(timeout=0.5),
+                                     self.ollama_command or ['ollama', 'serve'])
+        if result['status'] == 'failed':
+            return result, None
+        return result, self.check_models()
+
+    def check_models(self):
+        """Compare configured models with /api/tags, pulling missing ones if requested"""
+        began = time.monotonic()
+        models = {'available': [], 'missing': [], 'pulled': []}
+        try:
+            installed = self.ollama.list_models()
+        except (requests.RequestException, ValueError) as e:
+            return dict(models, seconds=time.monotonic() - began, error=str(e))
+        for name in self.models:
+            if any(model_matches(name, installed_name) for installed_name in installed):
+                models['available'].append(name)
+            elif self.pull:
+                try:
+                    self.ollama.pull_model(name)
+                    models['pulled'].append(name)
+                except (requests.RequestException, RuntimeError, ValueError):
+                    models['missing'].append(name)
+            else:
+                models['missing'].append(name)
+        models['seconds'] = time.monotonic() - began
+        return models
+
+    def is_codebert_running(self):
+        """Check the CodeBERT service's /health endpoint (it only answers once the model is loaded)"""
+        try:
+            return self.session.get(f"{self.codebert_url}/health", timeout=0.5).status_code == 200
+        except requests.RequestException:
+            return False
+
+    def start_codebert(self):
+        """Start the CodeBERT service if needed"""
+        return self._start_service(self.is_codebert_running, self.codebert_command)
+
+    def run(self):
+        """Bring up both services concurrently; returns the timing report"""
+        began = time.monotonic()
+        with ThreadPoolExecutor(max_workers=2) as executor:
+            ollama_future = executor.submit(self.start_ollama)
+            codebert_future = executor.submit(self.start_codebert) if self.codebert else None
+            ollama, models = ollama_future.result()
+            codebert = codebert_future.result() if codebert_future else None
+
+        report = {'ollama': ollama, 'models': models, 'codebert': codebert,
+                  'total_seconds': time.monotonic() - began}
+        stages = [ollama.get('total_seconds', ollama.get('check_seconds', 0))]
+        stages.append(models['seconds'] if models else 0)
+        if codebert:
+            stages.append(codebert.get('total_seconds', codebert.get('check_seconds', 0)))
+        report['sequential_seconds'] = sum(stages)
+        report['ok'] = (
+            ollama['status'] != 'failed'
+            and bool(models) and not models['missing'] and 'error' not in models
+            and (codebert is None or codebert['status'] != 'failed')
+        )
+        return report
+
+def describe_service(name, result):
+    """One line of the timing breakdown for a service"""
+    if result is None:
+        return f"  {name:<10} skipped"
+    if result['status'] == 'running':
+        return f"  {name:<10} already running (checked in {result['check_seconds'] * 1000:.0f} ms)"
+    line = f"  {name:<10} {result['status']:<8}"
+    if 'spawn_seconds' in result:
+        line += f" spawn {result['spawn_seconds'] * 1000:.0f} ms"
+    if 'ready_seconds' in result:
+        line += f", ready after {result['ready_seconds']:.2f}s"
+    if 'error' in result:
+        line += f" ({result['error']})"
+    return line
+
+def print_report(report):
+    """Print the startup timing breakdown"""
+    print("Startup timing:")
+    print(describe_service('ollama', report['ollama']))
+    models = report['models']
+    if models is None:
+        print(f"  {'models':<10} not checked")
+    elif 'error' in models:
+        print(f"  {'models':<10} check failed: {models['error']}")
+    else:
+        parts = [f"{len(models['available'])} available"]
+        if models['pulled']:
+            parts.append(f"pulled {', '.join(models['pulled'])}")
+        if models['missing']:
+            parts.append(f"missing {', '.join(models['missing'])}")
+        print(f"  {'models':<10} {models['seconds'] * 1000:.0f} ms via /api/tags ({'; '.join(parts)})")
+    print(describe_service('codebert', report['codebert']))
+    print(f"  {'total':<10} {report['total_seconds']:.2f}s "
+          f"(one after the other: {report['sequential_seconds']:.2f}s)")
+
+def main():
+    parser = argparse.ArgumentParser(description='Start Ollama and the CodeBERT service in parallel')
+    parser.add_argument('--model', action='append', help='Ollama model that must be available (repeatable, default: phi4)')
+    parser.add_argument('--ollama-url', type=str, help='Ollama API URL (default: http://localhost:11434)')
+    parser.add_argument('--codebert-url', type=str, help='CodeBERT service URL (default: http://127.0.0.1:3090)')
+    parser.add_argument('--timeout', type=float, default=DEFAULT_TIMEOUT, help='Seconds to wait for each service')
+    parser.add_argument('--no-codebert', action='store_true', help='Only start Ollama')
+    parser.add_argument('--pull', action='store_true', help='Pull missing models')
+    parser.add_argument('--json', action='store_true', help='Print the report as JSON')
+    args = parser.parse_args()
+
+    bootstrap = Bootstrap(
+        models=args.model or ['phi4'],
+        ollama_url=args.ollama_url,
+        codebert_url=args.codebert_url,
+        timeout=args.timeout,
+        codebert=not args.no_codebert,
+        pull=args.pull
+    )
+    report = bootstrap.run()
+    if args.json:
+        print(json.dumps(report, indent=2))
+    else:
+        print_report(report)
+    return 0 if report['ok'] else 1
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,143 @@
+#!/usr/bin/env python3
+"""
+Shared Result Buffers for Bulk Embedding Jobs
+
+A bulk job's results live in one shared region: a small progress header
+followed by an N x dim float32 matrix written in input order. The region is
+either a `multiprocessing.shared_memory` block or a memory-mapped file, so a
+client on the same host can poll progress and read rows in place without
+copying them through a socket.
+
+Header layout (little endian, 64 bytes):
+    8s  magic 'CLOIEMB1'
+    I   version
+    I   status (0 running, 1 done, 2 failed)
+    I   dim
+    I   reserved
+    Q   completed rows
+    Q   total rows
+"""
+
+import os
+import mmap
+import time
+import struct
+from pathlib import Path
+
+import numpy as np
+
+MAGIC = b'CLOIEMB1'
+VERSION = 1
+HEADER_FORMAT = '<8sIIIIQQ'
+HEADER_SIZE = 64
+
+STATUS_RUNNING = 0
+STATUS_DONE = 1
+STATUS_FAILED = 2
+STATUS_NAMES = {STATUS_RUNNING: 'running', STATUS_DONE: 'done', STATUS_FAILED: 'failed'}
+
+def _untrack(name):
+    """Keep this process's resource tracker from unlinking a segment it did not create"""
+    try:
+        from multiprocessing import resource_tracker
+        resource_tracker.unregister(f"/{name}" if not name.startswith('/') else name, 'shared_memory')
+    except Exception:
+        pass
+
+class BulkBuffer:
+    """Progress header plus float32 result matrix in shared memory or a mapped file"""
+
+    def __init__(self, buf, rows, dim, name, transport, owner, handle=None):
+        self.buf = buf
+        self.rows = rows
+        self.dim = dim
+        self.name = name
+        self.transport = transport
+        self.owner = owner
+        self._handle = handle
+        self.matrix = np.ndarray((rows, dim), dtype=np.float32, buffer=buf, offset=HEADER_SIZE)
+
+    @classmethod
+    def create(cls, rows, dim, transport='shm', path=None):
+        """Allocate a buffer for rows x dim results ('shm', or 'file' at path)"""
+        size = HEADER_SIZE + rows * dim * 4
+        if transport == 'shm':
+            from multiprocessing import shared_memory
+            shm = shared_memory.SharedMemory(create=True, size=max(size, 1))
+            buffer = cls(shm.buf, rows, dim, shm.name, transport, True, shm)
+        elif transport == 'file':
+            path = Path(path)
+            path.parent.mkdir(parents=True, exist_ok=True)
+            with open(path, 'wb+') as f:
+                f.truncate(size)
+                mapped = mmap.mmap(f.fileno(), size)
+            buffer = cls(mapped, rows, dim, str(path), transport, True, mapped)
+        else:
+            raise ValueError(f"Unknown transport: {transport}")
+        buffer._write_header(STATUS_RUNNING, 0)
+        return buffer
+
+    @classmethod
+    def attach(cls, name, transport='shm'):
+        """Open an existing buffer by shared memory name or file path, read-only by convention"""
+        if transport == 'shm':
+            from multiprocessing import shared_memory
+            shm = shared_memory.SharedMemory(name=name)
+            _untrack(shm._name)
+            buf, handle = shm.buf, shm
+        else:
+            with open(name, 'rb') as f:
+                handle = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            buf = handle
+        magic, version, _, dim, _, _, rows = struct.unpack_from(HEADER_FORMAT, buf, 0)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError(f"{name} is not a bulk embedding buffer")
+        return cls(buf, rows, dim, name, transport, False, handle)
+
+    def _write_header(self, status, completed):
+        struct.pack_into(HEADER_FORMAT, self.buf, 0, MAGIC, VERSION, status, self.dim, 0, completed, self.rows)
+
+    def write_rows(self, start, values):
+        """Write result rows starting at start, then publish the new progress"""
+        values = np.asarray(values, dtype=np.float32)
+        self.matrix[start:start + len(values)] = values
+        self.publish(start + len(values))
+
+    def publish(self, completed):
+        """Publish the number of completed rows; rows must be written before calling this"""
+        self._write_header(STATUS_RUNNING, completed)
+
+    def finish(self, failed=False):
+        """Mark the job as done (or failed) in the header"""
+        completed = self.progress()['completed']
+        self._write_header(STATUS_FAILED if failed else STATUS_DONE, completed)
+
+    def progress(self):
+        """Read the progress header"""
+        _, _, status, dim, _, completed, rows = struct.unpack_from(HEADER_FORMAT, self.buf, 0)
+        return {'status': STATUS_NAMES.get(status, 'unknown'), 'completed': completed, 'total': rows, 'dim': dim}
+
+    def wait(self, poll_interval=0.05, timeout=None):
+        """Poll the header until the job is no longer running; returns the final progress"""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            progress = self.progress()
+            if progress['status'] != 'running':
+                return progress
+            if deadline is not None and time.monotonic() > deadline:
+                raise TimeoutError(f"Bulk job {self.name} still running after {timeout}s")
+            time.sleep(poll_interval)
+
+    def close(self):
+        """Release this process's mapping; the creator also removes the region"""
+        self.matrix = None
+        if self.transport == 'shm':
+            self.buf = None
+            self._handle.close()
+            if self.owner:
+                self._handle.unlink()
+        else:
+            self.buf = None
+            self._handle.close()
+            if self.owner and os.path.exists(self.name):
+                os.unlink(self.name)
@@ -9,13 +9,28 @@ directly using the PyTorch model.
 import os
 import sys
 import json
+import hmac
+import time
 import torch
 import logging
+import socket
+import threading
+import socketserver
+import uuid
+import numpy as np
 from pathlib import Path
-from http.server import HTTPServer, BaseHTTPRequestHandler
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
 from urllib.parse import parse_qs, urlparse
 import argparse
 
+from bulk_buffer import BulkBuffer, HEADER_SIZE
+from model_pool import MB, ModelPool, parse_model_specs
+from early_exit import encode_truncated, load_alignment, apply_alignment
+from dedup import DEFAULT_THRESHOLD, find_duplicates
+from line_chunker import chunk_lines
+from service_profiler import (SamplingProfiler, TorchTrace, start_request_timer, clear_request_timer,
+                              current_timer, lap)
+
 # Setup logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
@@ -24,53 +39,92 @@ logger = logging.getLogger(__name__)
 parser = argparse.ArgumentParser(description='CodeBERT Embedding Service')
 parser.add_argument('--port', type=int, default=3090, help='Port to run the service on')
 parser.add_argument('--model-dir', type=str, help='Directory containing the PyTorch model')
+parser.add_argument('--socket', type=str, nargs='?', const='',
+                    help='Also listen on a Unix domain socket (default path: ~/.cloi/run/codebert.sock)')
+parser.add_argument('--models', type=str,
+                    help='Additional models to serve as name=path pairs, e.g. graphcodebert=~/.cloi/models/graphcodebert-base')
+parser.add_argument('--default-model', type=str, default='codebert', help='Model used when a request names none')
+parser.add_argument('--memory-budget-mb', type=int,
+                    help='Unload least recently used idle models to keep loaded weights under this size')
+parser.add_argument('--idle-unload-minutes', type=float, default=10,
+                    help='Release models unused for this many minutes and return their memory to the OS (0 to disable)')
+parser.add_argument('--admin-token', type=str, default=os.environ.get('CLOI_ADMIN_TOKEN'),
+                    help='Bearer token for /debug endpoints over TCP (the Unix socket is always allowed)')
+parser.add_argument('--job-ttl-minutes', type=float, default=60,
+                    help='Release finished bulk jobs not deleted by their client after this many minutes (0 to keep them)')
 args = parser.parse_args()
 
 # Set default model directory if not specified
 home_dir = Path.home()
+socket_path = None
+if args.socket is not None:
+    socket_path = args.socket or str(home_dir / '.cloi' / 'run' / 'codebert.sock')
 model_dir = args.model_dir or str(home_dir / '.cloi' / 'models' / 'codebert-base')
 
-# Global variables
-model = None
-tokenizer = None
+MAX_LENGTH = 512
+BATCH_SIZE = 32
 
-def load_model():
-    """Load the CodeBERT model and tokenizer"""
-    global model, tokenizer
-    
+# Models are loaded on first use and selected per request by name; the pool keeps
+# one lock per model because the fast tokenizer is not safe for concurrent use
+pool = ModelPool(
+    {'codebert': model_dir, **parse_model_specs(args.models)},
+    default=args.default_model,
+    memory_budget=args.memory_budget_mb * MB if args.memory_budget_mb else None,
+    idle_timeout=args.idle_unload_minutes * 60 if args.idle_unload_minutes else None
+)
+
+# Bulk jobs by id, and where file-backed job buffers are created
+jobs = {}
+jobs_lock = threading.Lock()
+jobs_dir = home_dir / '.cloi' / 'run' / 'jobs'
+job_ttl = args.job_ttl_minutes * 60
+
+# POST requests being handled right now, reported by /health so a router can balance load
+in_flight = 0
+in_flight_lock = threading.Lock()
+
+# On-demand profiling: one capture at a time, files saved next to the job buffers
+MAX_PROFILE_SECONDS = 60
+profiles_dir = home_dir / '.cloi' / 'run' / 'profiles'
+profile_lock = threading.Lock()
+torch_trace = TorchTrace()
+
+def load_tokenizer(model_name=None):
+    """Load only the tokenizer, for endpoints that do not need the model"""
+    return pool.tokenizer(model_name)
+
+def load_model(model_name=None):
+    """Load a model and its tokenizer into the pool"""
     try:
-        from transformers import AutoModel, AutoTokenizer
-        
-        logger.info(f"Loading CodeBERT model from {model_dir}")
-        
-        # Load tokenizer and model
-        tokenizer = AutoTokenizer.from_pretrained(model_dir, local_files_only=True)
-        model = AutoModel.from_pretrained(model_dir, local_files_only=True)
-        
-        # Set model to evaluation mode
-        model.eval()
-        
-        logger.info("Successfully loaded CodeBERT model and tokenizer")
+        with pool.acquire(model_name):
+            pass
+        logger.info(f"Successfully loaded model '{pool.resolve(model_name)}' and tokenizer")
         return True
     except Exception as e:
         logger.error(f"Error loading model: {e}")
         return False
 
-def generate_embedding(text):
-    """Generate an embedding for the given text using CodeBERT"""
-    global model, tokenizer
-    
+def warm_model(model_name=None):
+    """Start loading a model in the background unless it is already loaded; returns its status"""
+    model_name = pool.resolve(model_name)
+    if pool.is_loaded(model_name):
+        status = 'ready'
+    else:
+        threading.Thread(target=load_model, args=(model_name,), daemon=True).start()
+        status = 'warming'
+    return {'model': model_name, 'status': status, **pool.stats()['load_history'][model_name]}
+
+def generate_embedding(text, model_name=None):
+    """Generate an embedding for the given text using the selected model"""
     try:
-        # Ensure model is loaded
-        if model is None or tokenizer is None:
-            load_model()
-        
-        # Preprocess and tokenize
-        inputs = tokenizer(text, return_tensors="pt", padding=True, truncation=True, max_length=512)
-        
-        # Generate embedding
-        with torch.no_grad():
-            outputs = model(**inputs)
+        # Preprocess, tokenize and generate embedding
+        with pool.acquire(model_name) as entry, entry.lock, torch.no_grad():
+            lap('wait')
+            inputs = entry.tokenizer(text, return_tensors="pt", padding=True, truncation=True, max_length=512)
+            lap('tokenize')
+            with torch_trace.capture('forward'):
+                outputs = entry.model(**inputs)
+            lap('forward')
         
         # Extract embedding (mean pooling)
         # Get the last hidden state
@@ -104,29 +158,522 @@ def generate_embedding(text):
             logger.warning(f"Non-float values in embedding: {[type(x) for x in normalized_embedding if not isinstance(x, float)]}")
             normalized_embedding = [float(x) if not isinstance(x, float) else x for x in normalized_embedding]
         
+        lap('pool')
         return normalized_embedding
     except Exception as e:
         logger.error(f"Error generating embedding: {e}")
         return None
 
+def pool_embeddings(entry, input_ids, attention_mask, layers=None, align=True):
+    """
+    Run a pooled model on a tokenized batch and return L2-normalized mean-pooled float32 rows
+
+    With layers set below the model's depth only that many encoder layers run (see
+    early_exit.py), and a fitted alignment to full-depth space is applied if align is set.
+    """
+    truncated = bool(layers) and layers < entry.model.config.num_hidden_layers
+    with entry.lock, torch.no_grad():
+        lap('wait')
+        with torch_trace.capture('forward'):
+            if truncated:
+                last_hidden_state = encode_truncated(entry.model, input_ids, attention_mask, layers)
+            else:
+                last_hidden_state = entry.model(input_ids=input_ids, attention_mask=attention_mask).last_hidden_state
+        lap('forward')
+    mask = attention_mask.unsqueeze(-1).to(last_hidden_state.dtype)
+    pooled = (last_hidden_state * mask).sum(dim=1) / torch.clamp(mask.sum(dim=1), min=1e-9)
+    rows = torch.nn.functional.normalize(pooled, p=2, dim=1).numpy().astype(np.float32)
+    if truncated and align:
+        rows = apply_alignment(rows, load_alignment(str(entry.path), layers))
+    lap('pool')
+    return rows
+
+def embedding_dim(model_name=None):
+    """Hidden size of a model, read from its config.json without loading the weights"""
+    from transformers import AutoConfig
+    return AutoConfig.from_pretrained(pool.path(model_name)).hidden_size
+
+def embed_batch(texts, batch_size=BATCH_SIZE, model_name=None, layers=None, align=True):
+    """
+    Embed many texts, yielding (start, rows) in input order
+
+    Each batch is tokenized with padding to its own longest text only. The model
+    stays checked out of the pool, and so cannot be evicted, until the last batch.
+    layers and align select early-exit encoding as in pool_embeddings.
+    """
+    with pool.acquire(model_name) as entry:
+        for start in range(0, len(texts), batch_size):
+            with entry.lock:
+                lap('wait')
+                inputs = entry.tokenizer(texts[start:start + batch_size], return_tensors="pt",
+                                         padding=True, truncation=True, max_length=MAX_LENGTH)
+                lap('tokenize')
+            yield start, pool_embeddings(entry, inputs.input_ids, inputs.attention_mask, layers, align)
+
+def open_token_cache(cache_dir, model_name=None):
+    """Open a token cache built with the selected model's tokenizer"""
+    from token_cache import TokenCache
+    return TokenCache(cache_dir, Path(pool.path(model_name)) / 'tokenizer.json')
+
+def parse_dedup(value):
+    """Near-duplicate threshold from a request's dedup field: true for the default, a number, or off"""
+    if value is None or value is False:
+        return None
+    if value is True:
+        return DEFAULT_THRESHOLD
+    if isinstance(value, (int, float)) and 0 < value:
+        return float(value)
+    raise ValueError('dedup must be true, false or a similarity threshold above 0')
+
+def plan_duplicates(texts, threshold, model_name=None):
+    """Group texts by exact and near-duplicate token content; see dedup.py"""
+    with pool.name_lock(model_name):
+        lap('wait')
+        token_ids = load_tokenizer(model_name)(
+            texts,
+            add_special_tokens=False,
+            truncation=True,
+            max_length=MAX_LENGTH,
+            return_attention_mask=False,
+            verbose=False
+        )['input_ids']
+    lap('tokenize')
+    plan = find_duplicates(token_ids, threshold)
+    lap('dedup')
+    return plan
+
+def embed_planned(texts, plan, batch_size=BATCH_SIZE, model_name=None, **options):
+    """Embed only a plan's representatives, yielding (indices, rows) for every text sharing them"""
+    groups = plan.members()
+    representatives = plan.representatives
+    for start, rows in embed_batch([texts[i] for i in representatives], batch_size, model_name, **options):
+        yield plan.expand(representatives[start:start + len(rows)], rows, groups)
+
+def embed_token_cache(cache_dir, batch_size=BATCH_SIZE, model_name=None, dedup=None):
+    """
+    Embed a pre-tokenized corpus cache, yielding (indices, rows); see token_cache.py
+
+    With a dedup threshold only one chunk per duplicate group is embedded and its
+    rows are yielded for every chunk of the group.
+    """
+    cache = open_token_cache(cache_dir, model_name)
+    if not cache.is_valid():
+        raise ValueError(f"Token cache at {cache_dir} is missing or stale")
+    counts = cache.token_counts()
+    plan = None
+    if dedup:
+        plan = find_duplicates([cache.ids(i) for i in range(len(cache))], dedup)
+        logger.info(f"Token cache dedup: {plan.report()}")
+        order = plan.representatives[np.argsort(counts[plan.representatives], kind='stable')]
+        groups = plan.members()
+    else:
+        order = np.argsort(counts, kind='stable')
+    with pool.acquire(model_name) as entry:
+        for indices, input_ids, attention_mask in cache.iter_batches(batch_size, order):
+            rows = pool_embeddings(entry, torch.from_numpy(input_ids), torch.from_numpy(attention_mask))
+            yield plan.expand(indices, rows, groups) if plan else (indices, rows)
+
+def run_bulk_job(job):
+    """Fill a job's shared buffer with embeddings, publishing progress after every batch"""
+    buffer = job['buffer']
+    try:
+        if job['texts'] is not None and not job['dedup']:
+            for start, rows in embed_batch(job['texts'], job['batch_size'], job['model']):
+                buffer.write_rows(start, rows)
+        else:
+            # Cache batches come in length order and duplicates share rows, so rows are written by index
+            if job['texts'] is not None:
+                plan = plan_duplicates(job['texts'], job['dedup'], job['model'])
+                job['dedup_report'] = plan.report()
+                batches = embed_planned(job['texts'], plan, job['batch_size'], job['model'])
+            else:
+                batches = embed_token_cache(job['token_cache'], job['batch_size'], job['model'], job['dedup'])
+            done = 0
+            for indices, rows in batches:
+                buffer.matrix[indices] = rows
+                done += len(indices)
+                buffer.publish(done)
+        buffer.finish()
+    except Exception as e:
+        logger.error(f"Bulk job {job['id']} failed: {e}")
+        job['error'] = str(e)
+        buffer.finish(failed=True)
+    finally:
+        job['texts'] = None
+        job['finished_at'] = time.monotonic()
+
+def create_bulk_job(data):
+    """Allocate the shared result buffer for a bulk job and start filling it in the background"""
+    texts = data.get('texts')
+    cache_dir = data.get('token_cache')
+    if texts is None and cache_dir is None:
+        raise ValueError('Missing texts or token_cache parameter')
+    if texts is not None and (not isinstance(texts, list) or not all(isinstance(t, str) for t in texts)):
+        raise ValueError('texts must be a list of strings')
+
+    model_name = pool.resolve(data.get('model'))
+    dedup = parse_dedup(data.get('dedup'))
+    if texts is not None:
+        rows = len(texts)
+    else:
+        rows = len(open_token_cache(cache_dir, model_name))
+
+    job_id = uuid.uuid4().hex
+    transport = data.get('transport', 'shm')
+    buffer = BulkBuffer.create(rows, embedding_dim(model_name), transport, jobs_dir / f"{job_id}.f32")
+    job = {
+        'id': job_id,
+        'buffer': buffer,
+        'model': model_name,
+        'texts': texts,
+        'token_cache': cache_dir,
+        'batch_size': int(data.get('batch_size', BATCH_SIZE)),
+        'dedup': dedup,
+        'dedup_report': None,
+        'error': None,
+        'finished_at': None
+    }
+    with jobs_lock:
+        jobs[job_id] = job
+    threading.Thread(target=run_bulk_job, args=(job,), daemon=True).start()
+    return job
+
+def expire_jobs():
+    """Release finished jobs whose client never deleted them within the TTL; returns how many"""
+    now = time.monotonic()
+    with jobs_lock:
+        expired = [job for job in jobs.values()
+                   if job['finished_at'] is not None and now - job['finished_at'] > job_ttl]
+        for job in expired:
+            del jobs[job['id']]
+            job['buffer'].close()
+    for job in expired:
+        logger.info(f"Released bulk job {job['id']}, unread for {job_ttl / 60:g} minutes")
+    return len(expired)
+
+def start_job_reaper():
+    """Expire unread finished jobs in a background thread"""
+    if not job_ttl:
+        return
+    interval = max(1.0, min(60.0, job_ttl / 4))
+
+    def reap():
+        while True:
+            time.sleep(interval)
+            try:
+                expire_jobs()
+            except Exception as e:
+                logger.error(f"Job expiry failed: {e}")
+
+    threading.Thread(target=reap, name='job-reaper', daemon=True).start()
+
+def describe_job(job):
+    """JSON description of a bulk job, including where its results live"""
+    buffer = job['buffer']
+    return {
+        'job_id': job['id'],
+        'model': job['model'],
+        'transport': buffer.transport,
+        'name': buffer.name,
+        'rows': buffer.rows,
+        'dim': buffer.dim,
+        'dtype': 'float32',
+        'header_bytes': HEADER_SIZE,
+        'error': job['error'],
+        'dedup': job['dedup_report'],
+        **buffer.progress()
+    }
+
+def queue_status():
+    """Requests in flight and bulk jobs still running, as reported by /health"""
+    with jobs_lock:
+        running = sum(1 for job in jobs.values() if job['buffer'].progress()['status'] == 'running')
+    return {'queue_depth': in_flight, 'jobs_running': running}
+
+def capture_profile(seconds, with_torch=False, exclude=()):
+    """Sample all service threads for a number of seconds, optionally tracing forward passes with torch.profiler"""
+    profiler = SamplingProfiler(exclude=exclude)
+    if with_torch:
+        torch_trace.start()
+    profiler.start()
+    try:
+        time.sleep(seconds)
+    finally:
+        profiler.stop()
+        trace = torch_trace.stop() if with_torch else None
+    return profiler, trace
+
+def count_tokens(texts, return_offsets=False, add_special_tokens=True, model_name=None):
+    """Count tokens for many texts in one fast-tokenizer batch call, without running the model"""
+    with pool.name_lock(model_name):
+        lap('wait')
+        encoded = load_tokenizer(model_name)(
+            texts,
+            add_special_tokens=add_special_tokens,
+            return_offsets_mapping=return_offsets,
+            return_attention_mask=False,
+            verbose=False
+        )
+    lap('tokenize')
+    result = {'counts': [len(ids) for ids in encoded['input_ids']]}
+    if return_offsets:
+        result['offsets'] = [[list(pair) for pair in offsets] for offsets in encoded['offset_mapping']]
+    return result
+
+def chunk_text(text, max_tokens=MAX_LENGTH, overlap_lines=0, model_name=None):
+    """
+    Split text into windows of at most max_tokens tokens (special tokens included) on line boundaries
+
+    Windows are packed from per-line counts of one whole-file tokenization and
+    each is re-tokenized before it is emitted (see line_chunker.py).
+    """
+    budget = max_tokens - load_tokenizer(model_name).num_special_tokens_to_add()
+
+    def encode(span):
+        return count_tokens([span], return_offsets=True, add_special_tokens=False, model_name=model_name)['offsets'][0]
+
+    return chunk_lines(text, budget, encode, overlap_lines)
+
 class RequestHandler(BaseHTTPRequestHandler):
+    # HTTP/1.1 keeps connections open between requests; every response carries Content-Length
+    protocol_version = 'HTTP/1.1'
+    disable_nagle_algorithm = True
+
+    def parse_request(self):
+        """Parse the request line and headers, and start stage timing if X-Profile is set"""
+        if not super().parse_request():
+            return False
+        if self.headers.get('X-Profile'):
+            start_request_timer()
+        else:
+            clear_request_timer()
+        return True
+
     def _send_response(self, status_code, content):
         """Send HTTP response with JSON content"""
+        body = json.dumps(content).encode()
+        lap('serialize')
         self.send_response(status_code)
         self.send_header('Content-type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        timer = current_timer()
+        if timer is not None:
+            self.send_header('Server-Timing', timer.server_timing())
         self.end_headers()
-        self.wfile.write(json.dumps(content).encode())
+        self.wfile.write(body)
     
+    def _get_job(self):
+        """Look up the bulk job addressed by /jobs/<id>, sending 404 if unknown"""
+        with jobs_lock:
+            job = jobs.get(self.path[len('/jobs/'):])
+        if job is None:
+            self._send_response(404, {'error': 'Unknown job'})
+        return job
+
+    def _is_admin(self):
+        """Admin requests come over the owner-only Unix socket or carry the admin token"""
+        if isinstance(self, UnixRequestHandler):
+            return True
+        token = args.admin_token
+        return bool(token) and hmac.compare_digest(self.headers.get('Authorization', ''), f'Bearer {token}')
+
+    def _handle_profile(self):
+        """Profile the service for ?seconds=N; returns a speedscope profile or, with save/torch, file paths"""
+        if not self._is_admin():
+            self._send_response(403, {'error': 'Admin access required'})
+            return
+        query = parse_qs(urlparse(self.path).query)
+        flag = lambda name: query.get(name, ['0'])[0].lower() in ('1', 'true', 'yes')
+        try:
+            seconds = float(query.get('seconds', ['5'])[0])
+        except ValueError:
+            seconds = -1
+        if not 0 < seconds <= MAX_PROFILE_SECONDS:
+            self._send_response(400, {'error': f'seconds must be between 0 and {MAX_PROFILE_SECONDS}'})
+            return
+        with_torch = flag('torch')
+        if not profile_lock.acquire(blocking=False):
+            self._send_response(409, {'error': 'A profile is already being captured'})
+            return
+        try:
+            profiler, trace = capture_profile(seconds, with_torch, exclude=[threading.get_ident()])
+        finally:
+            profile_lock.release()
+
+        stamp = time.strftime('%Y%m%d-%H%M%S')
+        speedscope = profiler.to_speedscope(f'codebert_service {stamp}')
+        if not (flag('save') or with_torch):
+            self._send_response(200, speedscope)
+            return
+
+        profiles_dir.mkdir(parents=True, exist_ok=True)
+        result = {'seconds': seconds, 'samples': profiler.sample_count(), 'top': profiler.top_functions()}
+        result['speedscope'] = str(profiles_dir / f'profile-{stamp}.speedscope.json')
+        with open(result['speedscope'], 'w', encoding='utf-8') as f:
+            json.dump(speedscope, f)
+        if trace is not None:
+            result['torch_trace'] = str(profiles_dir / f'torch-{stamp}.trace.json')
+            result['torch_events'] = len(trace['traceEvents'])
+            with open(result['torch_trace'], 'w', encoding='utf-8') as f:
+                json.dump(trace, f)
+        logger.info(f"Saved profile of {seconds}s to {profiles_dir}")
+        self._send_response(200, result)
+
     def do_GET(self):
-        """Handle GET requests - for health check"""
+        """Handle GET requests - for health check, bulk job progress and profiling"""
         if self.path == '/health':
-            self._send_response(200, {'status': 'ok', 'model': 'codebert'})
+            self._send_response(200, {'status': 'ok', 'model': pool.default, 'models': pool.stats(), **queue_status()})
+        elif self.path == '/models':
+            self._send_response(200, pool.stats())
+        elif self.path.startswith('/jobs/'):
+            job = self._get_job()
+            if job:
+                self._send_response(200, describe_job(job))
+        elif urlparse(self.path).path == '/debug/profile':
+            self._handle_profile()
+        else:
+            self._send_response(404, {'error': 'Not found'})
+
+    def do_DELETE(self):
+        """Release a bulk job's shared buffer once the client has read it"""
+        if self.path.startswith('/jobs/'):
+            job = self._get_job()
+            if not job:
+                return
+            with jobs_lock:
+                # Checked and released under the lock so a concurrent DELETE or expiry cannot close it twice
+                if jobs.get(job['id']) is not job:
+                    status = 404
+                elif job['buffer'].progress()['status'] == 'running':
+                    status = 409
+                else:
+                    status = 200
+                    del jobs[job['id']]
+                    job['buffer'].close()
+            if status == 404:
+                self._send_response(404, {'error': 'Unknown job'})
+            elif status == 409:
+                self._send_response(409, {'error': 'Job is still running'})
+            else:
+                self._send_response(200, {'job_id': job['id'], 'deleted': True})
         else:
             self._send_response(404, {'error': 'Not found'})
     
+    def _read_json(self):
+        """Read and parse a JSON request body"""
+        content_length = int(self.headers['Content-Length'])
+        data = json.loads(self.rfile.read(content_length).decode('utf-8'))
+        lap('read')
+        return data
+
+    def _handle_warm(self):
+        """Preload a model in the background so the next embed request does not pay for it"""
+        has_body = int(self.headers.get('Content-Length') or 0) > 0
+        data = self._read_json() if has_body else {}
+        result = warm_model(data.get('model'))
+        self._send_response(200 if result['status'] == 'ready' else 202, result)
+
+    def _handle_tokenize(self):
+        """Token counts (and optional offsets) for a batch of texts"""
+        data = self._read_json()
+        texts = data.get('texts')
+        if texts is None and 'text' in data:
+            texts = [data['text']]
+        if not isinstance(texts, list) or not all(isinstance(t, str) for t in texts):
+            self._send_response(400, {'error': 'Missing texts parameter'})
+            return
+        self._send_response(200, count_tokens(
+            texts,
+            return_offsets=bool(data.get('offsets', False)),
+            add_special_tokens=bool(data.get('add_special_tokens', True)),
+            model_name=data.get('model')
+        ))
+
+    def _handle_chunk(self):
+        """Split a whole file into token-bounded windows aligned to line boundaries"""
+        data = self._read_json()
+        text = data.get('text')
+        if not isinstance(text, str):
+            self._send_response(400, {'error': 'Missing text parameter'})
+            return
+        max_tokens = int(data.get('max_tokens', MAX_LENGTH))
+        if not 2 < max_tokens <= MAX_LENGTH:
+            self._send_response(400, {'error': f'max_tokens must be between 3 and {MAX_LENGTH}'})
+            return
+        overlap_lines = int(data.get('overlap_lines', 0))
+        if overlap_lines < 0:
+            self._send_response(400, {'error': 'overlap_lines must not be negative'})
+            return
+        chunks = chunk_text(text, max_tokens, overlap_lines, data.get('model'))
+        self._send_response(200, {'chunks': chunks, 'max_tokens': max_tokens})
+
+    def _handle_embed_batch(self, texts, model_name=None, layers=None, align=True, single=False, dedup=None):
+        """Embed a list of texts and return the rows in input order"""
+        if not all(isinstance(t, str) for t in texts):
+            self._send_response(400, {'error': 'texts must be a list of strings'})
+            return
+        embeddings = None
+        if dedup and len(texts) > 1:
+            # Duplicates share their representative's forward pass
+            plan = plan_duplicates(texts, dedup, model_name)
+            batches = embed_planned(texts, plan, model_name=model_name, layers=layers, align=align)
+        else:
+            plan = None
+            batches = ((np.arange(start, start + len(rows)), rows)
+                       for start, rows in embed_batch(texts, model_name=model_name, layers=layers, align=align))
+        for indices, rows in batches:
+            if embeddings is None:
+                embeddings = np.zeros((len(texts), rows.shape[1]), dtype=np.float32)
+            embeddings[indices] = rows
+        rows = [] if embeddings is None else embeddings.tolist()
+        response = {'embedding': rows[0]} if single else {'embeddings': rows}
+        if plan is not None:
+            response['dedup'] = plan.report()
+        if layers:
+            response['layers'] = layers
+            response['aligned'] = bool(align) and load_alignment(pool.path(model_name), layers) is not None
+        self._send_response(200, response)
+
     def do_POST(self):
-        """Handle POST requests for embedding generation"""
-        if self.path == '/embed':
+        """Handle POST requests, counting them in the queue depth while they run"""
+        global in_flight
+        with in_flight_lock:
+            in_flight += 1
+        try:
+            self._handle_post()
+        finally:
+            with in_flight_lock:
+                in_flight -= 1
+
+    def _handle_post(self):
+        """Dispatch POST requests for embedding generation, tokenization, chunking, warm-up and bulk jobs"""
+        if self.path == '/jobs':
+            try:
+                job = create_bulk_job(self._read_json())
+                self._send_response(202, describe_job(job))
+            except json.JSONDecodeError:
+                self._send_response(400, {'error': 'Invalid JSON'})
+            except ValueError as e:
+                self._send_response(400, {'error': str(e)})
+            except Exception as e:
+                logger.error(f"Error creating bulk job: {e}")
+                self._send_response(500, {'error': str(e)})
+        elif self.path in ('/tokenize', '/chunk', '/warm'):
+            try:
+                if self.path == '/tokenize':
+                    self._handle_tokenize()
+                elif self.path == '/chunk':
+                    self._handle_chunk()
+                else:
+                    self._handle_warm()
+            except json.JSONDecodeError:
+                self._send_response(400, {'error': 'Invalid JSON'})
+            except ValueError as e:
+                self._send_response(400, {'error': str(e)})
+            except Exception as e:
+                logger.error(f"Error processing request: {e}")
+                self._send_response(500, {'error': str(e)})
+        elif self.path == '/embed':
             # Get request body
             content_length = int(self.headers['Content-Length'])
             post_data = self.rfile.read(content_length).decode('utf-8')
@@ -134,14 +681,30 @@ class RequestHandler(BaseHTTPRequestHandler):
             try:
                 # Parse JSON
                 data = json.loads(post_data)
+                lap('read')
+                model_name = pool.resolve(data.get('model'))
+                # Early exit: pool from an intermediate layer for latency-critical queries
+                layers = data.get('layers')
+                if layers is not None and (not isinstance(layers, int) or isinstance(layers, bool) or layers < 1):
+                    self._send_response(400, {'error': 'layers must be a positive integer'})
+                    return
+                align = bool(data.get('align', True))
+                if isinstance(data.get('texts'), list):
+                    self._handle_embed_batch(data['texts'], model_name, layers, align,
+                                             dedup=parse_dedup(data.get('dedup')))
+                    return
                 text = data.get('text', '')
                 
                 if not text:
                     self._send_response(400, {'error': 'Missing text parameter'})
                     return
+
+                if layers:
+                    self._handle_embed_batch([text], model_name, layers, align, single=True)
+                    return
                 
                 # Generate embedding
-                embedding = generate_embedding(text)
+                embedding = generate_embedding(text, model_name)
                 
                 if embedding is None:
                     self._send_response(500, {'error': 'Failed to generate embedding'})
@@ -162,18 +725,68 @@ class RequestHandler(BaseHTTPRequestHandler):
                 self._send_response(200, {'embedding': [float(x) for x in embedding]})
             except json.JSONDecodeError:
                 self._send_response(400, {'error': 'Invalid JSON'})
+            except ValueError as e:
+                self._send_response(400, {'error': str(e)})
             except Exception as e:
                 logger.error(f"Error processing request: {e}")
                 self._send_response(500, {'error': str(e)})
         else:
             self._send_response(404, {'error': 'Not found'})
 
+class UnixRequestHandler(RequestHandler):
+    # TCP_NODELAY does not apply to Unix domain sockets
+    disable_nagle_algorithm = False
+
+class UnixHTTPServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    """Threaded HTTP server listening on a Unix domain socket"""
+    daemon_threads = True
+
+    def server_bind(self):
+        socketserver.UnixStreamServer.server_bind(self)
+        self.server_name = 'localhost'
+        self.server_port = 0
+
+    def get_request(self):
+        # BaseHTTPRequestHandler expects a (host, port) client address for logging
+        request, _ = self.socket.accept()
+        return request, ('unix', 0)
+
+def start_unix_server(path):
+    """Serve the same handler on a Unix domain socket in a background thread"""
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True, mode=0o700)
+    if path.exists() or path.is_socket():
+        # Remove a stale socket left behind by a previous process, unless one is still serving
+        probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            probe.connect(str(path))
+            raise RuntimeError(f"Another service is already listening on {path}")
+        except (ConnectionRefusedError, FileNotFoundError):
+            path.unlink()
+        finally:
+            probe.close()
+
+    server = UnixHTTPServer(str(path), UnixRequestHandler)
+    os.chmod(path, 0o600)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    logger.info(f"Listening on Unix domain socket {path}")
+    return server
+
 def run_server(port):
     """Run the HTTP server"""
     server_address = ('', port)
-    httpd = HTTPServer(server_address, RequestHandler)
+    httpd = ThreadingHTTPServer(server_address, RequestHandler)
+    unix_server = start_unix_server(socket_path) if socket_path else None
+    pool.start_idle_reaper()
+    start_job_reaper()
     logger.info(f"Starting CodeBERT service on port {port}")
-    httpd.serve_forever()
+    try:
+        httpd.serve_forever()
+    finally:
+        if unix_server:
+            unix_server.server_close()
+            Path(socket_path).unlink(missing_ok=True)
 
 if __name__ == "__main__":
     # Load the model
@@ -11,19 +11,32 @@ import os
 import sys
 import json
 import shutil
+import hashlib
 import argparse
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 
-# Parse command line arguments
-parser = argparse.ArgumentParser(description='Download CodeBERT model files')
-parser.add_argument('--break-system-packages', action='store_true', 
-                    help='Use --break-system-packages with pip (for externally managed Python)')
-parser.add_argument('--skip-dependencies', action='store_true',
-                    help='Skip installing dependencies and try to run with existing packages')
-args = parser.parse_args()
+from model_store import ArtifactStore, convert_to_safetensors
 
-# Install required packages if needed
-if not args.skip_dependencies:
+# Files at or above this size are fetched as several HTTP Range parts in parallel
+RANGE_SPLIT_THRESHOLD = 64 * 1024 * 1024
+RANGE_PART_SIZE = 32 * 1024 * 1024
+CHUNK_SIZE = 1024 * 1024
+
+def parse_args(argv=None):
+    """Parse command line arguments"""
+    parser = argparse.ArgumentParser(description='Download CodeBERT model files')
+    parser.add_argument('--break-system-packages', action='store_true', 
+                        help='Use --break-system-packages with pip (for externally managed Python)')
+    parser.add_argument('--skip-dependencies', action='store_true',
+                        help='Skip installing dependencies and try to run with existing packages')
+    parser.add_argument('--max-workers', type=int, default=4,
+                        help='Number of concurrent download connections')
+    return parser.parse_args(argv)
+
+def install_dependencies(args):
+    """Install required packages if needed"""
     import subprocess
     print("Installing required packages...")
     # First install basic packages
@@ -46,90 +59,271 @@ if not args.skip_dependencies:
         print(f"Warning: Could not install ML packages: {e}")
         print("Will continue with basic functionality, but ONNX conversion may fail.")
 
-# Import after potentially installing
-import requests
-from tqdm import tqdm
+class DownloadError(Exception):
+    """Raised when a file cannot be downloaded or fails verification"""
+
+class RangeNotSupported(DownloadError):
+    """Raised when a server answers a Range part request with the whole file"""
+
+def git_blob_sha1(path):
+    """Compute the git blob SHA-1 of a file (the hash the Hub advertises for non-LFS files)"""
+    digest = hashlib.sha1()
+    digest.update(f"blob {os.path.getsize(path)}\0".encode())
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(CHUNK_SIZE), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def sha256_file(path):
+    """Compute the SHA-256 hex digest of a file"""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(CHUNK_SIZE), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
 
 class CodeBERTDownloader:
     """Handles downloading and setting up the CodeBERT model files"""
     
-    def __init__(self):
+    def __init__(self, install_dir=None, hub_url=None, max_workers=4):
         """Initialize the CodeBERT downloader"""
+        import requests
+        from requests.adapters import HTTPAdapter
+
         self.model_name = "microsoft/codebert-base"
-        self.huggingface_url = f"https://huggingface.co/{self.model_name}"
-        self.api_url = f"https://huggingface.co/api/models/{self.model_name}"
+        self.fallback_tokenizer_model = "roberta-base"
+        self.hub_url = (hub_url or os.environ.get('HF_ENDPOINT', 'https://huggingface.co')).rstrip('/')
+        self.huggingface_url = f"{self.hub_url}/{self.model_name}"
+        self.api_url = f"{self.hub_url}/api/models/{self.model_name}"
+        self.max_workers = max_workers
         
         # Determine the installation directory
         home_dir = Path.home()
-        self.install_dir = Path(os.environ.get('CLOI_DATA_DIR', home_dir / '.cloi')) / 'models' / 'codebert-base'
+        self.install_dir = Path(install_dir) if install_dir else \
+            Path(os.environ.get('CLOI_DATA_DIR', home_dir / '.cloi')) / 'models' / 'codebert-base'
+        self.store = ArtifactStore(self.install_dir.parent)
+
+        # One pooled session shared by all download threads
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=max_workers, pool_maxsize=max_workers * 2, max_retries=3)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+        self._progress_lock = threading.Lock()
+        self._progress = None
         
     def check_model_files(self):
-        """Check if the model files already exist"""
+        """Check the artifact manifest for the required model files"""
         required_files = [
             'config.json',
             'tokenizer.json',
             'tokenizer_config.json',
-            'vocab.txt',
-            'model.onnx'
+            'vocab.json',
+            'merges.txt',
+            'onnx/model.onnx'
         ]
         
-        if not self.install_dir.exists():
-            return False
-            
-        for file in required_files:
-            if not (self.install_dir / file).exists():
-                return False
-                
-        return True
+        return self.store.has_files(self.install_dir, required_files)
         
     def create_directories(self):
         """Create necessary directories"""
         print(f"Creating directories at {self.install_dir}")
         os.makedirs(self.install_dir, exist_ok=True)
         os.makedirs(self.install_dir / 'onnx', exist_ok=True)
-        
-    def download_file(self, url, filepath):
-        """Download a file with progress bar"""
-        print(f"Downloading {filepath.name}...")
-        response = requests.get(url, stream=True)
-        total_size = int(response.headers.get('content-length', 0))
-        
-        with open(filepath, 'wb') as f, tqdm(
-            total=total_size,
-            unit='B',
-            unit_scale=True,
-            unit_divisor=1024,
-        ) as pbar:
-            for chunk in response.iter_content(chunk_size=1024):
-                if chunk:
-                    f.write(chunk)
-                    pbar.update(len(chunk))
-        
+
+    def fetch_file_metadata(self, model_name):
+        """
+        Fetch the file listing of a Hub repository with sizes and hashes
+
+        Returns a dict mapping filename to {'size', 'sha256', 'git_sha1'}; sha256
+        is only advertised for LFS files, small files carry their git blob id.
+        """
+        response = self.session.get(f"{self.hub_url}/api/models/{model_name}", params={'blobs': 'true'}, timeout=30)
+        if response.status_code != 200:
+            raise DownloadError(f"Error fetching model info for {model_name}: {response.status_code}")
+
+        metadata = {}
+        for sibling in response.json().get('siblings', []):
+            lfs = sibling.get('lfs') or {}
+            metadata[sibling.get('rfilename')] = {
+                'size': lfs.get('size', sibling.get('size')),
+                'sha256': lfs.get('sha256'),
+                'git_sha1': None if lfs else sibling.get('blobId')
+            }
+        return metadata
+
+    def _update_progress(self, amount):
+        """Advance the shared progress bar from a download thread"""
+        if self._progress is not None:
+            with self._progress_lock:
+                self._progress.update(amount)
+
+    def _fetch_range(self, url, partial_path, start=0, end=None):
+        """
+        Download bytes [start, end] of url into partial_path, resuming from its current length
+
+        Returns the number of bytes in partial_path afterwards.
+        """
+        have = partial_path.stat().st_size if partial_path.exists() else 0
+        if end is not None and start + have > end:
+            self._update_progress(have)
+            return have
+        self._update_progress(have)
+
+        headers = {}
+        if start + have > 0 or end is not None:
+            headers['Range'] = f"bytes={start + have}-{'' if end is None else end}"
+
+        with self.session.get(url, headers=headers, stream=True, timeout=60) as response:
+            if response.status_code == 200 and headers:
+                # Server ignored the Range header, start this part over
+                if start > 0 or end is not None:
+                    raise RangeNotSupported(f"Server does not support range requests for {url}")
+                self._update_progress(-have)
+                mode = 'wb'
+            elif response.status_code in (200, 206):
+                mode = 'ab'
+            elif response.status_code == 416 and end is None:
+                # Partial file already holds the whole content
+                return have
+            else:
+                raise DownloadError(f"Unexpected status {response.status_code} for {url}")
+
+            with open(partial_path, mode) as f:
+                for chunk in response.iter_content(chunk_size=CHUNK_SIZE):
+                    if chunk:
+                        f.write(chunk)
+                        self._update_progress(len(chunk))
+        return partial_path.stat().st_size
+
+    def _plan_parts(self, filepath, size):
+        """Split a download into (partial_path, start, end) Range parts"""
+        partial = filepath.with_name(filepath.name + '.partial')
+        if size is None or size < RANGE_SPLIT_THRESHOLD:
+            return [(partial, 0, None)]
+        return [
+            (filepath.with_name(f"{filepath.name}.partial.{index}"), start, min(start + RANGE_PART_SIZE, size) - 1)
+            for index, start in enumerate(range(0, size, RANGE_PART_SIZE))
+        ]
+
+    def _fetch_whole(self, url, filepath, parts):
+        """Discard the Range parts of a file and download it as a single stream instead"""
+        for part_path, _, _ in parts:
+            if part_path.exists():
+                self._update_progress(-part_path.stat().st_size)
+                part_path.unlink()
+        partial = filepath.with_name(filepath.name + '.partial')
+        self._fetch_range(url, partial)
+        return [(partial, 0, None)]
+
+    def _finalize(self, filepath, parts, meta):
+        """
+        Join downloaded parts, verify hashes and atomically move the result into place
+
+        Range parts are kept until the joined file verifies: after a size mismatch the
+        next run resumes them, after a hash mismatch they are discarded because any of
+        them may hold the bad bytes.
+        """
+        partial = filepath.with_name(filepath.name + '.partial')
+        split = len(parts) > 1
+        if split:
+            with open(partial, 'wb') as out:
+                for part_path, _, _ in parts:
+                    with open(part_path, 'rb') as f:
+                        shutil.copyfileobj(f, out, CHUNK_SIZE)
+
+        def discard(keep_parts=False):
+            partial.unlink()
+            if split and not keep_parts:
+                for part_path, _, _ in parts:
+                    part_path.unlink()
+
+        size = meta.get('size')
+        if size is not None and partial.stat().st_size != size:
+            actual = partial.stat().st_size
+            if split:
+                discard(keep_parts=actual < size)
+            elif actual > size:
+                discard()
+            raise DownloadError(f"{filepath.name}: expected {size} bytes, got {actual}")
+        if meta.get('sha256') and sha256_file(partial) != meta['sha256']:
+            discard()
+            raise DownloadError(f"{filepath.name}: SHA-256 mismatch")
+        if meta.get('git_sha1') and git_blob_sha1(partial) != meta['git_sha1']:
+            discard()
+            raise DownloadError(f"{filepath.name}: git blob hash mismatch")
+
+        os.replace(partial, filepath)
+        if split:
+            for part_path, _, _ in parts:
+                part_path.unlink()
         return filepath
+
+    def download_files(self, files):
+        """
+        Download several files concurrently over the pooled session
+
+        Args:
+            files: list of (url, filepath, meta) tuples; meta may carry size, sha256 and git_sha1
+
+        Large files are split into Range parts (or fetched as one stream from servers that
+        ignore Range), interrupted downloads resume from their .partial files, and each
+        file is verified before it is moved into place.
+        """
+        try:
+            from tqdm import tqdm
+        except ImportError:
+            tqdm = None
+
+        plans = []
+        for url, filepath, meta in files:
+            filepath = Path(filepath)
+            filepath.parent.mkdir(parents=True, exist_ok=True)
+            plans.append((url, filepath, meta or {}, self._plan_parts(filepath, (meta or {}).get('size'))))
+
+        total = sum(meta.get('size') or 0 for _, _, meta, _ in plans)
+        print(f"Downloading {', '.join(plan[1].name for plan in plans)}...")
+        if tqdm is not None:
+            self._progress = tqdm(total=total, unit='B', unit_scale=True, unit_divisor=1024)
+        try:
+            with ThreadPoolExecutor(max_workers=self.max_workers) as pool:
+                futures = [
+                    [pool.submit(self._fetch_range, url, *part) for part in parts]
+                    for url, _, _, parts in plans
+                ]
+                results = []
+                for (url, filepath, meta, parts), part_futures in zip(plans, futures):
+                    ranges_ignored = False
+                    for future in part_futures:
+                        try:
+                            future.result()
+                        except RangeNotSupported:
+                            ranges_ignored = True
+                    if ranges_ignored:
+                        print(f"Server ignored Range requests for {filepath.name}, downloading it as one stream")
+                        parts = self._fetch_whole(url, filepath, parts)
+                    results.append(self._finalize(filepath, parts, meta))
+                return results
+        finally:
+            if self._progress is not None:
+                self._progress.close()
+                self._progress = None
+
+    def download_file(self, url, filepath, meta=None):
+        """Download a single file with resume and verification"""
+        return self.download_files([(url, filepath, meta)])[0]
     
     def download_files_from_huggingface(self):
         """Download model files from Hugging Face"""
         print(f"Downloading CodeBERT model files from {self.huggingface_url}")
         
         try:
-            # Download model config
-            config_url = f"{self.huggingface_url}/resolve/main/config.json"
-            self.download_file(config_url, self.install_dir / 'config.json')
-            
-            # Download tokenizer files directly from CodeBERT
-            print("Downloading CodeBERT tokenizer files...")
-            
-            # First, get the model info from Hugging Face API to find all files
+            # Get the file listing (with sizes and hashes) from the Hugging Face API
             print("Fetching CodeBERT repository file list...")
-            api_response = requests.get(self.api_url)
-            if api_response.status_code != 200:
-                print(f"Error fetching model info: {api_response.status_code}")
-                return False
-                
-            model_info = api_response.json()
-            siblings = model_info.get('siblings', [])
+            metadata = self.fetch_file_metadata(self.model_name)
+
+            downloads = [(f"{self.huggingface_url}/resolve/main/config.json",
+                          self.install_dir / 'config.json', metadata.get('config.json'))]
             
-            # Create a map of filenames to download URLs
             tokenizer_files = [
                 'tokenizer.json',
                 'tokenizer_config.json', 
@@ -137,65 +331,54 @@ class CodeBERTDownloader:
                 'merges.txt'
             ]
             
-            tokenizer_map = {}
-            for sibling in siblings:
-                filename = sibling.get('rfilename')
-                if filename in tokenizer_files:
-                    tokenizer_map[filename] = sibling.get('download_url')
-            
             # If we can't find the files in CodeBERT, use RoBERTa's tokenizer (compatible)
-            if not all(file in tokenizer_map for file in tokenizer_files):
-                print("Some CodeBERT tokenizer files not found, using RoBERTa tokenizer files (compatible with CodeBERT)")
-                tokenizer_map = {
-                    'tokenizer.json': 'https://huggingface.co/roberta-base/resolve/main/tokenizer.json',
-                    'tokenizer_config.json': 'https://huggingface.co/roberta-base/resolve/main/tokenizer_config.json',
-                    'vocab.json': 'https://huggingface.co/roberta-base/resolve/main/vocab.json',
-                    'merges.txt': 'https://huggingface.co/roberta-base/resolve/main/merges.txt'
-                }
-            else:
+            if all(file in metadata for file in tokenizer_files):
                 print("Found all CodeBERT tokenizer files!")
+                tokenizer_source, tokenizer_metadata = self.model_name, metadata
+            else:
+                print("Some CodeBERT tokenizer files not found, using RoBERTa tokenizer files (compatible with CodeBERT)")
+                tokenizer_source = self.fallback_tokenizer_model
+                tokenizer_metadata = self.fetch_file_metadata(tokenizer_source)
+
+            for file in tokenizer_files:
+                if file not in tokenizer_metadata:
+                    print(f"Warning: {file} not found in {tokenizer_source}")
+                    continue
+                downloads.append((f"{self.hub_url}/{tokenizer_source}/resolve/main/{file}",
+                                  self.install_dir / file, tokenizer_metadata[file]))
             
-            print(f"Will download the following files: {list(tokenizer_map.keys())}")
-            
-            
-            for file, url in tokenizer_map.items():
+            # Download model.onnx if the repository has it, otherwise PyTorch weights to convert
+            has_onnx = 'model.onnx' in metadata
+            weights = 'model.onnx' if has_onnx else 'pytorch_model.bin'
+            if not has_onnx:
+                print("ONNX model not directly available. Downloading PyTorch model...")
+            downloads.append((f"{self.huggingface_url}/resolve/main/{weights}",
+                              self.install_dir / weights, metadata.get(weights)))
+
+            self.download_files(downloads)
+
+            # Move everything into the content-addressed store; the Hub hashes were verified already
+            entries = {}
+            for _, filepath, meta in downloads:
+                entries[filepath.name] = self.store.add(self.install_dir, filepath.name, sha256=(meta or {}).get('sha256'))
+
+            if has_onnx:
+                # Expose the same blob in the onnx directory instead of copying it
+                self.store.link(self.install_dir, 'onnx/model.onnx', entries['model.onnx']['sha256'])
+            else:
+                # Convert the pickle weights once so the service can mmap them
                 try:
-                    # First check if the file exists at the URL
-                    head_response = requests.head(url)
-                    if head_response.status_code != 200:
-                        print(f"Warning: {file} not found at {url} (status: {head_response.status_code})")
-                        continue
-                        
-                    self.download_file(url, self.install_dir / file)
+                    print("Converting PyTorch weights to safetensors...")
+                    convert_to_safetensors(self.store, self.install_dir)
                 except Exception as e:
-                    print(f"Error downloading {file}: {e}")
-                    return False
-            
-            # Download model.onnx file (this is the largest file)
-            # Check if it's available directly or need to convert
-            model_url = f"{self.huggingface_url}/resolve/main/model.onnx"
-            onnx_response = requests.head(model_url)
-            
-            if onnx_response.status_code == 200:
-                # Direct ONNX file available
-                self.download_file(model_url, self.install_dir / 'model.onnx')
-                # Also save to onnx directory
-                shutil.copy(self.install_dir / 'model.onnx', self.install_dir / 'onnx' / 'model.onnx')
-            else:
-                # Need to download PyTorch model and convert to ONNX
-                print("ONNX model not directly available. Downloading PyTorch model...")
-                model_bin_url = f"{self.huggingface_url}/resolve/main/pytorch_model.bin"
-                self.download_file(model_bin_url, self.install_dir / 'pytorch_model.bin')
-                
+                    print(f"Warning: Could not convert weights to safetensors, keeping pytorch_model.bin: {e}")
+
                 # Now convert the PyTorch model to ONNX format
                 print("Converting PyTorch model to ONNX format...")
-                self.convert_pytorch_to_onnx()
-                
-                print("ONNX model conversion completed successfully!")
-                print(f"ONNX model saved to: {self.install_dir / 'onnx' / 'model.onnx'}")
-                
-                # Make sure the onnx directory exists
-                os.makedirs(self.install_dir / 'onnx', exist_ok=True)
+                if self.convert_pytorch_to_onnx():
+                    self.store.add(self.install_dir, 'onnx/model.onnx')
+                    print("ONNX model conversion completed successfully!")
+                    print(f"ONNX model saved to: {self.install_dir / 'onnx' / 'model.onnx'}")
             
             print("CodeBERT model files downloaded successfully!")
             return True
@@ -282,7 +465,11 @@ class CodeBERTDownloader:
 
 def main():
     """Main function"""
-    downloader = CodeBERTDownloader()
+    args = parse_args()
+    if not args.skip_dependencies:
+        install_dependencies(args)
+
+    downloader = CodeBERTDownloader(max_workers=args.max_workers)
     success = downloader.setup()
     
     if success:
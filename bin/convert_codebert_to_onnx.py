@@ -4,14 +4,72 @@ CodeBERT to ONNX Converter
 
 This script converts the CodeBERT PyTorch model to ONNX format.
 It requires torch, transformers, and onnx packages to be installed.
+
+Besides the plain fp32 export it can build a set of deployable variants
+(graph-optimized fp32, dynamically quantized int8 and fp16) and writes a
+manifest.json next to them recording opset, size, SHA-256 hash, latency and
+cosine parity against PyTorch, and names the fastest variant that still
+matches the reference model as 'recommended'. Nothing in CLOI loads the
+variants yet (the service runs PyTorch), so the manifest is for inspection
+and for deployments that pick a file themselves. All variants keep dynamic
+batch and sequence axes: there are no static-shape bucket exports, because
+onnxruntime's CPU provider runs the dynamic graph without re-planning per
+shape and a file per bucket would multiply the artifacts to download.
+
+With --pooled the masked mean pooling and L2 normalization are exported as
+part of the graph, which then outputs a batch x 768 `sentence_embedding`
+instead of the full `last_hidden_state`.
 """
 
 import os
 import sys
+import json
+import time
+import hashlib
 import argparse
 from pathlib import Path
 
-def convert_to_onnx(model_dir, output_file):
+DEFAULT_OPSET = 12
+
+# File names follow the transformers.js conventions for onnx/ subfolders
+VARIANT_FILES = {
+    'fp32': 'model.onnx',
+    'optimized': 'model_optimized.onnx',
+    'int8': 'model_quantized.onnx',
+    'fp16': 'model_fp16.onnx'
+}
+
+# Fixed sample set used for latency and parity measurements
+PARITY_SAMPLES = [
+    "def hello_world(): print('Hello, World!')",
+    "function add(a, b) { return a + b; }",
+    "for (let i = 0; i < items.length; i++) { total += items[i].price; }",
+    "class Stack:\n    def __init__(self):\n        self.items = []\n\n    def push(self, item):\n        self.items.append(item)",
+    "SELECT name, COUNT(*) FROM users GROUP BY name HAVING COUNT(*) > 1;",
+    "try {\n  const data = JSON.parse(raw);\n} catch (error) {\n  console.error(error.message);\n}",
+    "public int fibonacci(int n) { return n <= 1 ? n : fibonacci(n - 1) + fibonacci(n - 2); }",
+    "TypeError: Cannot read properties of undefined (reading 'map')"
+]
+
+def build_pooled_encoder(model):
+    """Wrap a transformers encoder so that its forward pass returns pooled, normalized embeddings"""
+    import torch
+
+    class PooledEncoder(torch.nn.Module):
+        def __init__(self, encoder):
+            super().__init__()
+            self.encoder = encoder
+
+        def forward(self, input_ids, attention_mask):
+            last_hidden_state = self.encoder(input_ids=input_ids, attention_mask=attention_mask).last_hidden_state
+            mask = attention_mask.unsqueeze(-1).to(last_hidden_state.dtype)
+            summed = (last_hidden_state * mask).sum(dim=1)
+            pooled = summed / torch.clamp(mask.sum(dim=1), min=1e-9)
+            return torch.nn.functional.normalize(pooled, p=2, dim=1)
+
+    return PooledEncoder(model).eval()
+
+def convert_to_onnx(model_dir, output_file, opset_version=DEFAULT_OPSET, pooled=False):
     """Convert CodeBERT PyTorch model to ONNX format"""
     try:
         import torch
@@ -34,6 +92,15 @@ def convert_to_onnx(model_dir, output_file):
         sample_text = "def hello_world(): print('Hello, World!')"
         inputs = tokenizer(sample_text, return_tensors="pt")
         
+        # Optionally fold pooling and normalization into the exported graph
+        if pooled:
+            model = build_pooled_encoder(model)
+            output_name = 'sentence_embedding'
+            output_axes = {0: 'batch'}
+        else:
+            output_name = 'last_hidden_state'
+            output_axes = {0: 'batch', 1: 'sequence'}
+
         # Export to ONNX
         print(f"Converting model to ONNX format at {output_file}")
         with torch.no_grad():
@@ -42,13 +109,13 @@ def convert_to_onnx(model_dir, output_file):
                 (inputs.input_ids, inputs.attention_mask),  # Model inputs
                 output_file,                                # Output file
                 input_names=['input_ids', 'attention_mask'],# Input names
-                output_names=['last_hidden_state'],         # Output names
+                output_names=[output_name],                 # Output names
                 dynamic_axes={                              # Dynamic axes
                     'input_ids': {0: 'batch', 1: 'sequence'},
                     'attention_mask': {0: 'batch', 1: 'sequence'},
-                    'last_hidden_state': {0: 'batch', 1: 'sequence'}
+                    output_name: output_axes
                 },
-                opset_version=12                           # ONNX opset version
+                opset_version=opset_version                 # ONNX opset version
             )
         
         # Verify the ONNX model
@@ -67,24 +134,252 @@ def convert_to_onnx(model_dir, output_file):
         print(f"Error converting model to ONNX: {e}")
         return False
 
+def optimize_onnx(input_file, output_file, num_heads=12, hidden_size=768):
+    """Run the onnxruntime transformer optimizer (fused attention, layer norm and GELU)"""
+    from onnxruntime.transformers.optimizer import optimize_model
+
+    # CodeBERT is a RoBERTa encoder, which the BERT fusion patterns cover
+    optimized = optimize_model(
+        str(input_file),
+        model_type='bert',
+        num_heads=num_heads,
+        hidden_size=hidden_size
+    )
+    optimized.save_model_to_file(str(output_file))
+    print(f"Fused operators: {optimized.get_fused_operator_statistics()}")
+    return optimized
+
+def quantize_int8(input_file, output_file):
+    """Dynamically quantize the weights of an ONNX model to int8"""
+    from onnxruntime.quantization import quantize_dynamic, QuantType
+
+    quantize_dynamic(str(input_file), str(output_file), weight_type=QuantType.QInt8)
+
+def convert_fp16(input_file, output_file, num_heads=12, hidden_size=768):
+    """Convert an ONNX model to fp16 while keeping fp32 inputs and outputs"""
+    from onnxruntime.transformers.optimizer import optimize_model
+
+    model = optimize_model(
+        str(input_file),
+        model_type='bert',
+        num_heads=num_heads,
+        hidden_size=hidden_size
+    )
+    model.convert_float_to_float16(keep_io_types=True)
+    model.save_model_to_file(str(output_file))
+
+def sha256_file(path, chunk_size=1024 * 1024):
+    """Compute the SHA-256 hex digest of a file"""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def mean_pool(last_hidden_state, attention_mask):
+    """Masked mean pooling followed by L2 normalization (numpy arrays)"""
+    import numpy as np
+
+    mask = attention_mask[..., None].astype(np.float32)
+    summed = (last_hidden_state.astype(np.float32) * mask).sum(axis=1)
+    pooled = summed / np.clip(mask.sum(axis=1), 1e-9, None)
+    norms = np.linalg.norm(pooled, axis=1, keepdims=True)
+    return pooled / np.clip(norms, 1e-12, None)
+
+def reference_embeddings(model, tokenizer, samples):
+    """Compute pooled PyTorch embeddings for the parity sample set"""
+    import torch
+
+    inputs = tokenizer(samples, return_tensors="pt", padding=True, truncation=True, max_length=512)
+    with torch.no_grad():
+        outputs = model(**inputs)
+    return mean_pool(outputs.last_hidden_state.numpy(), inputs.attention_mask.numpy())
+
+def evaluate_variant(onnx_file, tokenizer, samples, reference, runs=5):
+    """Measure latency and cosine parity of an ONNX variant against the PyTorch reference"""
+    import numpy as np
+    import onnxruntime as ort
+
+    session = ort.InferenceSession(str(onnx_file), providers=['CPUExecutionProvider'])
+    inputs = tokenizer(samples, return_tensors="np", padding=True, truncation=True, max_length=512)
+    feed = {
+        'input_ids': inputs['input_ids'].astype(np.int64),
+        'attention_mask': inputs['attention_mask'].astype(np.int64)
+    }
+
+    # Warm-up run so that session initialization is not counted
+    outputs = session.run(None, feed)
+    timings = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        outputs = session.run(None, feed)
+        timings.append((time.perf_counter() - start) * 1000)
+
+    # Pooled exports already return normalized sentence embeddings
+    if outputs[0].ndim == 2:
+        pooled = outputs[0] / np.clip(np.linalg.norm(outputs[0], axis=1, keepdims=True), 1e-12, None)
+    else:
+        pooled = mean_pool(outputs[0], feed['attention_mask'])
+    cosine = (pooled * reference).sum(axis=1)
+    timings.sort()
+    return {
+        'latency_ms': {
+            'median': round(timings[len(timings) // 2], 3),
+            'min': round(timings[0], 3),
+            'batch_size': len(samples)
+        },
+        'parity': {
+            'cosine_min': round(float(cosine.min()), 6),
+            'cosine_mean': round(float(cosine.mean()), 6)
+        }
+    }
+
+def pick_variant(manifest):
+    """Return the manifest entry of the fastest variant that passed parity, if any"""
+    passing = [
+        entry for entry in manifest.get('variants', {}).values()
+        if entry.get('parity', {}).get('passed')
+    ]
+    if not passing:
+        return None
+    return min(passing, key=lambda entry: entry['latency_ms']['median'])
+
+def build_variants(model_dir, output_dir, variants, opset_version=DEFAULT_OPSET,
+                   parity_threshold=0.99, skip_parity=False, pooled=False):
+    """Export, optimize and quantize the model, then write manifest.json"""
+    output_dir = Path(output_dir)
+    os.makedirs(output_dir, exist_ok=True)
+    base_file = output_dir / VARIANT_FILES['fp32']
+
+    if not convert_to_onnx(model_dir, str(base_file), opset_version, pooled):
+        return None
+
+    try:
+        from transformers import AutoConfig
+        config = AutoConfig.from_pretrained(model_dir, local_files_only=True)
+        num_heads, hidden_size = config.num_attention_heads, config.hidden_size
+    except Exception:
+        num_heads, hidden_size = 12, 768
+
+    builders = {
+        'optimized': lambda path: optimize_onnx(base_file, path, num_heads, hidden_size),
+        'int8': lambda path: quantize_int8(base_file, path),
+        'fp16': lambda path: convert_fp16(base_file, path, num_heads, hidden_size)
+    }
+
+    built = {'fp32': base_file}
+    for variant in variants:
+        if variant == 'fp32':
+            continue
+        target = output_dir / VARIANT_FILES[variant]
+        print(f"Building {variant} variant at {target}")
+        try:
+            builders[variant](target)
+            built[variant] = target
+        except ImportError:
+            print(f"Warning: onnxruntime is required for the {variant} variant (pip install onnxruntime)")
+        except Exception as e:
+            print(f"Warning: Failed to build {variant} variant: {e}")
+
+    reference = None
+    tokenizer = None
+    if not skip_parity:
+        try:
+            from transformers import AutoModel, AutoTokenizer
+            tokenizer = AutoTokenizer.from_pretrained(model_dir, local_files_only=True)
+            model = AutoModel.from_pretrained(model_dir, local_files_only=True)
+            model.eval()
+            reference = reference_embeddings(model, tokenizer, PARITY_SAMPLES)
+        except Exception as e:
+            print(f"Warning: Could not compute PyTorch reference embeddings: {e}")
+
+    manifest = {
+        'model_dir': str(model_dir),
+        'opset': opset_version,
+        'output': 'sentence_embedding' if pooled else 'last_hidden_state',
+        'pooling': 'mean+l2' if pooled else None,
+        'parity_threshold': parity_threshold,
+        'samples': len(PARITY_SAMPLES),
+        'variants': {}
+    }
+
+    for variant, path in built.items():
+        entry = {
+            'variant': variant,
+            'file': path.name,
+            'size_bytes': path.stat().st_size,
+            'sha256': sha256_file(path)
+        }
+        if reference is not None:
+            try:
+                entry.update(evaluate_variant(path, tokenizer, PARITY_SAMPLES, reference))
+                entry['parity']['passed'] = entry['parity']['cosine_min'] >= parity_threshold
+                print(f"{variant}: median {entry['latency_ms']['median']} ms, "
+                      f"min cosine {entry['parity']['cosine_min']}")
+            except Exception as e:
+                print(f"Warning: Could not evaluate {variant} variant: {e}")
+        manifest['variants'][variant] = entry
+
+    recommended = pick_variant(manifest)
+    manifest['recommended'] = recommended['variant'] if recommended else None
+
+    with open(output_dir / 'manifest.json', 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, indent=2)
+    print(f"Wrote variant manifest to {output_dir / 'manifest.json'}")
+    return manifest
+
 def main():
     # Parse command line arguments
     parser = argparse.ArgumentParser(description='Convert CodeBERT PyTorch model to ONNX format')
     parser.add_argument('--model-dir', type=str, help='Directory containing the PyTorch model')
     parser.add_argument('--output-file', type=str, help='Path to save the ONNX model')
+    parser.add_argument('--output-dir', type=str, help='Directory for --variants and their manifest (default: <model-dir>/onnx)')
+    parser.add_argument('--opset', type=int, default=DEFAULT_OPSET, help='ONNX opset version')
+    parser.add_argument('--variants', type=str,
+                        help=f"Comma-separated variants to build ({', '.join(VARIANT_FILES)}) and record in manifest.json")
+    parser.add_argument('--parity-threshold', type=float, default=0.99,
+                        help='Minimum cosine similarity to PyTorch for a variant to pass parity')
+    parser.add_argument('--skip-parity', action='store_true', help='Skip latency and parity measurements')
+    parser.add_argument('--pooled', action='store_true',
+                        help='Export masked mean pooling and L2 normalization as part of the graph (sentence_embedding output)')
     args = parser.parse_args()
     
     # Use default paths if not specified
     home_dir = Path.home()
     model_dir = args.model_dir or str(home_dir / '.cloi' / 'models' / 'codebert-base')
-    output_dir = Path(model_dir) / 'onnx'
+    if args.variants and args.output_file:
+        parser.error('--output-file names a single model; use --output-dir with --variants')
+    if args.output_dir and not args.variants:
+        parser.error('--output-dir is only used with --variants; use --output-file for a single model')
+    if args.output_file:
+        output_dir = Path(args.output_file).parent
+    else:
+        output_dir = Path(args.output_dir) if args.output_dir else Path(model_dir) / 'onnx'
     output_file = args.output_file or str(output_dir / 'model.onnx')
     
     # Create output directory if it doesn't exist
     os.makedirs(output_dir, exist_ok=True)
     
+    if args.variants:
+        variants = [v.strip() for v in args.variants.split(',') if v.strip()]
+        unknown = [v for v in variants if v not in VARIANT_FILES]
+        if unknown:
+            parser.error(f"Unknown variants: {', '.join(unknown)}")
+
+        manifest = build_variants(model_dir, output_dir, variants, args.opset,
+                                  args.parity_threshold, args.skip_parity, args.pooled)
+        if manifest is None:
+            print("\nConversion failed.")
+            sys.exit(1)
+
+        print("\nConversion successful!")
+        print(f"Variants: {', '.join(manifest['variants'])}")
+        if manifest['recommended']:
+            print(f"Recommended variant: {manifest['recommended']}")
+        sys.exit(0)
+
     # Convert the model
-    success = convert_to_onnx(model_dir, output_file)
+    success = convert_to_onnx(model_dir, output_file, args.opset, args.pooled)
     
     if success:
         print("\nConversion successful!")
@@ -0,0 +1,205 @@
+#!/usr/bin/env python3
+"""
+Duplicate and Near-Duplicate Chunk Detection
+
+Generated, vendored and copy-pasted code, plus overlapping chunk windows,
+make many chunks identical or nearly so. This module groups chunks before
+embedding so only one representative per group runs through the model and
+the others share its embedding:
+
+- exact duplicates are found by hashing the token ids,
+- near duplicates by MinHash signatures over token shingles, bucketed with
+  banded locality-sensitive hashing, and confirmed when the estimated
+  Jaccard similarity reaches the configured threshold.
+
+Token ids come from the tokenizer (or straight from token_cache.py), so
+whitespace-only differences that tokenize identically count as exact.
+"""
+
+import sys
+import json
+import hashlib
+import argparse
+
+import numpy as np
+
+DEFAULT_THRESHOLD = 0.9
+SHINGLE_SIZE = 5
+NUM_PERM = 64
+
+# Universal hashing modulo a Mersenne prime keeps products inside uint64
+MERSENNE_PRIME = np.uint64((1 << 31) - 1)
+
+UNIQUE = 0
+EXACT = 1
+NEAR = 2
+KIND_NAMES = {UNIQUE: 'unique', EXACT: 'exact', NEAR: 'near'}
+
+def choose_bands(num_perm, threshold):
+    """Pick (bands, rows) with bands * rows == num_perm whose LSH threshold (1/b)^(1/r) is closest to threshold"""
+    options = [(b, num_perm // b) for b in range(1, num_perm + 1) if num_perm % b == 0]
+    return min(options, key=lambda option: abs((1 / option[0]) ** (1 / option[1]) - threshold))
+
+def shingle_hashes(ids, size=SHINGLE_SIZE):
+    """Hash each window of `size` consecutive token ids to a value below the prime"""
+    ids = np.asarray(ids, dtype=np.uint64)
+    if len(ids) < size:
+        size = max(len(ids), 1)
+        if not len(ids):
+            return np.zeros(0, dtype=np.uint64)
+    windows = np.lib.stride_tricks.sliding_window_view(ids, size)
+    # Polynomial rolling combination, reduced modulo the prime at every step
+    hashes = np.zeros(len(windows), dtype=np.uint64)
+    for column in range(size):
+        hashes = (hashes * np.uint64(65599) + windows[:, column]) % MERSENNE_PRIME
+    return np.unique(hashes)
+
+class MinHasher:
+    """MinHash signatures of shingle sets under num_perm random universal hash functions"""
+
+    def __init__(self, num_perm=NUM_PERM, seed=0):
+        rng = np.random.default_rng(seed)
+        prime = int(MERSENNE_PRIME)
+        self.a = rng.integers(1, prime, size=num_perm, dtype=np.uint64)
+        self.b = rng.integers(0, prime, size=num_perm, dtype=np.uint64)
+        self.num_perm = num_perm
+
+    def signature(self, shingles):
+        """Minimum of each hash function over the shingles (all ones-bits for an empty set)"""
+        if not len(shingles):
+            return np.full(self.num_perm, np.iinfo(np.uint64).max, dtype=np.uint64)
+        hashed = (np.outer(shingles, self.a) + self.b) % MERSENNE_PRIME
+        return hashed.min(axis=0)
+
+class DedupPlan:
+    """Which chunks to embed, and which representative every other chunk copies"""
+
+    def __init__(self, source, kind, similarity, lengths, threshold):
+        self.source = source
+        self.kind = kind
+        self.similarity = similarity
+        self.lengths = lengths
+        self.threshold = threshold
+        self.representatives = np.flatnonzero(source == np.arange(len(source)))
+
+    def __len__(self):
+        return len(self.source)
+
+    def members(self):
+        """Map each representative to all chunk indices (itself included) sharing its embedding"""
+        groups = {int(rep): [] for rep in self.representatives}
+        for index, rep in enumerate(self.source):
+            groups[int(rep)].append(index)
+        return groups
+
+    def expand(self, indices, rows, groups=None):
+        """Turn rows for representative indices into (all member indices, repeated rows)"""
+        groups = groups or self.members()
+        member_indices = []
+        repeats = []
+        for index in indices:
+            members = groups[int(index)]
+            member_indices.extend(members)
+            repeats.append(len(members))
+        return np.asarray(member_indices, dtype=np.int64), np.repeat(np.asarray(rows), repeats, axis=0)
+
+    def report(self):
+        """How many chunks and tokens were skipped, as a share of the work without dedup"""
+        total_tokens = int(self.lengths.sum())
+        embedded_tokens = int(self.lengths[self.representatives].sum())
+        return {
+            'chunks': len(self),
+            'embedded': len(self.representatives),
+            'exact_duplicates': int((self.kind == EXACT).sum()),
+            'near_duplicates': int((self.kind == NEAR).sum()),
+            'threshold': self.threshold,
+            'tokens_total': total_tokens,
+            'tokens_embedded': embedded_tokens,
+            'compute_saved': round(1 - embedded_tokens / total_tokens, 4) if total_tokens else 0.0
+        }
+
+def find_duplicates(token_ids, threshold=DEFAULT_THRESHOLD, shingle_size=SHINGLE_SIZE, num_perm=NUM_PERM, seed=0):
+    """
+    Group chunks by exact and near-duplicate token content
+
+    Args:
+        token_ids: Sequence of token id sequences, one per chunk
+        threshold: Minimum estimated Jaccard similarity of shingle sets for a near
+            duplicate; 1.0 or more disables near-duplicate detection
+        shingle_size: Tokens per shingle
+        num_perm: MinHash signature length
+
+    Chunks are visited in order and each one is attached to the first earlier
+    representative it duplicates, so representatives are always embedded themselves.
+    """
+    count = len(token_ids)
+    source = np.arange(count)
+    kind = np.zeros(count, dtype=np.int8)
+    similarity = np.ones(count, dtype=np.float32)
+    lengths = np.asarray([len(ids) for ids in token_ids], dtype=np.int64)
+
+    exact = {}
+    near = threshold < 1.0
+    if near:
+        hasher = MinHasher(num_perm, seed)
+        bands, rows = choose_bands(num_perm, threshold)
+        buckets = [{} for _ in range(bands)]
+        signatures = {}
+
+    for index, ids in enumerate(token_ids):
+        digest = hashlib.blake2b(np.asarray(ids, dtype=np.int64).tobytes(), digest_size=16).digest()
+        if digest in exact:
+            source[index] = exact[digest]
+            kind[index] = EXACT
+            continue
+        exact[digest] = index
+        if not near:
+            continue
+
+        signature = hasher.signature(shingle_hashes(ids, shingle_size))
+        keys = [signature[band * rows:(band + 1) * rows].tobytes() for band in range(bands)]
+        candidates = {candidate for band, key in enumerate(keys) for candidate in buckets[band].get(key, ())}
+        estimates = [(float(np.mean(signatures[c] == signature)), -c) for c in candidates]
+        best_similarity, best = max(estimates, default=(0.0, None))
+        if best is not None and best_similarity >= threshold:
+            best = -best
+            source[index] = best
+            kind[index] = NEAR
+            similarity[index] = best_similarity
+            continue
+
+        # A new representative: index it for later chunks
+        signatures[index] = signature
+        for band, key in enumerate(keys):
+            buckets[band].setdefault(key, []).append(index)
+
+    return DedupPlan(source, kind, similarity, lengths, threshold)
+
+def main():
+    parser = argparse.ArgumentParser(description='Report duplicate and near-duplicate chunks in a token cache')
+    parser.add_argument('--cache-dir', type=str, required=True, help='Token cache directory (see token_cache.py)')
+    parser.add_argument('--tokenizer', type=str, help='Path to tokenizer.json (default: installed CodeBERT tokenizer)')
+    parser.add_argument('--threshold', type=float, default=DEFAULT_THRESHOLD, help='Near-duplicate Jaccard threshold')
+    parser.add_argument('--groups', action='store_true', help='Also print the duplicate groups as JSON lines')
+    args = parser.parse_args()
+
+    from token_cache import TokenCache
+    cache = TokenCache(args.cache_dir, args.tokenizer)
+    if not cache.is_valid():
+        print("Token cache is missing or was built with a different tokenizer", file=sys.stderr)
+        return 1
+
+    plan = find_duplicates([cache.ids(i) for i in range(len(cache))], args.threshold)
+    report = plan.report()
+    print(f"{report['chunks']} chunks: {report['exact_duplicates']} exact and {report['near_duplicates']} near "
+          f"duplicates, {report['embedded']} to embed ({report['compute_saved']:.1%} of tokens saved)")
+    if args.groups:
+        records = cache.chunks()
+        for rep, members in plan.members().items():
+            if len(members) > 1:
+                print(json.dumps({'representative': records[rep].get('id', rep),
+                                  'duplicates': [records[i].get('id', i) for i in members if i != rep]}))
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
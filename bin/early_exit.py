@@ -0,0 +1,270 @@
+#!/usr/bin/env python3
+"""
+Layer-Truncated Early-Exit Encoding
+
+Interactive "find similar code" queries do not always need all 12 CodeBERT
+layers. This script runs only the first N encoder layers of the same model
+and mean-pools that layer's hidden states. An optional linear alignment,
+fitted offline by ridge regression from truncated to full-depth embeddings
+of the same chunks, maps truncated vectors into the full-depth space so
+they can be searched against an index built at full depth.
+
+Usage:
+    # Fit alignments for layers 6 and 8 from this repository's code
+    python bin/early_exit.py fit --layers 6 8 --source .
+
+    # Report latency and retrieval agreement with full depth per mode
+    python bin/early_exit.py benchmark --layers 4 6 8 --source . --output early_exit.json
+
+Alignments are stored as early_exit/layer-<N>.npz in the model directory,
+where codebert_service.py picks them up for /embed requests with `layers`.
+"""
+
+import os
+import sys
+import json
+import time
+import argparse
+from pathlib import Path
+from functools import lru_cache
+
+import numpy as np
+
+ALIGNMENT_DIR = 'early_exit'
+SOURCE_EXTENSIONS = ('.py', '.js', '.ts', '.cjs', '.mjs', '.sh')
+WINDOW_LINES = 40
+
+def alignment_path(model_dir, layers):
+    """Where the alignment for a truncation depth is stored"""
+    return Path(model_dir) / ALIGNMENT_DIR / f'layer-{layers}.npz'
+
+@lru_cache(maxsize=16)
+def _read_alignment(path, mtime_ns):
+    """Read an alignment file; keyed on its mtime so a refit replaces the cached arrays"""
+    data = np.load(path)
+    return data['weight'].astype(np.float32), data['bias'].astype(np.float32)
+
+def load_alignment(model_dir, layers):
+    """Load (weight, bias) for a truncation depth, or None if none was fitted"""
+    path = alignment_path(model_dir, layers)
+    try:
+        mtime_ns = path.stat().st_mtime_ns
+    except FileNotFoundError:
+        return None
+    return _read_alignment(str(path), mtime_ns)
+
+def save_alignment(model_dir, layers, weight, bias, metrics):
+    """Save a fitted alignment next to the model weights"""
+    path = alignment_path(model_dir, layers)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    np.savez(path, weight=weight.astype(np.float32), bias=bias.astype(np.float32),
+             metrics=json.dumps(metrics))
+    _read_alignment.cache_clear()
+    return path
+
+def encode_truncated(model, input_ids, attention_mask, layers):
+    """
+    Run the embeddings and only the first `layers` encoder layers of a BERT-style model
+
+    Returns the hidden states of that layer; the remaining layers are never computed.
+    """
+    hidden = model.embeddings(input_ids=input_ids)
+    extended_mask = model.get_extended_attention_mask(attention_mask, input_ids.shape)
+    for layer in model.encoder.layer[:layers]:
+        hidden = layer(hidden, attention_mask=extended_mask)[0]
+    return hidden
+
+def mean_pool(hidden, attention_mask):
+    """Masked mean over tokens, L2-normalized, as float32 numpy rows"""
+    import torch
+    mask = attention_mask.unsqueeze(-1).to(hidden.dtype)
+    pooled = (hidden * mask).sum(dim=1) / torch.clamp(mask.sum(dim=1), min=1e-9)
+    return torch.nn.functional.normalize(pooled, p=2, dim=1).numpy().astype(np.float32)
+
+def apply_alignment(rows, alignment):
+    """Map truncated embeddings into the full-depth space and re-normalize"""
+    if alignment is None:
+        return rows
+    weight, bias = alignment
+    mapped = rows @ weight + bias
+    norms = np.linalg.norm(mapped, axis=1, keepdims=True)
+    return (mapped / np.maximum(norms, 1e-9)).astype(np.float32)
+
+def fit_alignment(truncated, full, ridge=1e-2):
+    """Ridge least-squares fit of full ~ truncated @ weight + bias"""
+    x_mean = truncated.mean(axis=0)
+    y_mean = full.mean(axis=0)
+    x = truncated - x_mean
+    y = full - y_mean
+    gram = x.T @ x + ridge * np.eye(x.shape[1], dtype=x.dtype)
+    weight = np.linalg.solve(gram, x.T @ y)
+    bias = y_mean - x_mean @ weight
+    return weight, bias
+
+def read_source_chunks(root, window=WINDOW_LINES, limit=None):
+    """Split source files under root into fixed line windows, skipping dependencies and VCS data"""
+    chunks = []
+    root = Path(root)
+    for dirpath, dirnames, filenames in os.walk(root):
+        dirnames[:] = sorted(d for d in dirnames if not d.startswith('.') and d != 'node_modules')
+        for filename in sorted(filenames):
+            if not filename.endswith(SOURCE_EXTENSIONS):
+                continue
+            path = Path(dirpath) / filename
+            try:
+                lines = path.read_text(encoding='utf-8').split('\n')
+            except (OSError, UnicodeDecodeError):
+                continue
+            for start in range(0, len(lines), window):
+                content = '\n'.join(lines[start:start + window]).strip()
+                if len(content) > 40:
+                    chunks.append({'id': f'{path.relative_to(root)}:{start + 1}', 'content': content})
+                if limit and len(chunks) >= limit:
+                    return chunks
+    return chunks
+
+def embed_depths(model, tokenizer, texts, depths, batch_size=16, max_length=512):
+    """
+    Embed texts at several depths, tokenizing each batch once
+
+    Every depth gets its own forward pass truncated at that layer (depths past
+    the model's last layer run the full model). Returns ({depth: rows},
+    {depth: seconds}), so the timings are the real cost of each depth.
+    """
+    import torch
+
+    full_depth = model.config.num_hidden_layers
+    rows = {depth: [] for depth in depths}
+    seconds = {depth: 0.0 for depth in depths}
+    with torch.no_grad():
+        for start in range(0, len(texts), batch_size):
+            inputs = tokenizer(texts[start:start + batch_size], return_tensors='pt',
+                               padding=True, truncation=True, max_length=max_length)
+            for depth in depths:
+                began = time.perf_counter()
+                hidden = encode_truncated(model, inputs.input_ids, inputs.attention_mask, min(depth, full_depth))
+                rows[depth].append(mean_pool(hidden, inputs.attention_mask))
+                seconds[depth] += time.perf_counter() - began
+    return {depth: np.concatenate(parts) for depth, parts in rows.items()}, seconds
+
+def retrieval_agreement(index, reference_queries, queries, k=10):
+    """Mean top-k overlap between neighbours found with reference and candidate query vectors"""
+    k = min(k, len(index))
+    reference = np.argsort(-(reference_queries @ index.T), axis=1)[:, :k]
+    candidate = np.argsort(-(queries @ index.T), axis=1)[:, :k]
+    overlap = [len(set(a) & set(b)) / k for a, b in zip(reference, candidate)]
+    top1 = float(np.mean(reference[:, 0] == candidate[:, 0]))
+    return float(np.mean(overlap)), top1
+
+def load_model(model_dir):
+    """Load the model and tokenizer used by codebert_service.py"""
+    from transformers import AutoModel, AutoTokenizer
+    tokenizer = AutoTokenizer.from_pretrained(str(model_dir), local_files_only=True)
+    model = AutoModel.from_pretrained(str(model_dir), local_files_only=True)
+    model.eval()
+    return model, tokenizer
+
+def split_corpus(chunks, query_fraction, seed=0):
+    """Shuffle chunks into (index/training, held-out query) parts"""
+    order = np.random.default_rng(seed).permutation(len(chunks))
+    n_queries = max(1, int(len(chunks) * query_fraction))
+    return order[n_queries:], order[:n_queries]
+
+def collect_chunks(args):
+    """Chunks from --chunks (JSON lines) or windows over --source"""
+    if args.chunks:
+        from token_cache import read_chunks
+        chunks = read_chunks(args.chunks)
+    else:
+        chunks = read_source_chunks(args.source, limit=args.limit)
+    return chunks[:args.limit] if args.limit else chunks
+
+def run_fit(args):
+    model, tokenizer = load_model(args.model_dir)
+    chunks = collect_chunks(args)
+    full_depth = model.config.num_hidden_layers
+    depths = sorted(layers for layers in set(args.layers) if layers < full_depth)
+    if not depths:
+        print(f"Nothing to fit: the model has {full_depth} layers", file=sys.stderr)
+        return 1
+    print(f"Embedding {len(chunks)} chunks at layers {depths} and {full_depth}")
+    embeddings, _ = embed_depths(model, tokenizer, [c['content'] for c in chunks], depths + [full_depth],
+                                 args.batch_size)
+
+    train, held_out = split_corpus(chunks, args.holdout)
+    for layers in depths:
+        weight, bias = fit_alignment(embeddings[layers][train], embeddings[full_depth][train], args.ridge)
+        aligned = apply_alignment(embeddings[layers][held_out], (weight, bias))
+        metrics = {
+            'chunks': len(chunks),
+            'held_out': len(held_out),
+            'cosine_raw': float(np.mean(np.sum(embeddings[layers][held_out] * embeddings[full_depth][held_out], axis=1))),
+            'cosine_aligned': float(np.mean(np.sum(aligned * embeddings[full_depth][held_out], axis=1)))
+        }
+        path = save_alignment(args.model_dir, layers, weight, bias, metrics)
+        print(f"Layer {layers}: held-out cosine to full depth {metrics['cosine_raw']:.4f} raw, "
+              f"{metrics['cosine_aligned']:.4f} aligned -> {path}")
+    return 0
+
+def run_benchmark(args):
+    model, tokenizer = load_model(args.model_dir)
+    chunks = collect_chunks(args)
+    full_depth = model.config.num_hidden_layers
+    depths = sorted(set(min(layers, full_depth) for layers in args.layers) | {full_depth})
+    print(f"Embedding {len(chunks)} chunks at layers {depths}")
+    embeddings, seconds = embed_depths(model, tokenizer, [c['content'] for c in chunks], depths, args.batch_size)
+
+    index_ids, query_ids = split_corpus(chunks, args.holdout)
+    index = embeddings[full_depth][index_ids]
+    reference = embeddings[full_depth][query_ids]
+    results = []
+    for depth in depths:
+        modes = [('raw', embeddings[depth][query_ids])]
+        alignment = load_alignment(str(args.model_dir), depth) if depth < full_depth else None
+        if alignment is not None:
+            modes.append(('aligned', apply_alignment(embeddings[depth][query_ids], alignment)))
+        for mode, queries in modes:
+            overlap, top1 = retrieval_agreement(index, reference, queries, args.k)
+            results.append({
+                'layers': depth,
+                'mode': mode,
+                'ms_per_chunk': round(seconds[depth] / len(chunks) * 1000, 3),
+                'speedup': round(seconds[full_depth] / max(seconds[depth], 1e-9), 2),
+                f'overlap@{args.k}': round(overlap, 4),
+                'top1_agreement': round(top1, 4),
+                'cosine_to_full': round(float(np.mean(np.sum(queries * reference, axis=1))), 4)
+            })
+
+    print(f"{'layers':>6} {'mode':>8} {'ms/chunk':>9} {'speedup':>8} {'overlap@' + str(args.k):>11} {'top1':>6} {'cosine':>7}")
+    for row in results:
+        print(f"{row['layers']:>6} {row['mode']:>8} {row['ms_per_chunk']:>9.3f} {row['speedup']:>8.2f} "
+              f"{row[f'overlap@{args.k}']:>11.4f} {row['top1_agreement']:>6.4f} {row['cosine_to_full']:>7.4f}")
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump({'chunks': len(chunks), 'queries': len(query_ids), 'k': args.k, 'results': results}, f, indent=2)
+        print(f"Wrote {args.output}")
+    return 0
+
+def main():
+    parser = argparse.ArgumentParser(description='Fit and benchmark layer-truncated CodeBERT embeddings')
+    parser.add_argument('command', choices=['fit', 'benchmark'])
+    parser.add_argument('--layers', type=int, nargs='+', default=[6, 8], help='Truncation depths')
+    parser.add_argument('--model-dir', type=str,
+                        default=str(Path.home() / '.cloi' / 'models' / 'codebert-base'),
+                        help='Model directory (alignments are saved here)')
+    parser.add_argument('--source', type=str, default='.', help='Source tree to build the corpus from')
+    parser.add_argument('--chunks', type=str, help="JSON lines chunks to use instead of --source ('-' for stdin)")
+    parser.add_argument('--limit', type=int, default=2000, help='Maximum number of chunks')
+    parser.add_argument('--holdout', type=float, default=0.2, help='Fraction of chunks held out as queries')
+    parser.add_argument('--ridge', type=float, default=1e-2, help='Ridge regularization for the alignment fit')
+    parser.add_argument('--batch-size', type=int, default=16, help='Batch size for embedding')
+    parser.add_argument('-k', type=int, default=10, help='Neighbours compared for retrieval agreement')
+    parser.add_argument('--output', type=str, help='Write benchmark results as JSON')
+    args = parser.parse_args()
+
+    if any(layers < 1 for layers in args.layers):
+        parser.error('--layers must be positive')
+    return run_fit(args) if args.command == 'fit' else run_benchmark(args)
+
+if __name__ == "__main__":
+    sys.exit(main())
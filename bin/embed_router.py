@@ -0,0 +1,458 @@
+#!/usr/bin/env python3
+"""
+Embedding Service Router
+
+Fronts several codebert_service.py replicas, on this host or others, behind
+the single address clients already use (port 3090 and optionally the Unix
+socket), so embedding capacity grows by adding replicas without changing
+the Node client:
+
+- replicas are health-checked in the background through /health, which
+  also reports each replica's queue depth,
+- every request goes to the healthy replica with the shortest queue, taking
+  the larger of its reported depth and the requests this router has in
+  flight to it (the report may be a poll old),
+- /embed requests with many texts are split into contiguous shards that
+  run on several replicas at once and are reassembled in input order,
+- a replica that cannot be reached is marked down and its request or shard
+  is retried on another one; it rejoins after its next good health check.
+
+/warm is sent to every replica. Bulk jobs (/jobs) stay on the replica that
+created them; their shared-memory results are only readable on that
+replica's host. Job creation is only retried elsewhere when it cannot have
+reached the first replica, so a slow replica never ends up with a duplicate.
+
+Usage:
+    python bin/embed_router.py --replica http://127.0.0.1:3091 --replica http://127.0.0.1:3092
+    python bin/embed_router.py --replica http://gpu-a:3090 --replica http://gpu-b:3090 --socket
+"""
+
+import os
+import sys
+import json
+import time
+import random
+import socket
+import argparse
+import threading
+import socketserver
+from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+import requests
+from urllib3.exceptions import NewConnectionError
+
+DEFAULT_PORT = 3090
+DEFAULT_SOCKET = Path.home() / '.cloi' / 'run' / 'codebert.sock'
+HEALTH_INTERVAL = 2.0
+# Batches with fewer texts than this go to a single replica
+DEFAULT_SPLIT_MIN = 32
+# Statuses that mean "this replica cannot serve now", so another one should be tried
+RETRY_STATUSES = (502, 503, 504)
+
+class ReplicaUnavailable(Exception):
+    """No healthy replica could serve the request"""
+
+def never_sent(error):
+    """True if a request failed before reaching the replica (refused or connect timeout)"""
+    if isinstance(error, requests.ConnectTimeout):
+        return True
+    reason = getattr(error.args[0], 'reason', None) if error.args else None
+    return isinstance(error, requests.ConnectionError) and isinstance(reason, NewConnectionError)
+
+class Replica:
+    """One embedding service instance and what the router knows about its load"""
+
+    def __init__(self, url, index):
+        self.url = url.rstrip('/')
+        self.index = index
+        self.healthy = False
+        self.reported_queue = 0
+        self.in_flight = 0
+        self.requests = 0
+        self.failures = 0
+        self.last_error = None
+        self.last_check = None
+
+    def load(self):
+        """Queue estimate used for dispatch"""
+        return max(self.reported_queue, self.in_flight)
+
+    def describe(self):
+        return {
+            'url': self.url,
+            'healthy': self.healthy,
+            'queue_depth': self.reported_queue,
+            'in_flight': self.in_flight,
+            'requests': self.requests,
+            'failures': self.failures,
+            'last_error': self.last_error
+        }
+
+class Router:
+    """Replica set with health checks, least-queue selection and retrying request forwarding"""
+
+    def __init__(self, urls, health_interval=HEALTH_INTERVAL, split_min=DEFAULT_SPLIT_MIN, timeout=300):
+        """
+        Args:
+            urls: Base URLs of the replicas
+            health_interval: Seconds between health checks of each replica
+            split_min: Smallest /embed batch that is split across replicas
+            timeout: Seconds to wait for a replica's response
+        """
+        if not urls:
+            raise ValueError('At least one replica is required')
+        self.replicas = [Replica(url, index) for index, url in enumerate(urls)]
+        self.health_interval = health_interval
+        self.split_min = split_min
+        self.timeout = timeout
+        self.lock = threading.Lock()
+        self.executor = ThreadPoolExecutor(max_workers=max(4, 2 * len(self.replicas)))
+        # Health checks get their own workers so slow shard fan-out cannot stall them
+        self.health_executor = ThreadPoolExecutor(max_workers=len(self.replicas))
+        self._local = threading.local()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def _session(self):
+        # requests.Session is not thread-safe; keep one per handler thread for connection reuse
+        if not hasattr(self._local, 'session'):
+            self._local.session = requests.Session()
+        return self._local.session
+
+    def check(self, replica):
+        """Health-check one replica and record its reported queue depth"""
+        try:
+            response = self._session().get(f"{replica.url}/health", timeout=2)
+            body = response.json() if response.status_code == 200 else {}
+            healthy = response.status_code == 200
+        except (requests.RequestException, ValueError) as e:
+            healthy, body = False, {}
+            replica.last_error = str(e)
+        with self.lock:
+            replica.healthy = healthy
+            replica.reported_queue = body.get('queue_depth', 0) + body.get('jobs_running', 0)
+            replica.last_check = time.time()
+
+    def check_all(self):
+        list(self.health_executor.map(self.check, self.replicas))
+
+    def start(self):
+        """Check every replica once, then keep checking in a daemon thread"""
+        self.check_all()
+
+        def loop():
+            while not self._stop.wait(self.health_interval):
+                self.check_all()
+
+        self._thread = threading.Thread(target=loop, name='replica-health', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread:
+            self._thread.join()
+        self.executor.shutdown(wait=False)
+        self.health_executor.shutdown(wait=False)
+
+    def healthy(self):
+        with self.lock:
+            return [replica for replica in self.replicas if replica.healthy]
+
+    def acquire(self, exclude=()):
+        """Pick the healthy replica with the shortest queue (random among ties) and count the request on it"""
+        with self.lock:
+            candidates = [replica for replica in self.replicas if replica.healthy and replica not in exclude]
+            if not candidates:
+                raise ReplicaUnavailable('No healthy embedding service replica')
+            lowest = min(replica.load() for replica in candidates)
+            replica = random.choice([replica for replica in candidates if replica.load() == lowest])
+            replica.in_flight += 1
+            replica.requests += 1
+            return replica
+
+    def release(self, replica, error=None):
+        with self.lock:
+            replica.in_flight -= 1
+            if error is not None:
+                replica.failures += 1
+                replica.last_error = error
+                replica.healthy = False
+
+    def send(self, method, path, body=None, replica=None, idempotent=True):
+        """
+        Forward a request, retrying on other replicas while they fail
+
+        Returns (replica, status code, response body bytes). A specific replica
+        can be given for requests that must stay on it (bulk jobs); those are
+        not retried elsewhere. Requests that are not idempotent (job creation)
+        are only retried when they never reached the replica or it answered 503;
+        after a read timeout or a dropped connection the replica may have
+        accepted them, so the failure is returned instead of a duplicate.
+        """
+        tried = []
+        while True:
+            target = replica or self.acquire(exclude=tried)
+            if replica is not None:
+                with self.lock:
+                    target.in_flight += 1
+                    target.requests += 1
+            tried.append(target)
+            try:
+                response = self._session().request(
+                    method, f"{target.url}{path}", data=body,
+                    headers={'Content-Type': 'application/json'} if body else None, timeout=(2, self.timeout))
+            except requests.RequestException as e:
+                self.release(target, str(e))
+                if replica is not None or not (idempotent or never_sent(e)):
+                    raise ReplicaUnavailable(f'Replica {target.url} failed: {e}')
+                continue
+            retry = response.status_code in RETRY_STATUSES if idempotent else response.status_code == 503
+            if retry and replica is None:
+                self.release(target, f'HTTP {response.status_code}')
+                continue
+            self.release(target)
+            return target, response.status_code, response.content
+
+    def embed_sharded(self, data):
+        """
+        Split an /embed batch into contiguous shards across the healthy replicas
+
+        Returns (status code, response dict). Any shard that fails on one
+        replica is retried on another by send(); a shard answered with an
+        error status fails the whole request with that status.
+        """
+        texts = data['texts']
+        healthy = len(self.healthy())
+        if not healthy:
+            raise ReplicaUnavailable('No healthy embedding service replica')
+        shards = min(healthy, -(-len(texts) // max(self.split_min // 2, 1)))
+        size = -(-len(texts) // shards)
+        bounds = [(start, min(start + size, len(texts))) for start in range(0, len(texts), size)]
+
+        def run(bound):
+            shard = dict(data, texts=texts[bound[0]:bound[1]])
+            _, status, body = self.send('POST', '/embed', json.dumps(shard).encode())
+            return status, json.loads(body)
+
+        results = list(self.executor.map(run, bounds))
+        for status, body in results:
+            if status != 200:
+                return status, body
+        merged = {'embeddings': [row for _, body in results for row in body['embeddings']],
+                  'shards': len(bounds)}
+        for name in ('layers', 'aligned'):
+            if name in results[0][1]:
+                merged[name] = results[0][1][name]
+        if all('dedup' in body for _, body in results):
+            merged['dedup'] = merge_dedup_reports([body['dedup'] for _, body in results])
+        return 200, merged
+
+    def should_split(self, data):
+        texts = data.get('texts') if isinstance(data, dict) else None
+        return isinstance(texts, list) and len(texts) >= self.split_min and len(self.healthy()) > 1
+
+    def stats(self):
+        with self.lock:
+            replicas = [replica.describe() for replica in self.replicas]
+        healthy = sum(1 for replica in replicas if replica['healthy'])
+        return {
+            'status': 'ok' if healthy else 'unavailable',
+            'router': True,
+            'healthy_replicas': healthy,
+            'queue_depth': sum(replica['in_flight'] for replica in replicas),
+            'replicas': replicas
+        }
+
+def merge_dedup_reports(reports):
+    """Combine per-shard dedup reports (duplicates are only found within a shard)"""
+    merged = {name: sum(report[name] for report in reports)
+              for name in ('chunks', 'embedded', 'exact_duplicates', 'near_duplicates',
+                           'tokens_total', 'tokens_embedded')}
+    merged['threshold'] = reports[0]['threshold']
+    total = merged['tokens_total']
+    merged['compute_saved'] = round(1 - merged['tokens_embedded'] / total, 4) if total else 0.0
+    return merged
+
+class RouterHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    disable_nagle_algorithm = True
+
+    # Set by make_server()
+    router = None
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send_raw(self, status_code, body):
+        self.send_response(status_code)
+        self.send_header('Content-type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _send_response(self, status_code, content):
+        self._send_raw(status_code, json.dumps(content).encode())
+
+    def _read_body(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        return self.rfile.read(length) if length else None
+
+    def _job_target(self):
+        """Split /jobs/<replica>.<id> into the replica and the path it knows the job by"""
+        index, _, job_id = self.path[len('/jobs/'):].partition('.')
+        if not index.isdigit() or int(index) >= len(self.router.replicas) or not job_id:
+            return None, None
+        return self.router.replicas[int(index)], f'/jobs/{job_id}'
+
+    def _relay_job(self, replica, status, body):
+        """Prefix job ids with the replica index so later calls find the same replica"""
+        try:
+            content = json.loads(body)
+        except ValueError:
+            self._send_raw(status, body)
+            return
+        if isinstance(content, dict) and content.get('job_id'):
+            content['job_id'] = f"{replica.index}.{content['job_id']}"
+        self._send_response(status, content)
+
+    def _handle(self, method):
+        router = self.router
+        body = self._read_body() if method == 'POST' else None
+        try:
+            if method == 'GET' and self.path == '/health':
+                stats = router.stats()
+                self._send_response(200 if stats['healthy_replicas'] else 503, stats)
+            elif self.path.startswith('/jobs/'):
+                replica, path = self._job_target()
+                if replica is None:
+                    self._send_response(404, {'error': 'Unknown job'})
+                else:
+                    self._relay_job(replica, *router.send(method, path, body, replica=replica)[1:])
+            elif method == 'POST' and self.path == '/jobs':
+                self._relay_job(*router.send(method, self.path, body, idempotent=False))
+            elif method == 'POST' and self.path == '/warm':
+                self._handle_warm(body)
+            elif method == 'POST' and self.path == '/embed':
+                try:
+                    data = json.loads(body or b'{}')
+                except ValueError:
+                    self._send_response(400, {'error': 'Invalid JSON'})
+                    return
+                if router.should_split(data):
+                    self._send_response(*router.embed_sharded(data))
+                else:
+                    self._send_raw(*router.send(method, self.path, body)[1:])
+            elif self.path.startswith('/debug/'):
+                self._send_response(404, {'error': 'Profile replicas directly'})
+            else:
+                self._send_raw(*router.send(method, self.path, body)[1:])
+        except ReplicaUnavailable as e:
+            self._send_response(503, {'error': str(e)})
+
+    def _handle_warm(self, body):
+        """Warm every healthy replica; ready only when all of them are"""
+        results = list(router_map(self.router, lambda replica: self.router.send('POST', '/warm', body, replica)))
+        replicas = []
+        for replica, status, content in results:
+            try:
+                replicas.append(dict(json.loads(content), url=replica.url))
+            except ValueError:
+                replicas.append({'url': replica.url, 'status': 'error'})
+        ready = bool(replicas) and all(result.get('status') == 'ready' for result in replicas)
+        self._send_response(200 if ready else 202, {'status': 'ready' if ready else 'warming', 'replicas': replicas})
+
+    def do_GET(self):
+        self._handle('GET')
+
+    def do_POST(self):
+        self._handle('POST')
+
+    def do_DELETE(self):
+        self._handle('DELETE')
+
+def router_map(router, function):
+    """Apply function to every healthy replica concurrently, skipping the ones that fail"""
+    def attempt(replica):
+        try:
+            return function(replica)
+        except ReplicaUnavailable:
+            return None
+    return [result for result in router.executor.map(attempt, router.healthy()) if result is not None]
+
+class UnixRouterHandler(RouterHandler):
+    # TCP_NODELAY does not apply to Unix domain sockets
+    disable_nagle_algorithm = False
+
+class UnixHTTPServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    """Threaded HTTP server listening on a Unix domain socket"""
+    daemon_threads = True
+
+    def server_bind(self):
+        socketserver.UnixStreamServer.server_bind(self)
+        self.server_name = 'localhost'
+        self.server_port = 0
+
+def make_server(router, host='127.0.0.1', port=DEFAULT_PORT):
+    """TCP server for a router (not yet serving)"""
+    handler = type('BoundRouterHandler', (RouterHandler,), {'router': router})
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    return server
+
+def start_unix_server(router, path):
+    """Serve the router on a Unix domain socket in a background thread, replacing a stale socket file"""
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True, mode=0o700)
+    if path.exists() or path.is_socket():
+        # Remove a stale socket left behind by a previous process, unless one is still serving
+        probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            probe.connect(str(path))
+            raise RuntimeError(f"Another service is already listening on {path}")
+        except (ConnectionRefusedError, FileNotFoundError):
+            path.unlink()
+        finally:
+            probe.close()
+
+    handler = type('BoundUnixRouterHandler', (UnixRouterHandler,), {'router': router})
+    server = UnixHTTPServer(str(path), handler)
+    os.chmod(path, 0o600)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+def main():
+    parser = argparse.ArgumentParser(description='Route embedding requests across codebert_service.py replicas')
+    parser.add_argument('--replica', action='append', required=True, help='Replica base URL (repeatable)')
+    parser.add_argument('--host', type=str, default='127.0.0.1', help='Address to listen on')
+    parser.add_argument('--port', type=int, default=DEFAULT_PORT, help=f'Port to listen on (default: {DEFAULT_PORT})')
+    parser.add_argument('--socket', nargs='?', const=str(DEFAULT_SOCKET), default=None,
+                        help='Also listen on a Unix domain socket (default path: ~/.cloi/run/codebert.sock)')
+    parser.add_argument('--split-min', type=int, default=DEFAULT_SPLIT_MIN,
+                        help=f'Smallest batch split across replicas (default: {DEFAULT_SPLIT_MIN})')
+    parser.add_argument('--health-interval', type=float, default=HEALTH_INTERVAL, help='Seconds between health checks')
+    args = parser.parse_args()
+
+    router = Router(args.replica, args.health_interval, args.split_min)
+    router.start()
+    healthy = len(router.healthy())
+    print(f"{healthy} of {len(router.replicas)} replicas healthy")
+    server = make_server(router, args.host, args.port)
+    unix_server = start_unix_server(router, args.socket) if args.socket else None
+    print(f"Routing embedding requests on http://{args.host}:{args.port}"
+          + (f" and {args.socket}" if args.socket else ""))
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        router.stop()
+        if unix_server:
+            unix_server.server_close()
+            Path(args.socket).unlink(missing_ok=True)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
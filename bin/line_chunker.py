@@ -0,0 +1,103 @@
+"""
+Token-Bounded Line Windows
+
+Splits a file into windows of whole lines that each fit a token budget,
+the logic behind the embedding service's /chunk endpoint. It only needs an
+`encode(text)` callable returning token (start, end) character offsets, so
+it works with any fast tokenizer and can be tested without the model.
+
+Per-line token counts from one tokenization of the whole file are only an
+estimate: byte-level BPE merges a newline with the next line's indentation,
+and a window tokenized on its own can come out differently from the same
+span inside the file. Every window is therefore re-tokenized and shrunk
+until it fits, so the budget is never exceeded.
+"""
+
+import bisect
+
+def line_of_token(text, line_starts, start, end):
+    """Line a token belongs to: where its first non-whitespace character is (its last character if it is all whitespace)"""
+    position = start
+    while position < end and text[position].isspace():
+        position += 1
+    if position == end:
+        position = max(end - 1, start)
+    return bisect.bisect_right(line_starts, position) - 1
+
+def chunk_lines(text, budget, encode, overlap_lines=0):
+    """
+    Split text into line-aligned windows of at most budget tokens
+
+    Args:
+        text: Text to split
+        budget: Maximum tokens per window, excluding special tokens
+        encode: Callable returning the (start, end) offsets of the tokens of a
+            string, without special tokens
+        overlap_lines: Lines repeated at the start of the next window
+
+    Returns a list of dicts with startLine, endLine (0-based, inclusive),
+    tokens (the window's own token count) and content. A single line longer
+    than the budget is split at token boundaries into windows of its own.
+    """
+    if budget < 1:
+        raise ValueError('budget must be at least one token')
+    if overlap_lines < 0:
+        raise ValueError('overlap_lines must not be negative')
+
+    lines = text.split('\n')
+    line_starts = [0]
+    for line in lines[:-1]:
+        line_starts.append(line_starts[-1] + len(line) + 1)
+    line_ends = [start + len(line) for start, line in zip(line_starts, lines)]
+
+    line_tokens = [[] for _ in lines]
+    for start, end in encode(text):
+        line_tokens[line_of_token(text, line_starts, start, end)].append((start, end))
+
+    def count(start_char, end_char):
+        return len(encode(text[start_char:end_char]))
+
+    def window(first, last, start_char, end_char, tokens):
+        return {'startLine': first, 'endLine': last, 'tokens': tokens, 'content': text[start_char:end_char]}
+
+    chunks = []
+    first = 0
+    while first < len(lines):
+        # Grow the window from the estimates, then shrink it until it really fits
+        last = first
+        estimate = len(line_tokens[first])
+        while last + 1 < len(lines) and estimate + len(line_tokens[last + 1]) <= budget:
+            last += 1
+            estimate += len(line_tokens[last])
+        tokens = count(line_starts[first], line_ends[last])
+        while tokens > budget and last > first:
+            last -= 1
+            tokens = count(line_starts[first], line_ends[last])
+
+        if tokens > budget:
+            chunks.extend(split_line(text, line_starts[first], line_ends[first], first,
+                                     line_tokens[first], budget, count, window))
+        else:
+            chunks.append(window(first, last, line_starts[first], line_ends[last], tokens))
+
+        if last + 1 >= len(lines):
+            break
+        first = max(last + 1 - overlap_lines, first + 1)
+    return chunks
+
+def split_line(text, line_start, line_end, index, tokens, budget, count, window):
+    """Token-bounded slices of one line that is over budget on its own"""
+    bounds = sorted({min(max(start, line_start), line_end) for start, _ in tokens} | {line_end})
+    slices = []
+    position = 0
+    while position < len(bounds) - 1:
+        size = min(budget, len(bounds) - 1 - position)
+        while True:
+            start_char, end_char = bounds[position], bounds[position + size]
+            used = count(start_char, end_char)
+            if used <= budget or size == 1:
+                break
+            size -= 1
+        slices.append(window(index, index, start_char, end_char, used))
+        position += size
+    return slices
@@ -0,0 +1,417 @@
+#!/usr/bin/env python3
+"""
+LLM Serving Benchmark for Ollama Models
+
+Runs a fixed suite of CLOI-style prompts (error analysis, error type
+classification, command and patch generation, with the same sampling
+options CLOI uses for each) against one or more Ollama models at several
+concurrency levels, and records per model and level:
+
+- time to first token and total latency percentiles,
+- decode speed per request (eval_count / eval_duration from Ollama) and
+  aggregate tokens/sec across concurrent requests,
+- the model's memory footprint as reported by /api/ps,
+- optionally the cold-start time to first token, after unloading the model.
+
+Results are written as JSON so runs can be compared (--compare). Use
+stub_ollama.py to try the harness without a real Ollama.
+
+Usage:
+    python bin/llm_benchmark.py --model phi4 --model llama3.2:1b --concurrency 1,2,4
+    python bin/llm_benchmark.py --model phi4 --cold --compare ~/.cloi/bench/llm-20260101-120000.json
+"""
+
+import os
+import sys
+import json
+import time
+import argparse
+import threading
+from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+from ollama_setup import OllamaSetup, model_matches
+
+BENCH_DIR = Path(os.environ.get('CLOI_DATA_DIR', Path.home() / '.cloi')) / 'bench'
+
+# Sampling options CLOI uses per prompt type (src/core/executor/ollama.js)
+PROMPT_OPTIONS = {
+    'error_analysis': {'temperature': 0.3, 'num_predict': 512},
+    'error_determination': {'temperature': 0.1, 'num_predict': 32},
+    'command_generation': {'temperature': 0.1, 'num_predict': 256},
+    'patch_generation': {'temperature': 0.1, 'num_predict': 768},
+}
+
+ANALYSIS_TEMPLATE = """You are a debugging expert helping a colleague fix an error.
+
+ERROR OUTPUT:
+{error}
+
+FILE PATH:
+{path}
+
+FILE CONTENT (lines {start}-{end}):
+{code}
+
+Break this down into two parts:
+1. What went wrong - the file, the line and what is broken.
+2. Proposed Fix - the exact change to make, with code if needed.
+Write plainly, without markdown."""
+
+CLASSIFY_TEMPLATE = """You are a binary classifier. Classify if a fix requires code changes or terminal commands.
+
+ANALYSIS:
+{analysis}
+
+Output ONLY ONE of these exact phrases: TERMINAL_COMMAND_ERROR or CODE_FILE_ISSUE"""
+
+COMMAND_TEMPLATE = """The following command failed:
+
+{error}
+
+Reply with the single terminal command that fixes it, and nothing else."""
+
+PATCH_TEMPLATE = """Write a unified diff that fixes this error.
+
+ERROR OUTPUT:
+{error}
+
+FILE PATH:
+{path}
+
+FILE CONTENT (lines {start}-{end}):
+{code}
+
+Output only the diff."""
+
+PY_ERROR = """Traceback (most recent call last):
+  File "app/main.py", line 23, in <module>
+    print(get_user(42).email)
+AttributeError: 'NoneType' object has no attribute 'email'"""
+
+PY_CODE = """18 def get_user(user_id):
+19     rows = db.query("SELECT * FROM users WHERE id = ?", user_id)
+20     return rows[0] if rows else None
+21
+22 if __name__ == "__main__":
+23     print(get_user(42).email)"""
+
+JS_ERROR = """file:///srv/api/routes.js:14
+    const total = items.reduce((sum, item) => sum + item.price, 0);
+                        ^
+TypeError: Cannot read properties of undefined (reading 'reduce')
+    at getTotal (file:///srv/api/routes.js:14:25)"""
+
+JS_CODE = """10 export function getTotal(order) {
+11   const items = order.lineItems;
+12   // lineItems is optional for draft orders
+13
+14   const total = items.reduce((sum, item) => sum + item.price, 0);
+15   return total;
+16 }"""
+
+NPM_ERROR = """$ npm test
+> api@1.0.0 test
+> jest
+sh: 1: jest: not found
+npm ERR! code 127"""
+
+PIP_ERROR = """$ python train.py
+Traceback (most recent call last):
+  File "train.py", line 1, in <module>
+    import numpy as np
+ModuleNotFoundError: No module named 'numpy'"""
+
+# The fixed suite: (name, prompt type, prompt)
+SUITE = [
+    ('analyze_python_none', 'error_analysis',
+     ANALYSIS_TEMPLATE.format(error=PY_ERROR, path='app/main.py', start=18, end=23, code=PY_CODE)),
+    ('analyze_js_undefined', 'error_analysis',
+     ANALYSIS_TEMPLATE.format(error=JS_ERROR, path='api/routes.js', start=10, end=16, code=JS_CODE)),
+    ('classify_code_issue', 'error_determination',
+     CLASSIFY_TEMPLATE.format(analysis="1. What went wrong\nroutes.js line 14: order.lineItems is undefined for "
+                                       "draft orders.\n\n2. Proposed Fix\nDefault items to an empty array.")),
+    ('classify_missing_module', 'error_determination',
+     CLASSIFY_TEMPLATE.format(analysis="1. What went wrong\nnumpy is not installed.\n\n2. Proposed Fix\n"
+                                       "Run pip install numpy.")),
+    ('command_npm', 'command_generation', COMMAND_TEMPLATE.format(error=NPM_ERROR)),
+    ('command_pip', 'command_generation', COMMAND_TEMPLATE.format(error=PIP_ERROR)),
+    ('patch_python_none', 'patch_generation',
+     PATCH_TEMPLATE.format(error=PY_ERROR, path='app/main.py', start=18, end=23, code=PY_CODE)),
+]
+
+def percentiles(values):
+    """Mean, min, max and p50/p90/p99 (linear interpolation) of a list, or None if empty"""
+    if not values:
+        return None
+    ordered = sorted(values)
+
+    def at(q):
+        position = (len(ordered) - 1) * q
+        low = int(position)
+        high = min(low + 1, len(ordered) - 1)
+        return ordered[low] + (ordered[high] - ordered[low]) * (position - low)
+
+    return {
+        'mean': round(sum(ordered) / len(ordered), 4),
+        'min': round(ordered[0], 4),
+        'p50': round(at(0.5), 4),
+        'p90': round(at(0.9), 4),
+        'p99': round(at(0.99), 4),
+        'max': round(ordered[-1], 4),
+    }
+
+class LLMBenchmark:
+    """Runs the prompt suite against Ollama models at several concurrency levels"""
+
+    def __init__(self, setup, models, concurrency=(1, 2, 4), repeats=1, max_tokens=None, cold=False,
+                 keep_alive="10m", suite=None):
+        """
+        Args:
+            setup: OllamaSetup pointing at the server to benchmark
+            models: Model names to compare
+            concurrency: Numbers of requests kept in flight at once
+            repeats: Passes over the suite per concurrency level
+            max_tokens: Cap on num_predict for every prompt (keeps runs short)
+            cold: Also time the first token after unloading each model
+            keep_alive: keep_alive sent with every request
+            suite: (name, prompt type, prompt) tuples (default: SUITE)
+        """
+        self.setup = setup
+        self.models = list(models)
+        self.concurrency = list(concurrency)
+        self.repeats = repeats
+        self.max_tokens = max_tokens
+        self.cold = cold
+        self.keep_alive = keep_alive
+        self.suite = list(suite or SUITE)
+        self._local = threading.local()
+
+    def _session(self):
+        # One session per worker thread, so connections are reused without sharing a Session
+        if not hasattr(self._local, 'session'):
+            self._local.session = requests.Session()
+        return self._local.session
+
+    def options_for(self, kind):
+        options = dict(PROMPT_OPTIONS[kind])
+        if self.max_tokens:
+            options['num_predict'] = min(options['num_predict'], self.max_tokens)
+        return options
+
+    def run_prompt(self, model, case):
+        """Stream one chat completion; returns its timings, or an error"""
+        name, kind, prompt = case
+        result = {'prompt': name}
+        started = time.monotonic()
+        try:
+            with self._session().post(
+                f"{self.setup.ollama_url}/api/chat",
+                json={'model': model, 'messages': [{'role': 'user', 'content': prompt}], 'stream': True,
+                      'keep_alive': self.keep_alive, 'options': self.options_for(kind)},
+                stream=True, timeout=(5, None)
+            ) as response:
+                response.raise_for_status()
+                final = {}
+                for line in response.iter_lines():
+                    if not line:
+                        continue
+                    chunk = json.loads(line)
+                    if chunk.get('error'):
+                        raise RuntimeError(chunk['error'])
+                    if 'ttft' not in result and (chunk.get('message') or {}).get('content'):
+                        result['ttft'] = time.monotonic() - started
+                    if chunk.get('done'):
+                        final = chunk
+        except (requests.RequestException, RuntimeError, ValueError) as e:
+            result['error'] = str(e)
+            return result
+        result['latency'] = time.monotonic() - started
+        result['tokens'] = final.get('eval_count', 0)
+        if final.get('eval_duration'):
+            result['decode_tps'] = result['tokens'] / (final['eval_duration'] / 1e9)
+        elif result['tokens'] and 'ttft' in result and result['latency'] > result['ttft']:
+            result['decode_tps'] = result['tokens'] / (result['latency'] - result['ttft'])
+        return result
+
+    def memory(self, model):
+        """Resident size of a loaded model from /api/ps, in bytes (None if unavailable)"""
+        try:
+            response = self.setup.session.get(f"{self.setup.ollama_url}/api/ps", timeout=5)
+            response.raise_for_status()
+        except requests.RequestException:
+            return None
+        for entry in response.json().get('models', []):
+            if model_matches(model, entry['name']):
+                return {'size': entry.get('size'), 'size_vram': entry.get('size_vram')}
+        return None
+
+    def run_level(self, model, concurrency):
+        """Run the suite repeats times with concurrency requests in flight"""
+        cases = self.suite * self.repeats
+        started = time.monotonic()
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            results = list(executor.map(lambda case: self.run_prompt(model, case), cases))
+        wall = time.monotonic() - started
+        completed = [result for result in results if 'error' not in result]
+        tokens = sum(result['tokens'] for result in completed)
+        return {
+            'model': model,
+            'concurrency': concurrency,
+            'requests': len(results),
+            'errors': len(results) - len(completed),
+            'error_messages': sorted({result['error'] for result in results if 'error' in result})[:5],
+            'wall_seconds': round(wall, 4),
+            'ttft': percentiles([result['ttft'] for result in completed if 'ttft' in result]),
+            'latency': percentiles([result['latency'] for result in completed]),
+            'decode_tokens_per_second': percentiles([result['decode_tps'] for result in completed
+                                                     if 'decode_tps' in result]),
+            'tokens': tokens,
+            'aggregate_tokens_per_second': round(tokens / wall, 2) if wall else 0.0,
+            'memory': self.memory(model),
+        }
+
+    def run(self, progress=None):
+        """Benchmark every model at every concurrency level; returns the report"""
+        report = {
+            'created': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+            'ollama_url': self.setup.ollama_url,
+            'suite': [name for name, _, _ in self.suite],
+            'repeats': self.repeats,
+            'max_tokens': self.max_tokens,
+            'models': {},
+            'results': [],
+        }
+        try:
+            report['ollama_version'] = self.setup.session.get(
+                f"{self.setup.ollama_url}/api/version", timeout=5).json().get('version')
+        except (requests.RequestException, ValueError):
+            report['ollama_version'] = None
+
+        for model in self.models:
+            info = {}
+            try:
+                if self.cold:
+                    self.setup.unload_model(model)
+                    info['cold_start'] = self.setup.measure_ttft(model, keep_alive=self.keep_alive)
+                # Steady-state numbers should not include loading the model
+                info['warm_seconds'] = round(self.setup.warm_model(model, self.keep_alive), 4)
+            except (requests.RequestException, RuntimeError, ValueError) as e:
+                info['error'] = str(e)
+                report['models'][model] = info
+                continue
+            report['models'][model] = info
+            for concurrency in self.concurrency:
+                if progress:
+                    progress(f"{model}: concurrency {concurrency}...")
+                report['results'].append(self.run_level(model, concurrency))
+        return report
+
+def _metric(result, metric, stat):
+    values = result.get(metric)
+    return values.get(stat) if isinstance(values, dict) else values
+
+# (label, metric, stat, higher is better)
+SUMMARY_COLUMNS = [
+    ('ttft p50', 'ttft', 'p50', False),
+    ('latency p90', 'latency', 'p90', False),
+    ('decode tok/s', 'decode_tokens_per_second', 'p50', True),
+    ('total tok/s', 'aggregate_tokens_per_second', None, True),
+]
+
+def compare(report, baseline):
+    """Relative change of the summary metrics against a baseline report, per model and concurrency"""
+    previous = {(result['model'], result['concurrency']): result for result in baseline.get('results', [])}
+    changes = []
+    for result in report['results']:
+        before = previous.get((result['model'], result['concurrency']))
+        if before is None:
+            continue
+        row = {'model': result['model'], 'concurrency': result['concurrency']}
+        for label, metric, stat, higher_is_better in SUMMARY_COLUMNS:
+            new, old = _metric(result, metric, stat), _metric(before, metric, stat)
+            if new is not None and old:
+                # better is None when nothing changed, so an unchanged metric is not flagged
+                row[label] = {'before': old, 'after': new, 'change': round((new - old) / old, 4),
+                              'better': None if new == old else (new > old) == higher_is_better}
+        changes.append(row)
+    return changes
+
+def print_report(report, changes=None):
+    """Print one line per model and concurrency level"""
+    for model, info in report['models'].items():
+        if 'error' in info:
+            print(f"{model}: failed ({info['error']})")
+        elif 'cold_start' in info:
+            print(f"{model}: cold start, first token after {info['cold_start']['ttft_seconds']:.2f}s")
+    print(f"{'model':<20} {'conc':>4} {'reqs':>5} {'err':>4} {'ttft p50':>9} {'ttft p90':>9} "
+          f"{'lat p50':>8} {'lat p90':>8} {'lat p99':>8} {'tok/s':>7} {'total':>7} {'mem MB':>7}")
+    for result in report['results']:
+        ttft, latency, decode = result['ttft'] or {}, result['latency'] or {}, result['decode_tokens_per_second'] or {}
+        memory = (result['memory'] or {}).get('size')
+        print(f"{result['model']:<20} {result['concurrency']:>4} {result['requests']:>5} {result['errors']:>4} "
+              f"{ttft.get('p50', 0):>9.3f} {ttft.get('p90', 0):>9.3f} {latency.get('p50', 0):>8.2f} "
+              f"{latency.get('p90', 0):>8.2f} {latency.get('p99', 0):>8.2f} {decode.get('p50', 0):>7.1f} "
+              f"{result['aggregate_tokens_per_second']:>7.1f} {memory / (1024 * 1024) if memory else 0:>7.0f}")
+    for row in changes or []:
+        parts = []
+        for label, _, _, _ in SUMMARY_COLUMNS:
+            if label in row:
+                change = row[label]
+                parts.append(f"{label} {change['change']:+.1%}{' (worse)' if change['better'] is False else ''}")
+        print(f"vs baseline {row['model']} x{row['concurrency']}: {', '.join(parts)}")
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark Ollama models on CLOI-style prompts')
+    parser.add_argument('--model', action='append', help='Model to benchmark (repeatable, default: phi4)')
+    parser.add_argument('--ollama-url', type=str, help='Ollama API URL (default: http://localhost:11434)')
+    parser.add_argument('--concurrency', type=str, default='1,2,4', help='Comma-separated concurrency levels')
+    parser.add_argument('--repeats', type=int, default=1, help='Passes over the prompt suite per level')
+    parser.add_argument('--max-tokens', type=int, help='Cap num_predict for every prompt')
+    parser.add_argument('--cold', action='store_true', help='Also measure the first token after unloading the model')
+    parser.add_argument('--keep-alive', type=str, default='10m', help='keep_alive sent with each request')
+    parser.add_argument('--output', type=str, help='Report file (default: ~/.cloi/bench/llm-<timestamp>.json)')
+    parser.add_argument('--compare', type=str, help='Earlier report to compare against')
+    args = parser.parse_args()
+
+    try:
+        levels = [int(level) for level in args.concurrency.split(',') if level.strip()]
+    except ValueError:
+        parser.error('--concurrency must be comma-separated integers')
+    if not levels or min(levels) < 1:
+        parser.error('--concurrency levels must be positive')
+
+    models = args.model or ['phi4']
+    setup = OllamaSetup(models[0], args.ollama_url)
+    if not setup.is_service_running():
+        print(f"Ollama is not reachable at {setup.ollama_url}", file=sys.stderr)
+        return 1
+    missing = [model for model in models if not setup.has_model(model)]
+    if missing:
+        print(f"Models not pulled: {', '.join(missing)}", file=sys.stderr)
+        return 1
+
+    benchmark = LLMBenchmark(setup, models, levels, args.repeats, args.max_tokens, args.cold, args.keep_alive)
+    report = benchmark.run(progress=lambda message: print(message, file=sys.stderr))
+
+    changes = None
+    if args.compare:
+        with open(args.compare, 'r', encoding='utf-8') as f:
+            changes = compare(report, json.load(f))
+        report['comparison'] = {'baseline': args.compare, 'changes': changes}
+
+    output = Path(args.output) if args.output else BENCH_DIR / f"llm-{time.strftime('%Y%m%d-%H%M%S')}.json"
+    output.parent.mkdir(parents=True, exist_ok=True)
+    with open(output, 'w', encoding='utf-8') as f:
+        json.dump(report, f, indent=2)
+
+    print_report(report, changes)
+    print(f"Report written to {output}")
+    failed = any(result['errors'] for result in report['results']) or any(
+        'error' in info for info in report['models'].values())
+    return 1 if failed else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
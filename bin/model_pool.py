@@ -0,0 +1,293 @@
+#!/usr/bin/env python3
+"""
+Model Pool for the Embedding Service
+
+Serves several encoders (CodeBERT, GraphCodeBERT, smaller distilled models)
+from one process under names chosen per request. Models load lazily on first
+use, concurrent requests for a model that is still loading wait for that one
+load instead of starting another, and when a configured memory budget would
+be exceeded the least recently used idle models are unloaded first.
+
+With an idle timeout, models (and their tokenizers) that have not served a
+request for that long are unloaded and the freed heap is handed back to the
+OS, so a resident service costs little between bursts of embedding work.
+"""
+
+import gc
+import time
+import ctypes
+import ctypes.util
+import logging
+import threading
+from pathlib import Path
+from contextlib import contextmanager
+from concurrent.futures import Future
+
+logger = logging.getLogger(__name__)
+
+WEIGHT_FILES = ['model.safetensors', 'pytorch_model.bin']
+MB = 1024 * 1024
+
+def parse_model_specs(value):
+    """Parse 'name=path,name=path' into an ordered dict of model name to directory or Hub id"""
+    specs = {}
+    for item in filter(None, (part.strip() for part in (value or '').split(','))):
+        name, sep, path = item.partition('=')
+        if not sep or not name.strip() or not path.strip():
+            raise ValueError(f"Invalid model spec '{item}', expected name=path")
+        specs[name.strip()] = str(Path(path.strip()).expanduser()) if path.strip().startswith(('~', '/', '.')) else path.strip()
+    return specs
+
+def release_memory():
+    """Collect garbage and return freed heap pages to the OS where the allocator supports it"""
+    gc.collect()
+    # glibc keeps freed arenas mapped; malloc_trim releases them (no-op elsewhere)
+    libc_name = ctypes.util.find_library('c')
+    if libc_name:
+        try:
+            ctypes.CDLL(libc_name).malloc_trim(0)
+        except (OSError, AttributeError):
+            pass
+
+def estimate_model_bytes(path):
+    """Estimate a model's resident size from its weight file, before loading it"""
+    for name in WEIGHT_FILES:
+        weights = Path(path) / name
+        if weights.exists():
+            return weights.stat().st_size
+    return 0
+
+class LoadedModel:
+    """A loaded encoder with its tokenizer and usage bookkeeping"""
+
+    def __init__(self, name, path, lock):
+        self.name = name
+        self.path = path
+        self.lock = lock
+        self.model = None
+        self.tokenizer = None
+        self.size_bytes = 0
+        self.load_seconds = None
+        self.last_used = time.monotonic()
+        self.in_use = 0
+
+class ModelPool:
+    """Lazily loaded, memory-bounded set of named encoders"""
+
+    def __init__(self, specs, default=None, memory_budget=None, idle_timeout=None):
+        if not specs:
+            raise ValueError("At least one model must be configured")
+        self.specs = dict(specs)
+        self.default = default or next(iter(self.specs))
+        if self.default not in self.specs:
+            raise ValueError(f"Default model '{self.default}' is not configured")
+        self.memory_budget = memory_budget
+        self.idle_timeout = idle_timeout
+        self._lock = threading.Lock()
+        self._entries = {}
+        self._loading = {}
+        self._tokenizers = {}
+        self._load_history = {name: {'loads': 0, 'last_load_seconds': None} for name in self.specs}
+        self._reaper = None
+        # One lock per model name guards its tokenizer and model, which are not thread-safe
+        self._name_locks = {name: threading.RLock() for name in self.specs}
+
+    def resolve(self, name=None):
+        """Map a requested model name (None for the default) to a configured name"""
+        name = name or self.default
+        if name not in self.specs:
+            raise ValueError(f"Unknown model '{name}', available: {', '.join(self.specs)}")
+        return name
+
+    def path(self, name=None):
+        """Directory or Hub id a model is loaded from"""
+        return self.specs[self.resolve(name)]
+
+    def name_lock(self, name=None):
+        """Lock serializing tokenizer and model calls for one model"""
+        return self._name_locks[self.resolve(name)]
+
+    def tokenizer(self, name=None):
+        """Return a model's tokenizer, loading only the tokenizer if needed"""
+        name = self.resolve(name)
+        with self._name_locks[name]:
+            if name not in self._tokenizers:
+                from transformers import AutoTokenizer
+                self._tokenizers[name] = AutoTokenizer.from_pretrained(self.specs[name], local_files_only=True)
+            return self._tokenizers[name]
+
+    @contextmanager
+    def acquire(self, name=None):
+        """Use a model for the duration of a request; it cannot be evicted meanwhile"""
+        entry = self._checkout(self.resolve(name))
+        try:
+            yield entry
+        finally:
+            with self._lock:
+                entry.in_use -= 1
+                entry.last_used = time.monotonic()
+
+    def _checkout(self, name):
+        while True:
+            with self._lock:
+                entry = self._entries.get(name)
+                if entry is not None:
+                    entry.in_use += 1
+                    return entry
+                future = self._loading.get(name)
+                owner = future is None
+                if owner:
+                    future = self._loading[name] = Future()
+
+            if owner:
+                try:
+                    # Published already checked out, so nothing can evict it before this request uses it
+                    entry = self._load(name)
+                except Exception as e:
+                    future.set_exception(e)
+                    raise
+                else:
+                    future.set_result(entry)
+                    return entry
+                finally:
+                    with self._lock:
+                        self._loading.pop(name, None)
+            # Shared load: wait for whoever started it, then check out the entry under the lock
+            future.result()
+
+    def _load(self, name):
+        """Load a model (and its tokenizer), making room in the memory budget first; returns it checked out"""
+        from transformers import AutoModel
+
+        path = self.specs[name]
+        self._make_room(estimate_model_bytes(path), exclude=name)
+
+        start = time.perf_counter()
+        logger.info(f"Loading model '{name}' from {path}")
+        entry = LoadedModel(name, path, self._name_locks[name])
+        entry.tokenizer = self.tokenizer(name)
+        # safetensors weights are memory-mapped rather than unpickled, which is what makes a
+        # reload after an idle unload fast (low_cpu_mem_usage would need accelerate installed)
+        entry.model = AutoModel.from_pretrained(
+            path,
+            local_files_only=True,
+            use_safetensors=(Path(path) / 'model.safetensors').exists() or None
+        )
+        entry.model.eval()
+        entry.load_seconds = time.perf_counter() - start
+        entry.size_bytes = sum(t.numel() * t.element_size() for t in entry.model.parameters()) + \
+            sum(t.numel() * t.element_size() for t in entry.model.buffers())
+
+        with self._lock:
+            history = self._load_history[name]
+            history['loads'] += 1
+            history['last_load_seconds'] = round(entry.load_seconds, 3)
+            entry.in_use = 1
+            self._entries[name] = entry
+        verb = 'Reloaded' if history['loads'] > 1 else 'Loaded'
+        logger.info(f"{verb} model '{name}' ({entry.size_bytes / MB:.0f} MB) in {entry.load_seconds:.2f}s")
+        # The estimate can be off (or missing for Hub ids); settle the budget on actual sizes
+        self._make_room(0, exclude=name)
+        return entry
+
+    def _used_bytes(self):
+        return sum(entry.size_bytes for entry in self._entries.values())
+
+    def _make_room(self, needed, exclude=None):
+        """Unload least recently used idle models until needed bytes fit in the budget"""
+        if not self.memory_budget:
+            return
+        while True:
+            with self._lock:
+                if self._used_bytes() + needed <= self.memory_budget:
+                    return
+                idle = [e for e in self._entries.values() if e.in_use == 0 and e.name != exclude]
+                if not idle:
+                    logger.warning(f"Memory budget of {self.memory_budget / MB:.0f} MB exceeded; "
+                                   f"all loaded models are in use")
+                    return
+                victim = min(idle, key=lambda e: e.last_used)
+                del self._entries[victim.name]
+            self._release(victim, 'memory budget')
+
+    def _release(self, entry, reason, drop_tokenizer=False):
+        """Drop references to an unloaded model so its memory can be reclaimed"""
+        with entry.lock:
+            entry.model = None
+            entry.tokenizer = None
+            if drop_tokenizer:
+                self._tokenizers.pop(entry.name, None)
+        release_memory()
+        logger.info(f"Unloaded model '{entry.name}' ({reason})")
+
+    def is_loaded(self, name=None):
+        """True if a model is loaded and ready to serve"""
+        with self._lock:
+            return self.resolve(name) in self._entries
+
+    def unload_idle(self, now=None):
+        """Unload models (and tokenizers) unused for longer than the idle timeout; returns their names"""
+        if not self.idle_timeout:
+            return []
+        now = time.monotonic() if now is None else now
+        with self._lock:
+            expired = [e for e in self._entries.values()
+                       if e.in_use == 0 and now - e.last_used >= self.idle_timeout]
+            for entry in expired:
+                del self._entries[entry.name]
+        for entry in expired:
+            self._release(entry, f'idle for {now - entry.last_used:.0f}s', drop_tokenizer=True)
+        return [entry.name for entry in expired]
+
+    def start_idle_reaper(self, interval=None):
+        """Check for idle models in a background thread"""
+        if not self.idle_timeout or self._reaper is not None:
+            return
+        interval = interval or max(1.0, min(60.0, self.idle_timeout / 4))
+
+        def reap():
+            while True:
+                time.sleep(interval)
+                try:
+                    self.unload_idle()
+                except Exception as e:
+                    logger.error(f"Idle unload failed: {e}")
+
+        self._reaper = threading.Thread(target=reap, name='model-idle-reaper', daemon=True)
+        self._reaper.start()
+
+    def unload(self, name, reason='requested'):
+        """Unload a model if it is loaded and idle; returns True if it was unloaded"""
+        name = self.resolve(name)
+        with self._lock:
+            entry = self._entries.get(name)
+            if entry is None or entry.in_use:
+                return False
+            del self._entries[name]
+        self._release(entry, reason)
+        return True
+
+    def stats(self):
+        """Configured and loaded models with size and usage information"""
+        now = time.monotonic()
+        with self._lock:
+            loaded = {
+                name: {
+                    'size_mb': round(entry.size_bytes / MB, 1),
+                    'load_seconds': round(entry.load_seconds, 3),
+                    'idle_seconds': round(now - entry.last_used, 1),
+                    'in_use': entry.in_use,
+                    'loads': self._load_history[name]['loads']
+                }
+                for name, entry in self._entries.items()
+            }
+            return {
+                'default': self.default,
+                'available': list(self.specs),
+                'loaded': loaded,
+                'loading': list(self._loading),
+                'load_history': {name: dict(history) for name, history in self._load_history.items()},
+                'idle_timeout_seconds': self.idle_timeout,
+                'used_mb': round(self._used_bytes() / MB, 1),
+                'budget_mb': round(self.memory_budget / MB, 1) if self.memory_budget else None
+            }
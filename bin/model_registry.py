@@ -0,0 +1,171 @@
+#!/usr/bin/env python3
+"""
+Local Model Registry
+
+Persists what is known about locally available models (snapshot path,
+revision, artifacts present and validation results) in a single JSON file,
+so setup scripts can answer "is this model ready?" with one dictionary
+lookup instead of walking the Hugging Face cache and reloading models.
+"""
+
+import os
+import sys
+import json
+import time
+import argparse
+from pathlib import Path
+
+REGISTRY_VERSION = 2
+
+# Artifacts worth knowing about when choosing how to load a model
+TRACKED_ARTIFACTS = [
+    'config.json',
+    'tokenizer.json',
+    'tokenizer_config.json',
+    'vocab.json',
+    'merges.txt',
+    'model.safetensors',
+    'pytorch_model.bin'
+]
+
+def default_registry_path():
+    """Return the registry location, honouring CLOI_DATA_DIR"""
+    return Path(os.environ.get('CLOI_DATA_DIR', Path.home() / '.cloi')) / 'models' / 'registry.json'
+
+def default_hf_cache():
+    """Return the Hugging Face hub cache directory without importing huggingface_hub"""
+    if os.environ.get('HUGGINGFACE_HUB_CACHE'):
+        return Path(os.environ['HUGGINGFACE_HUB_CACHE'])
+    hf_home = os.environ.get('HF_HOME', Path(os.environ.get('XDG_CACHE_HOME', Path.home() / '.cache')) / 'huggingface')
+    return Path(hf_home) / 'hub'
+
+def resolve_snapshot(model_name, cache_dir=None, revision='main'):
+    """
+    Locate a model's snapshot in the Hugging Face cache
+
+    The cache layout is models--{org}--{name}/refs/{revision} -> commit hash and
+    snapshots/{commit}/, so no directory walk is needed. Falls back to the most
+    recently modified snapshot when the ref file is missing.
+
+    Returns (snapshot_path, commit_hash) or (None, None).
+    """
+    repo_dir = Path(cache_dir or default_hf_cache()) / f"models--{model_name.replace('/', '--')}"
+    snapshots_dir = repo_dir / 'snapshots'
+
+    ref_file = repo_dir / 'refs' / revision
+    if ref_file.exists():
+        commit = ref_file.read_text().strip()
+        if (snapshots_dir / commit).is_dir():
+            return snapshots_dir / commit, commit
+
+    if not snapshots_dir.is_dir():
+        return None, None
+    snapshots = sorted(snapshots_dir.iterdir(), key=lambda p: p.stat().st_mtime, reverse=True)
+    if not snapshots:
+        return None, None
+    return snapshots[0], snapshots[0].name
+
+def registry_key(model_name, cache_dir=None):
+    """Registry key for a model in a given Hugging Face cache (default: the hub cache)"""
+    return f"{model_name}@{Path(cache_dir or default_hf_cache()).expanduser().resolve()}"
+
+def scan_artifacts(snapshot_path):
+    """List the tracked artifacts and ONNX variants present in a snapshot directory"""
+    snapshot_path = Path(snapshot_path)
+    present = set(os.listdir(snapshot_path))
+    artifacts = {name: name in present for name in TRACKED_ARTIFACTS}
+
+    onnx_dir = snapshot_path / 'onnx'
+    onnx_files = sorted(os.listdir(onnx_dir)) if onnx_dir.is_dir() else []
+    artifacts['onnx'] = [f"onnx/{name}" for name in onnx_files if name.endswith('.onnx')]
+    artifacts['onnx'] += [name for name in sorted(present) if name.endswith('.onnx')]
+    return artifacts
+
+class ModelRegistry:
+    """
+    JSON-backed registry of local models
+
+    Entries are keyed by model name and resolved cache directory, since the
+    same model downloaded into two caches is two separate snapshots.
+    """
+
+    def __init__(self, path=None):
+        self.path = Path(path) if path else default_registry_path()
+        self.models = {}
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+            if data.get('version') == REGISTRY_VERSION:
+                self.models = data.get('models', {})
+        except (OSError, ValueError):
+            pass
+
+    def get(self, model_name, cache_dir=None):
+        """Return the registry entry for a model in a cache directory, or None"""
+        return self.models.get(registry_key(model_name, cache_dir))
+
+    def is_ready(self, model_name, cache_dir=None):
+        """True if the model was validated and its snapshot is still on disk"""
+        return self.entry_ready(self.get(model_name, cache_dir))
+
+    @staticmethod
+    def entry_ready(entry):
+        """True if a registry entry was validated and its snapshot is still on disk"""
+        return bool(
+            entry
+            and entry.get('validation', {}).get('ok')
+            and entry.get('snapshot_path')
+            and os.path.isdir(entry['snapshot_path'])
+        )
+
+    def record(self, model_name, snapshot_path, revision=None, validation=None, cache_dir=None):
+        """Record a model's snapshot, artifacts and validation results, then persist"""
+        entry = {
+            'model': model_name,
+            'snapshot_path': str(snapshot_path),
+            'revision': revision,
+            'artifacts': scan_artifacts(snapshot_path),
+            'validation': dict(validation or {}, validated_at=time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()))
+        }
+        self.models[registry_key(model_name, cache_dir)] = entry
+        self.save()
+        return entry
+
+    def forget(self, model_name, cache_dir=None):
+        """Drop a model from the registry"""
+        if self.models.pop(registry_key(model_name, cache_dir), None) is not None:
+            self.save()
+
+    def save(self):
+        """Atomically write the registry file"""
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = self.path.with_name(self.path.name + '.tmp')
+        with open(tmp, 'w', encoding='utf-8') as f:
+            json.dump({'version': REGISTRY_VERSION, 'models': self.models}, f, indent=2)
+        os.replace(tmp, self.path)
+
+def main():
+    parser = argparse.ArgumentParser(description='Show the local model registry')
+    parser.add_argument('--registry', type=str, help='Registry file (default: ~/.cloi/models/registry.json)')
+    parser.add_argument('--model', type=str, help='Only show this model')
+    parser.add_argument('--cache-dir', type=str, help='Cache directory of --model (default: the Hugging Face hub cache)')
+    args = parser.parse_args()
+
+    registry = ModelRegistry(args.registry)
+    keys = [registry_key(args.model, args.cache_dir)] if args.model else sorted(registry.models)
+    for key in keys:
+        entry = registry.models.get(key)
+        if entry is None:
+            print(f"{args.model}: not registered")
+            continue
+        status = 'ready' if registry.entry_ready(entry) else 'stale'
+        present = [artifact for artifact, found in entry['artifacts'].items() if found is True]
+        print(f"{entry['model']} ({status})")
+        print(f"  snapshot:  {entry['snapshot_path']}")
+        print(f"  revision:  {entry['revision']}")
+        print(f"  artifacts: {', '.join(present + entry['artifacts'].get('onnx', []))}")
+        print(f"  validated: {entry['validation'].get('validated_at')}")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,225 @@
+#!/usr/bin/env python3
+"""
+Content-Addressed Model Artifact Store
+
+Model files under ~/.cloi/models are stored once by SHA-256 in a shared
+blobs/ directory and exposed inside each model directory through hardlinks
+(or symlinks where hardlinks are not possible). Every model directory gets
+a small manifest.json describing the files it exposes, so setup checks and
+service startup can read one file instead of probing the filesystem.
+"""
+
+import os
+import sys
+import json
+import time
+import hashlib
+import argparse
+from pathlib import Path
+
+MANIFEST_NAME = 'manifest.json'
+MANIFEST_VERSION = 1
+CHUNK_SIZE = 1024 * 1024
+
+def default_store_root():
+    """Return the models directory, honouring CLOI_DATA_DIR"""
+    return Path(os.environ.get('CLOI_DATA_DIR', Path.home() / '.cloi')) / 'models'
+
+def sha256_file(path):
+    """Compute the SHA-256 hex digest of a file"""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(CHUNK_SIZE), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def read_manifest(model_dir):
+    """Read a model directory's manifest, returning None if it is missing or unreadable"""
+    try:
+        with open(Path(model_dir) / MANIFEST_NAME, 'r', encoding='utf-8') as f:
+            manifest = json.load(f)
+    except (OSError, ValueError):
+        return None
+    return manifest if manifest.get('version') == MANIFEST_VERSION else None
+
+class ArtifactStore:
+    """Stores model files once by content hash and links them into model directories"""
+
+    def __init__(self, root=None):
+        self.root = Path(root) if root else default_store_root()
+        self.blob_dir = self.root / 'blobs' / 'sha256'
+
+    def blob_path(self, sha256):
+        """Path of the blob holding the given content hash"""
+        return self.blob_dir / sha256
+
+    def _link(self, blob, target):
+        """Expose a blob at target, preferring a hardlink over a symlink"""
+        tmp = target.with_name(target.name + '.link')
+        if tmp.exists() or tmp.is_symlink():
+            tmp.unlink()
+        try:
+            os.link(blob, tmp)
+            kind = 'hardlink'
+        except OSError:
+            os.symlink(os.path.relpath(blob, target.parent), tmp)
+            kind = 'symlink'
+        os.replace(tmp, target)
+        return kind
+
+    def add(self, model_dir, name, source=None, sha256=None):
+        """
+        Move a file into the store and link it into model_dir under name
+
+        Args:
+            model_dir: Model directory the file belongs to
+            name: Relative path of the file inside model_dir (e.g. 'onnx/model.onnx')
+            source: File to ingest; defaults to the file already at model_dir/name
+            sha256: Known content hash, skips re-hashing when the caller already verified it
+
+        Returns the manifest entry for the file.
+        """
+        model_dir = Path(model_dir)
+        target = model_dir / name
+        source = Path(source) if source else target
+        target.parent.mkdir(parents=True, exist_ok=True)
+        self.blob_dir.mkdir(parents=True, exist_ok=True)
+
+        sha256 = sha256 or sha256_file(source)
+        blob = self.blob_path(sha256)
+        if blob.exists():
+            # Identical content is already stored, drop the duplicate copy
+            if not os.path.samefile(source, blob):
+                source.unlink()
+        else:
+            os.replace(source, blob)
+            os.chmod(blob, 0o444)
+
+        kind = self._link(blob, target)
+        entry = {'sha256': sha256, 'size': blob.stat().st_size, 'link': kind}
+        self.update_manifest(model_dir, {name: entry})
+        return entry
+
+    def link(self, model_dir, name, sha256):
+        """Expose an already stored blob under another name, without copying"""
+        blob = self.blob_path(sha256)
+        target = Path(model_dir) / name
+        target.parent.mkdir(parents=True, exist_ok=True)
+        kind = self._link(blob, target)
+        entry = {'sha256': sha256, 'size': blob.stat().st_size, 'link': kind}
+        self.update_manifest(model_dir, {name: entry})
+        return entry
+
+    def remove(self, model_dir, name):
+        """Unlink a file from a model directory and forget it in the manifest"""
+        target = Path(model_dir) / name
+        if target.exists() or target.is_symlink():
+            target.unlink()
+        manifest = read_manifest(model_dir)
+        if manifest and name in manifest['files']:
+            del manifest['files'][name]
+            self.write_manifest(model_dir, manifest)
+
+    def update_manifest(self, model_dir, files=None, **fields):
+        """Merge file entries and top-level fields into a model directory's manifest"""
+        manifest = read_manifest(model_dir) or {'version': MANIFEST_VERSION, 'files': {}}
+        manifest['files'].update(files or {})
+        manifest.update(fields)
+        self.write_manifest(model_dir, manifest)
+        return manifest
+
+    def write_manifest(self, model_dir, manifest):
+        """Atomically write a model directory's manifest"""
+        manifest['updated_at'] = time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime())
+        path = Path(model_dir) / MANIFEST_NAME
+        tmp = path.with_name(MANIFEST_NAME + '.tmp')
+        with open(tmp, 'w', encoding='utf-8') as f:
+            json.dump(manifest, f, indent=2)
+        os.replace(tmp, path)
+
+    def has_files(self, model_dir, names):
+        """Check that all names are in the manifest and still linked with the recorded size"""
+        manifest = read_manifest(model_dir)
+        if manifest is None:
+            return False
+        for name in names:
+            entry = manifest['files'].get(name)
+            try:
+                # A stat per file catches links deleted behind the manifest's back
+                if entry is None or (Path(model_dir) / name).stat().st_size != entry['size']:
+                    return False
+            except OSError:
+                return False
+        return True
+
+    def referenced_hashes(self):
+        """Collect the hashes referenced by any model manifest under the store root"""
+        referenced = set()
+        for manifest_path in self.root.glob(f"**/{MANIFEST_NAME}"):
+            manifest = read_manifest(manifest_path.parent)
+            if manifest:
+                referenced.update(entry['sha256'] for entry in manifest['files'].values())
+        return referenced
+
+    def gc(self):
+        """Delete blobs that no manifest references; returns the number of bytes freed"""
+        if not self.blob_dir.exists():
+            return 0
+        referenced = self.referenced_hashes()
+        freed = 0
+        for blob in self.blob_dir.iterdir():
+            if blob.name not in referenced:
+                freed += blob.stat().st_size
+                os.chmod(blob, 0o644)
+                blob.unlink()
+        return freed
+
+def convert_to_safetensors(store, model_dir, source_name='pytorch_model.bin', target_name='model.safetensors'):
+    """
+    Convert PyTorch pickle weights to safetensors once, so they can be loaded by mmap
+
+    The pickle weights are unlinked from the model directory afterwards.
+    """
+    import torch
+    from safetensors.torch import save_file
+
+    model_dir = Path(model_dir)
+    source = model_dir / source_name
+    state_dict = torch.load(source, map_location='cpu', weights_only=True)
+
+    # safetensors refuses tensors sharing storage (tied embeddings), so store private copies
+    seen = set()
+    tensors = {}
+    for key, tensor in state_dict.items():
+        storage = tensor.untyped_storage().data_ptr()
+        tensors[key] = tensor.clone().contiguous() if storage in seen else tensor.contiguous()
+        seen.add(storage)
+
+    tmp = model_dir / (target_name + '.tmp')
+    save_file(tensors, str(tmp), metadata={'format': 'pt'})
+    entry = store.add(model_dir, target_name, source=tmp)
+    store.remove(model_dir, source_name)
+    return entry
+
+def main():
+    parser = argparse.ArgumentParser(description='Inspect and maintain the CLOI model artifact store')
+    parser.add_argument('--root', type=str, help='Store root (default: ~/.cloi/models)')
+    parser.add_argument('--gc', action='store_true', help='Delete blobs no longer referenced by any manifest')
+    args = parser.parse_args()
+
+    store = ArtifactStore(args.root)
+    for manifest_path in sorted(store.root.glob(f"*/{MANIFEST_NAME}")):
+        manifest = read_manifest(manifest_path.parent)
+        if not manifest:
+            continue
+        total = sum(entry['size'] for entry in manifest['files'].values())
+        print(f"{manifest_path.parent.name}: {len(manifest['files'])} files, {total / 1e6:.1f} MB")
+        for name, entry in sorted(manifest['files'].items()):
+            print(f"  {name}  {entry['sha256'][:12]}  {entry['size']} bytes ({entry['link']})")
+
+    if args.gc:
+        freed = store.gc()
+        print(f"Freed {freed / 1e6:.1f} MB of unreferenced blobs")
+
+if __name__ == "__main__":
+    sys.exit(main())
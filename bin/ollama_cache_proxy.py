@@ -0,0 +1,378 @@
+#!/usr/bin/env python3
+"""
+Caching Proxy for Ollama
+
+CI auto-repair and error-analysis runs send the same prompt with the same
+options over and over. This script sits between CLOI and Ollama
+(localhost:11434 by default) and answers repeated deterministic requests
+from a local cache:
+
+- /api/generate and /api/chat requests are cached when they are
+  deterministic, i.e. options.temperature is 0 or options.seed is set;
+  everything else is passed through untouched,
+- the cache key is a SHA-256 of the canonical JSON of the endpoint, the
+  request (minus keep_alive) and the model's digest from /api/tags, so
+  re-pulling a model invalidates its entries,
+- streamed (NDJSON) and non-streamed responses are both stored as
+  received; cached streams are replayed at full speed,
+- entries live on disk, bounded in total size with least-recently-used
+  eviction, and GET /cache/stats reports hits, misses and the upstream time
+  saved.
+
+Point clients at the proxy's address instead of Ollama's.
+
+Limitations: CLOI itself does not benefit yet. Its executor
+(src/core/executor/ollama.js) sends temperature 0.1 or 0.3 and no seed,
+so none of its requests are deterministic by the rule above, and it talks
+to the ollama package's default host with no way to point it at this
+port. Until it sends temperature 0 or a seed for the fixed-answer prompt
+types and takes a configurable host, the proxy only helps other clients
+(scripts, CI jobs) that do.
+
+Usage:
+    python bin/ollama_cache_proxy.py --port 11435
+    python bin/ollama_cache_proxy.py --upstream http://gpu-box:11434 --max-mb 1024
+"""
+
+import os
+import sys
+import json
+import time
+import hashlib
+import argparse
+import threading
+from pathlib import Path
+from collections import OrderedDict
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+import requests
+
+from ollama_setup import model_matches
+
+DEFAULT_PORT = 11435
+DEFAULT_UPSTREAM = "http://localhost:11434"
+DEFAULT_MAX_MB = 512
+CACHEABLE_PATHS = ('/api/generate', '/api/chat')
+# Request fields that do not change the response
+IGNORED_FIELDS = ('keep_alive',)
+# How long model digests from /api/tags are trusted before re-reading them
+DIGEST_TTL = 30
+
+def default_cache_dir():
+    """Return the directory cached responses are kept in"""
+    return Path(os.environ.get('CLOI_DATA_DIR', Path.home() / '.cloi')) / 'cache' / 'ollama'
+
+def is_deterministic(request):
+    """True if the sampling options make the response reproducible"""
+    options = request.get('options') or {}
+    return options.get('temperature') == 0 or options.get('seed') is not None
+
+def is_cacheable(path, request):
+    """Deterministic generate/chat requests that actually ask for output (not load or unload calls)"""
+    if path not in CACHEABLE_PATHS or not isinstance(request, dict):
+        return False
+    if not (request.get('prompt') or request.get('messages')):
+        return False
+    return is_deterministic(request)
+
+def cache_key(path, request, digest):
+    """Canonical hash of endpoint, request and model digest"""
+    canonical = {name: value for name, value in request.items() if name not in IGNORED_FIELDS}
+    model = canonical.get('model', '')
+    canonical['model'] = model if ':' in model else model + ':latest'
+    # Ollama streams unless told otherwise, and the two bodies differ
+    canonical['stream'] = canonical.get('stream', True) is not False
+    payload = json.dumps({'path': path, 'request': canonical, 'digest': digest},
+                         sort_keys=True, separators=(',', ':'), ensure_ascii=False)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+class ResponseCache:
+    """Size-bounded on-disk response cache with least-recently-used eviction"""
+
+    def __init__(self, cache_dir, max_bytes):
+        """
+        Args:
+            cache_dir: Directory holding one file per entry
+            max_bytes: Total size above which the least recently used entries are removed
+
+        Each entry file is a JSON metadata line followed by the raw response
+        body. Recency is the file's mtime, so it survives restarts.
+        """
+        self.cache_dir = Path(cache_dir)
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        self.max_bytes = max_bytes
+        self.lock = threading.Lock()
+        self.entries = OrderedDict()
+        self.total_bytes = 0
+        self.counts = {'hits': 0, 'misses': 0, 'bypassed': 0, 'stored': 0, 'evicted': 0}
+        self.saved_seconds = 0.0
+        files = sorted(self.cache_dir.glob('*.entry'), key=lambda path: path.stat().st_mtime)
+        with self.lock:
+            for path in files:
+                self.entries[path.stem] = path.stat().st_size
+                self.total_bytes += path.stat().st_size
+            # The limit may have been lowered since the entries were written
+            self._evict()
+
+    def _path(self, key):
+        return self.cache_dir / f'{key}.entry'
+
+    def get(self, key):
+        """Return (metadata, body) for a key, or None; a hit makes the entry most recent"""
+        with self.lock:
+            if key not in self.entries:
+                self.counts['misses'] += 1
+                return None
+            try:
+                with open(self._path(key), 'rb') as f:
+                    meta = json.loads(f.readline())
+                    body = f.read()
+                os.utime(self._path(key))
+            except (OSError, ValueError):
+                self.total_bytes -= self.entries.pop(key)
+                self.counts['misses'] += 1
+                return None
+            self.entries.move_to_end(key)
+            self.counts['hits'] += 1
+            self.saved_seconds += meta.get('upstream_seconds', 0)
+            return meta, body
+
+    def put(self, key, meta, body):
+        """Store a response, then evict least recently used entries beyond max_bytes"""
+        data = json.dumps(meta).encode() + b'\n' + body
+        if len(data) > self.max_bytes:
+            return
+        path = self._path(key)
+        temp_path = path.with_suffix(f'.tmp{threading.get_ident()}')
+        with self.lock:
+            with open(temp_path, 'wb') as f:
+                f.write(data)
+            os.replace(temp_path, path)
+            self.total_bytes += len(data) - self.entries.pop(key, 0)
+            self.entries[key] = len(data)
+            self.counts['stored'] += 1
+            self._evict()
+
+    def _evict(self):
+        # Called with the lock held
+        while self.total_bytes > self.max_bytes:
+            oldest, size = self.entries.popitem(last=False)
+            self._path(oldest).unlink(missing_ok=True)
+            self.total_bytes -= size
+            self.counts['evicted'] += 1
+
+    def record_bypass(self):
+        with self.lock:
+            self.counts['bypassed'] += 1
+
+    def stats(self):
+        """Hit rate over cacheable requests, counts, size and upstream time saved"""
+        with self.lock:
+            lookups = self.counts['hits'] + self.counts['misses']
+            return dict(
+                self.counts,
+                hit_rate=round(self.counts['hits'] / lookups, 4) if lookups else 0.0,
+                entries=len(self.entries),
+                bytes=self.total_bytes,
+                max_bytes=self.max_bytes,
+                saved_seconds=round(self.saved_seconds, 3)
+            )
+
+    def clear(self):
+        """Remove every entry"""
+        with self.lock:
+            for key in self.entries:
+                self._path(key).unlink(missing_ok=True)
+            self.entries.clear()
+            self.total_bytes = 0
+
+class ModelDigests:
+    """Model digests from the upstream /api/tags, refreshed every DIGEST_TTL seconds"""
+
+    def __init__(self, upstream, session, ttl=DIGEST_TTL):
+        self.upstream = upstream
+        self.session = session
+        self.ttl = ttl
+        self.lock = threading.Lock()
+        self.digests = {}
+        self.fetched = 0.0
+
+    def get(self, model):
+        """The installed digest of a model, or None if Ollama does not have it"""
+        with self.lock:
+            stale = time.monotonic() - self.fetched > self.ttl
+            digests = self.digests
+        if stale:
+            # Fetched without the lock so a slow Ollama does not hold up every other lookup
+            response = self.session.get(f"{self.upstream}/api/tags", timeout=5)
+            response.raise_for_status()
+            digests = {entry['name']: entry.get('digest') for entry in response.json().get('models', [])}
+            with self.lock:
+                self.digests = digests
+                self.fetched = time.monotonic()
+        return next((digest for name, digest in digests.items() if model_matches(model, name)), None)
+
+class ProxyHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    disable_nagle_algorithm = True
+
+    # Set by make_server()
+    upstream = DEFAULT_UPSTREAM
+    cache = None
+    digests = None
+    session = None
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send_body(self, status_code, body, content_type='application/json', cache_status=None):
+        self.send_response(status_code)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        if cache_status:
+            self.send_header('X-Cache', cache_status)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _write_chunk(self, data):
+        self.wfile.write(f'{len(data):x}\r\n'.encode() + data + b'\r\n')
+        self.wfile.flush()
+
+    def _read_body(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        return self.rfile.read(length) if length else b''
+
+    def _forward(self, method, body, cache_key_value=None):
+        """Relay a request upstream, streaming the response back; stores it if a cache key is given"""
+        started = time.monotonic()
+        headers = {'Content-Type': self.headers.get('Content-Type', 'application/json')}
+        try:
+            response = self.session.request(method, f"{self.upstream}{self.path}", data=body or None,
+                                            headers=headers, stream=True, timeout=(5, None))
+        except requests.RequestException as e:
+            self._send_body(502, json.dumps({'error': f'Ollama unreachable: {e}'}).encode())
+            return
+        content_type = response.headers.get('Content-Type', 'application/json')
+        cache_status = 'MISS' if cache_key_value else 'BYPASS'
+        with response:
+            # Buffered responses keep their length; streams are re-chunked as they arrive
+            if 'Content-Length' in response.headers and 'ndjson' not in content_type:
+                data = response.content
+                self._send_body(response.status_code, data, content_type, cache_status)
+            else:
+                self.send_response(response.status_code)
+                self.send_header('Content-Type', content_type)
+                self.send_header('Transfer-Encoding', 'chunked')
+                self.send_header('X-Cache', cache_status)
+                self.end_headers()
+                parts = []
+                for part in response.iter_content(chunk_size=None):
+                    if part:
+                        parts.append(part)
+                        self._write_chunk(part)
+                self._write_chunk(b'')
+                data = b''.join(parts)
+        if cache_key_value and response.status_code == 200 and is_complete(data):
+            self.cache.put(cache_key_value, {
+                'content_type': content_type,
+                'stream': 'ndjson' in content_type,
+                'upstream_seconds': time.monotonic() - started,
+                'stored_at': time.time()
+            }, data)
+
+    def _handle(self, method):
+        if self.path == '/cache/stats' and method == 'GET':
+            self._send_body(200, json.dumps(self.cache.stats()).encode())
+            return
+        if self.path == '/cache' and method == 'DELETE':
+            self.cache.clear()
+            self._send_body(200, json.dumps({'status': 'cleared'}).encode())
+            return
+
+        body = self._read_body()
+        request = None
+        if method == 'POST' and self.path in CACHEABLE_PATHS:
+            try:
+                request = json.loads(body)
+            except ValueError:
+                request = None
+        if request is None or not is_cacheable(self.path, request):
+            if self.path in CACHEABLE_PATHS:
+                self.cache.record_bypass()
+            self._forward(method, body)
+            return
+
+        try:
+            digest = self.digests.get(request.get('model', ''))
+        except (requests.RequestException, ValueError):
+            digest = None
+        if digest is None:
+            # Unknown model or tags unavailable: let Ollama answer (and report any error)
+            self.cache.record_bypass()
+            self._forward(method, body)
+            return
+
+        key = cache_key(self.path, request, digest)
+        cached = self.cache.get(key)
+        if cached is None:
+            self._forward(method, body, key)
+            return
+        meta, data = cached
+        # Replayed in one write: the client sees the whole stream immediately
+        self._send_body(200, data, meta['content_type'], 'HIT')
+
+    def do_GET(self):
+        self._handle('GET')
+
+    def do_POST(self):
+        self._handle('POST')
+
+    def do_DELETE(self):
+        self._handle('DELETE')
+
+def is_complete(data):
+    """A finished, error-free Ollama response: the last JSON object has done set and no error"""
+    lines = [line for line in data.splitlines() if line.strip()]
+    if not lines:
+        return False
+    try:
+        last = json.loads(lines[-1])
+    except ValueError:
+        return False
+    return bool(last.get('done')) and not last.get('error')
+
+def make_server(host, port, upstream=DEFAULT_UPSTREAM, cache_dir=None, max_bytes=DEFAULT_MAX_MB * 1024 * 1024):
+    """Create the proxy server (not yet serving)"""
+    session = requests.Session()
+    upstream = upstream.rstrip('/')
+    handler = type('BoundProxyHandler', (ProxyHandler,), {
+        'upstream': upstream,
+        'cache': ResponseCache(cache_dir or default_cache_dir(), max_bytes),
+        'digests': ModelDigests(upstream, session),
+        'session': session
+    })
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    return server
+
+def main():
+    parser = argparse.ArgumentParser(description='Cache deterministic Ollama responses')
+    parser.add_argument('--host', type=str, default='127.0.0.1', help='Address to listen on')
+    parser.add_argument('--port', type=int, default=DEFAULT_PORT, help=f'Port to listen on (default: {DEFAULT_PORT})')
+    parser.add_argument('--upstream', type=str, default=DEFAULT_UPSTREAM, help=f'Ollama URL (default: {DEFAULT_UPSTREAM})')
+    parser.add_argument('--cache-dir', type=str, help='Cache directory (default: ~/.cloi/cache/ollama)')
+    parser.add_argument('--max-mb', type=float, default=DEFAULT_MAX_MB, help=f'Cache size limit in MB (default: {DEFAULT_MAX_MB})')
+    args = parser.parse_args()
+
+    server = make_server(args.host, args.port, args.upstream, args.cache_dir, int(args.max_mb * 1024 * 1024))
+    print(f"Caching proxy for {args.upstream} listening on http://{args.host}:{args.port}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -7,27 +7,86 @@ It also verifies the service is running and starts it if needed.
 """
 
 import os
+import re
+import json
+import argparse
 import platform
 import shutil
+import statistics
 import subprocess
 import sys
+import threading
 import time
+from datetime import datetime, timezone
 import requests
 
+# How long Ollama keeps a model loaded after a warm-up (Ollama's own default is 5m)
+DEFAULT_KEEP_ALIVE = "30m"
+# Short prompt used to time the first token
+TTFT_PROMPT = "Reply with OK."
+
+
+def wait_until_ready(check, timeout=10, initial_delay=0.05, max_delay=1.0):
+    """
+    Poll check() with exponential backoff until it returns True or timeout seconds pass
+
+    Returns the seconds waited, or None on timeout.
+    """
+    start = time.monotonic()
+    delay = initial_delay
+    while True:
+        if check():
+            return time.monotonic() - start
+        remaining = timeout - (time.monotonic() - start)
+        if remaining <= 0:
+            return None
+        time.sleep(min(delay, remaining))
+        delay = min(delay * 2, max_delay)
+
+
+def parse_keep_alive(value):
+    """Seconds for an Ollama keep_alive value ('30m', '1h', '90s', a number of seconds; negative means forever)"""
+    if isinstance(value, (int, float)):
+        return float(value)
+    match = re.fullmatch(r'(-?\d+(?:\.\d+)?)([smh]?)', str(value).strip())
+    if not match:
+        raise ValueError(f"Invalid keep_alive: {value}")
+    return float(match.group(1)) * {'': 1, 's': 1, 'm': 60, 'h': 3600}[match.group(2)]
+
+
+def parse_timestamp(value):
+    """Parse the RFC 3339 timestamps Ollama returns (nanosecond precision, any offset) to epoch seconds"""
+    value = re.sub(r'(\.\d{6})\d+', r'\1', value.replace('Z', '+00:00'))
+    parsed = datetime.fromisoformat(value)
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=timezone.utc)
+    return parsed.timestamp()
+
+
+def model_matches(requested, installed):
+    """True if an installed model name satisfies a requested one ('phi4' matches 'phi4:latest')"""
+    if ':' not in requested:
+        requested += ':latest'
+    if ':' not in installed:
+        installed += ':latest'
+    return requested == installed
+
 
 class OllamaSetup:
     """Handles Ollama installation, service management, and model management"""
     
-    def __init__(self, model_name="phi4"):
+    def __init__(self, model_name="phi4", ollama_url=None):
         """
         Initialize the Ollama setup handler
         
         Args:
             model_name: Name of the model to use (default: phi4)
+            ollama_url: Base URL of the Ollama API (default: http://localhost:11434)
         """
         self.model_name = model_name
         self.system = platform.system().lower()
-        self.ollama_url = "http://localhost:11434"
+        self.ollama_url = (ollama_url or "http://localhost:11434").rstrip('/')
+        self.session = requests.Session()
         
     def check_installation(self):
         """Check if Ollama is installed on the system"""
@@ -86,15 +145,28 @@ class OllamaSetup:
             print("Please install Ollama manually from https://ollama.com")
             return False
 
-    def is_service_running(self):
+    def is_service_running(self, timeout=2):
         """Check if the Ollama service is running"""
         try:
-            response = requests.get(f"{self.ollama_url}/api/version", timeout=2)
+            response = self.session.get(f"{self.ollama_url}/api/version", timeout=timeout)
             return response.status_code == 200
         except requests.RequestException:
             return False
 
-    def start_service(self):
+    def spawn_service(self, command=None):
+        """Launch 'ollama serve' (or command) in the background without waiting for it"""
+        return subprocess.Popen(
+            command or ["ollama", "serve"],
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.DEVNULL,
+            start_new_session=True
+        )
+
+    def wait_for_service(self, timeout=10):
+        """Wait for the API to answer, polling with exponential backoff; returns seconds waited or None"""
+        return wait_until_ready(lambda: self.is_service_running(timeout=0.5), timeout)
+
+    def start_service(self, timeout=10):
         """Start the Ollama service if it's not running"""
         if self.is_service_running():
             print("Ollama service is already running.")
@@ -105,19 +177,13 @@ class OllamaSetup:
         try:
             if self.system == "darwin" or self.system == "linux":
                 # Start the service in the background
-                subprocess.Popen(
-                    ["ollama", "serve"],
-                    stdout=subprocess.DEVNULL,
-                    stderr=subprocess.DEVNULL,
-                    start_new_session=True
-                )
+                self.spawn_service()
                 
                 # Wait for the service to start
-                for _ in range(10):  # Wait up to 10 seconds
-                    time.sleep(1)
-                    if self.is_service_running():
-                        print("Ollama service started successfully.")
-                        return True
+                waited = self.wait_for_service(timeout)
+                if waited is not None:
+                    print(f"Ollama service started successfully in {waited:.2f}s.")
+                    return True
                 
                 print("Warning: Ollama service started but not responding within the timeout.")
                 return False
@@ -130,6 +196,34 @@ class OllamaSetup:
             print("Please start Ollama manually using 'ollama serve' before using CLOI.")
             return False
 
+    def list_models(self):
+        """Names of the locally available models, from /api/tags"""
+        response = self.session.get(f"{self.ollama_url}/api/tags", timeout=5)
+        response.raise_for_status()
+        return [model['name'] for model in response.json().get('models', [])]
+
+    def has_model(self, model_name=None):
+        """Check whether a model (default: the configured one) is pulled"""
+        requested = model_name or self.model_name
+        return any(model_matches(requested, name) for name in self.list_models())
+
+    def pull_model(self, model_name=None):
+        """Pull a model through /api/pull, printing each new status line"""
+        model_name = model_name or self.model_name
+        with self.session.post(f"{self.ollama_url}/api/pull", json={'model': model_name},
+                               stream=True, timeout=(5, None)) as response:
+            response.raise_for_status()
+            last_status = None
+            for line in response.iter_lines():
+                if not line:
+                    continue
+                update = json.loads(line)
+                if update.get('error'):
+                    raise RuntimeError(update['error'])
+                if update.get('status') != last_status:
+                    last_status = update.get('status')
+                    print(f"  {last_status}")
+
     def ensure_model_available(self):
         """Make sure the default model is available"""
         if not self.is_service_running():
@@ -138,33 +232,250 @@ class OllamaSetup:
             
         try:
             # Check if model is already pulled
-            result = subprocess.run(
-                ["ollama", "list"], 
-                capture_output=True, 
-                text=True, 
-                check=True
-            )
-            
-            if self.model_name in result.stdout:
+            if self.has_model():
                 print(f"Model {self.model_name} is already available.")
                 return True
                 
             print(f"Downloading model {self.model_name}...")
             # Pull the model
-            subprocess.run(
-                ["ollama", "pull", self.model_name],
-                check=True
-            )
+            self.pull_model()
             print(f"Model {self.model_name} downloaded successfully.")
             return True
-        except subprocess.CalledProcessError as e:
+        except (requests.RequestException, RuntimeError, ValueError) as e:
             print(f"Failed to check/download model: {e}")
             return False
 
+    def loaded_models(self):
+        """Models currently in memory, from /api/ps, mapped to their expiry as epoch seconds"""
+        response = self.session.get(f"{self.ollama_url}/api/ps", timeout=5)
+        response.raise_for_status()
+        loaded = {}
+        for model in response.json().get('models', []):
+            expires_at = model.get('expires_at')
+            loaded[model['name']] = parse_timestamp(expires_at) if expires_at else None
+        return loaded
+
+    def is_model_loaded(self, model_name=None):
+        """Check whether a model (default: the configured one) is loaded in memory"""
+        requested = model_name or self.model_name
+        return any(model_matches(requested, name) for name in self.loaded_models())
+
+    def warm_model(self, model_name=None, keep_alive=DEFAULT_KEEP_ALIVE):
+        """
+        Load a model into memory with an empty generate request
+
+        Ollama loads the model without generating anything and keeps it
+        resident for keep_alive. Returns the seconds the request took.
+        """
+        started = time.monotonic()
+        response = self.session.post(
+            f"{self.ollama_url}/api/generate",
+            json={'model': model_name or self.model_name, 'keep_alive': keep_alive},
+            timeout=(5, None)
+        )
+        response.raise_for_status()
+        if response.json().get('error'):
+            raise RuntimeError(response.json()['error'])
+        return time.monotonic() - started
+
+    def unload_model(self, model_name=None):
+        """Evict a model from memory right away (keep_alive 0)"""
+        self.warm_model(model_name, keep_alive=0)
+
+    def measure_ttft(self, model_name=None, prompt=TTFT_PROMPT, keep_alive=DEFAULT_KEEP_ALIVE):
+        """
+        Time a one-token streamed completion
+
+        Returns a dict with ttft_seconds (until the first streamed chunk) and,
+        when Ollama reports it, load_seconds spent loading the model.
+        """
+        started = time.monotonic()
+        result = {}
+        with self.session.post(
+            f"{self.ollama_url}/api/generate",
+            json={'model': model_name or self.model_name, 'prompt': prompt, 'stream': True,
+                  'keep_alive': keep_alive, 'options': {'num_predict': 1, 'temperature': 0}},
+            stream=True, timeout=(5, None)
+        ) as response:
+            response.raise_for_status()
+            for line in response.iter_lines():
+                if not line:
+                    continue
+                chunk = json.loads(line)
+                if chunk.get('error'):
+                    raise RuntimeError(chunk['error'])
+                result.setdefault('ttft_seconds', time.monotonic() - started)
+                if chunk.get('done') and 'load_duration' in chunk:
+                    result['load_seconds'] = chunk['load_duration'] / 1e9
+        return result
+
+    def warm_up(self, models=None, keep_alive=DEFAULT_KEEP_ALIVE, measure=False):
+        """
+        Preload models and optionally report time-to-first-token before and after
+
+        Args:
+            models: Models to warm (default: the configured one)
+            keep_alive: How long Ollama should keep them loaded
+            measure: Time a one-token completion before warming (whatever
+                state the model is in now) and again once it is loaded
+
+        Returns a dict per model with was_loaded, warm_seconds and, if measured,
+        ttft_before/ttft_after.
+        """
+        results = {}
+        for name in models or [self.model_name]:
+            result = {'was_loaded': self.is_model_loaded(name)}
+            try:
+                if measure:
+                    result['ttft_before'] = self.measure_ttft(name, keep_alive=keep_alive)
+                result['warm_seconds'] = self.warm_model(name, keep_alive)
+                if measure:
+                    result['ttft_after'] = self.measure_ttft(name, keep_alive=keep_alive)
+            except (requests.RequestException, RuntimeError, ValueError) as e:
+                result['error'] = str(e)
+            results[name] = result
+        return results
+
+
+class WarmKeeper:
+    """
+    Background thread that keeps models loaded while they are being used
+
+    Every poll it reads /api/ps. A model whose expiry no longer matches what
+    the keeper itself last set was used by someone else since the previous
+    poll (earlier too, if that request asked for a shorter keep_alive),
+    and each such use is recorded. The keep_alive of a re-warm is derived
+    from those uses: a multiple of the median gap between them, clamped to
+    [min_keep_alive, max_keep_alive]. Models are re-warmed shortly before
+    they would expire, but only while the last use is within idle_limit;
+    after that they are left to unload and free their memory.
+    """
+
+    def __init__(self, setup, models=None, interval=30, min_keep_alive=300, max_keep_alive=3600,
+                 idle_limit=7200, gap_factor=2.0):
+        """
+        Args:
+            setup: OllamaSetup used to talk to the API
+            models: Models to keep warm (default: the setup's model)
+            interval: Seconds between polls
+            min_keep_alive: Lower bound for the derived keep_alive, in seconds
+            max_keep_alive: Upper bound for the derived keep_alive, in seconds
+            idle_limit: Stop re-warming a model this many seconds after its last use
+            gap_factor: keep_alive is this many median gaps between uses
+        """
+        self.setup = setup
+        self.models = list(models or [setup.model_name])
+        self.interval = interval
+        self.min_keep_alive = min_keep_alive
+        self.max_keep_alive = max_keep_alive
+        self.idle_limit = idle_limit
+        self.gap_factor = gap_factor
+        self.uses = {name: [] for name in self.models}
+        self.expected_expiry = {}
+        self.warms = {name: 0 for name in self.models}
+        self._stop = threading.Event()
+        self._thread = None
+
+    def keep_alive_for(self, name):
+        """Seconds to keep a model loaded, from the gaps between its recent uses"""
+        uses = self.uses[name]
+        if len(uses) < 2:
+            return self.min_keep_alive
+        gap = statistics.median(b - a for a, b in zip(uses, uses[1:]))
+        return int(min(max(gap * self.gap_factor, self.min_keep_alive), self.max_keep_alive))
+
+    def record_use(self, name, when=None):
+        """Note that a model was used (kept to the last 50 uses)"""
+        self.uses[name] = (self.uses[name] + [when if when is not None else time.time()])[-50:]
+
+    def poll(self, now=None):
+        """One keeper pass; returns the models that were (re-)warmed"""
+        now = now if now is not None else time.time()
+        loaded = self.setup.loaded_models()
+        warmed = []
+        for name in self.models:
+            expiries = [exp for loaded_name, exp in loaded.items() if model_matches(name, loaded_name)]
+            is_loaded = bool(expiries)
+            expiry = expiries[0] if expiries else None
+            expected = self.expected_expiry.get(name)
+            # An expiry other than the one we set means a request reset the model's timer
+            if expiry is not None and expected is not None and abs(expiry - expected) > 1:
+                self.record_use(name, now)
+                self.expected_expiry[name] = expiry
+            first_pass = name not in self.expected_expiry
+            last_use = self.uses[name][-1] if self.uses[name] else None
+            recently_used = last_use is not None and now - last_use < self.idle_limit
+            expiring = not is_loaded or (expiry is not None and expiry - now < 2 * self.interval)
+            if first_pass or (recently_used and expiring):
+                keep_alive = self.keep_alive_for(name)
+                try:
+                    seconds = self.setup.warm_model(name, keep_alive)
+                    # Ollama starts the timer once the load finishes, so take the expiry it reports
+                    expiries = [exp for loaded_name, exp in self.setup.loaded_models().items()
+                                if model_matches(name, loaded_name) and exp is not None]
+                except (requests.RequestException, RuntimeError, ValueError):
+                    continue
+                self.expected_expiry[name] = expiries[0] if expiries else now + seconds + keep_alive
+                self.warms[name] += 1
+                warmed.append(name)
+        return warmed
+
+    def run(self):
+        """Poll until stop() is called"""
+        while not self._stop.is_set():
+            try:
+                self.poll()
+            except (requests.RequestException, ValueError):
+                pass
+            self._stop.wait(self.interval)
+
+    def start(self):
+        """Run the keeper in a daemon thread"""
+        self._thread = threading.Thread(target=self.run, name='ollama-warm-keeper', daemon=True)
+        self._thread.start()
+        return self._thread
+
+    def stop(self):
+        """Stop the background thread"""
+        self._stop.set()
+        if self._thread:
+            self._thread.join()
+
+
+def print_warm_results(results):
+    """Print the outcome of a warm-up, with TTFT before and after when measured"""
+    for name, result in results.items():
+        if 'error' in result:
+            print(f"Could not warm {name}: {result['error']}")
+            continue
+        state = "already loaded" if result['was_loaded'] else "loaded"
+        line = f"{name}: {state} in {result['warm_seconds']:.2f}s"
+        if 'ttft_before' in result:
+            before, after = result['ttft_before'], result['ttft_after']
+            line += f", time to first token {before['ttft_seconds']:.2f}s -> {after['ttft_seconds']:.2f}s"
+            if before.get('load_seconds'):
+                line += f" (load {before['load_seconds']:.2f}s before warm-up)"
+        print(line)
+
 
 def main():
     """Main function to ensure Ollama is installed and running"""
-    setup = OllamaSetup()
+    parser = argparse.ArgumentParser(description='Install and start Ollama, and optionally keep models warm')
+    parser.add_argument('--model', action='append', help='Model to set up (repeatable, default: phi4)')
+    parser.add_argument('--ollama-url', type=str, help='Ollama API URL (default: http://localhost:11434)')
+    parser.add_argument('--warm', action='store_true', help='Preload the models into memory')
+    parser.add_argument('--measure', action='store_true', help='Report time-to-first-token before and after warm-up')
+    parser.add_argument('--keep-alive', type=str, default=DEFAULT_KEEP_ALIVE,
+                        help=f'How long warmed models stay loaded (default: {DEFAULT_KEEP_ALIVE})')
+    parser.add_argument('--keeper', action='store_true',
+                        help='Stay running and re-warm models while they are in use')
+    parser.add_argument('--keeper-interval', type=float, default=30, help='Seconds between keeper polls')
+    parser.add_argument('--idle-limit', type=str, default='2h',
+                        help='Let a model unload after this long without use (default: 2h)')
+    args = parser.parse_args()
+
+    models = args.model or ['phi4']
+    setup = OllamaSetup(models[0], args.ollama_url)
     
     # Check if Ollama is installed
     if not setup.check_installation():
@@ -182,10 +493,23 @@ def main():
     # Ensure default model is available
     if not setup.ensure_model_available():
         print("Warning: Could not ensure the default model is available.")
-        print("Please run 'ollama pull phi4' manually before using CLOI.")
+        print(f"Please run 'ollama pull {setup.model_name}' manually before using CLOI.")
     
+    if args.warm or args.measure or args.keeper:
+        print_warm_results(setup.warm_up(models, args.keep_alive, measure=args.measure))
+
     print("Ollama setup completed successfully!")
 
+    if args.keeper:
+        keeper = WarmKeeper(setup, models, interval=args.keeper_interval,
+                            min_keep_alive=parse_keep_alive(args.keep_alive),
+                            idle_limit=parse_keep_alive(args.idle_limit))
+        print(f"Keeping {', '.join(models)} warm (Ctrl+C to stop)...")
+        try:
+            keeper.run()
+        except KeyboardInterrupt:
+            pass
+
 
 if __name__ == "__main__":
     main() 
\ No newline at end of file
@@ -0,0 +1,383 @@
+#!/usr/bin/env python3
+"""
+Retrieval Quality Regression Harness
+
+Speedups such as quantization, ONNX export, early exit or shorter windows
+can quietly degrade search results. This script measures that against a
+fixed code-search fixture built from this repository: every documented
+function becomes one chunk (its code without the documentation) and one
+query (the first paragraph of its docstring or JSDoc comment), so each
+query has exactly one known relevant chunk among hundreds of distractors.
+
+Usage:
+    # Build the fixture once, from a pinned checkout; it records its own SHA-256
+    python bin/retrieval_eval.py build
+
+    # Record the float32 baseline with the service's default configuration
+    python bin/retrieval_eval.py run --save-baseline
+
+    # Evaluate another configuration against it, failing on regressions
+    python bin/retrieval_eval.py run --option layers=6 --max-mrr-drop 0.03 --min-cosine 0.97
+
+Any /embed option (model, layers, align, ...) can be passed with --option.
+A run refuses a fixture whose content no longer matches its recorded hash
+(or the one given with --fixture-sha256) and a baseline recorded on a
+different fixture.
+The run reports MRR, recall@k, cosine drift from the baseline embeddings and
+embedding throughput, and exits with status 1 when a threshold is violated.
+"""
+
+import os
+import re
+import ast
+import sys
+import json
+import time
+import socket
+import hashlib
+import argparse
+import subprocess
+import http.client
+from pathlib import Path
+
+import numpy as np
+
+FIXTURE_VERSION = 2
+EVAL_DIR = Path(os.environ.get('CLOI_DATA_DIR', Path.home() / '.cloi')) / 'eval'
+DEFAULT_FIXTURE = EVAL_DIR / 'retrieval-fixture.json'
+DEFAULT_BASELINE = EVAL_DIR / 'retrieval-baseline.npz'
+DEFAULT_SOCKET = Path.home() / '.cloi' / 'run' / 'codebert.sock'
+RECALL_KS = (1, 5, 10)
+MIN_QUERY_WORDS = 4
+# Docstring section headers such as 'Args:' or 'Returns:' end the summary
+SECTION_HEADER = re.compile(r'^[A-Z][A-Za-z ]{0,30}:$')
+
+# A JSDoc block directly followed by a function declaration
+JS_FUNCTION = re.compile(
+    r'/\*\*(?P<doc>(?:(?!\*/).)*?)\*/\s*\n(?P<code>[ \t]*(?:export\s+)?(?:default\s+)?(?:async\s+)?function\b[^\n]*)',
+    re.S
+)
+
+def identifier_words(name):
+    """Split a snake_case or camelCase identifier into lowercase words"""
+    return ' '.join(re.sub(r'([a-z0-9])([A-Z])', r'\1 \2', name).replace('_', ' ').lower().split())
+
+def first_paragraph(text, name=None):
+    """
+    The leading prose of a docstring or JSDoc comment, without tags
+
+    Stops at a blank line, a JSDoc tag or a section header. A comment with no
+    prose before its first tag or section falls back to the words of name.
+    """
+    lines = []
+    for line in text.strip().split('\n'):
+        line = line.strip().lstrip('*').strip()
+        if not line:
+            if lines:
+                break
+            continue
+        if line.startswith('@') or SECTION_HEADER.match(line) or line.endswith(':') and lines:
+            break
+        lines.append(line)
+    if not lines and name:
+        return identifier_words(name)
+    return ' '.join(lines)
+
+def python_functions(path, source):
+    """(name, docstring, code without docstring) for documented functions in a Python file"""
+    try:
+        tree = ast.parse(source)
+    except SyntaxError:
+        return
+    lines = source.split('\n')
+    for node in ast.walk(tree):
+        if not isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef)):
+            continue
+        docstring = ast.get_docstring(node)
+        if not docstring or len(node.body) < 2:
+            continue
+        doc_node = node.body[0]
+        code = lines[node.lineno - 1:doc_node.lineno - 1] + lines[doc_node.end_lineno:node.end_lineno]
+        yield node.name, docstring, '\n'.join(code)
+
+def js_functions(path, source):
+    """(name, JSDoc, code) for functions preceded by a JSDoc block in a JavaScript file"""
+    for match in JS_FUNCTION.finditer(source):
+        start = match.start('code')
+        body_start = source.find('{', source.find(')', start))
+        if body_start < 0:
+            continue
+        # Brace matching is enough for the fixture; functions it misjudges are simply longer or shorter
+        depth = 0
+        for end in range(body_start, len(source)):
+            if source[end] == '{':
+                depth += 1
+            elif source[end] == '}':
+                depth -= 1
+                if depth == 0:
+                    break
+        name = re.search(r'function\s*\*?\s*(\w+)', match.group('code'))
+        yield name.group(1) if name else 'anonymous', match.group('doc'), source[start:end + 1]
+
+def build_fixture(root, paths=('bin', 'src'), max_chunk_chars=4000):
+    """Collect documented functions under root into chunks and queries"""
+    root = Path(root)
+    chunks, queries, seen = [], [], set()
+    files = []
+    for base in paths:
+        for dirpath, dirnames, filenames in os.walk(root / base):
+            dirnames[:] = sorted(d for d in dirnames if not d.startswith('.') and d not in ('node_modules', '__pycache__'))
+            files.extend(Path(dirpath) / name for name in sorted(filenames))
+
+    for path in files:
+        extract = python_functions if path.suffix == '.py' else js_functions if path.suffix in ('.js', '.mjs', '.cjs') else None
+        if extract is None:
+            continue
+        try:
+            source = path.read_text(encoding='utf-8')
+        except (OSError, UnicodeDecodeError):
+            continue
+        relative = path.relative_to(root).as_posix()
+        for name, doc, code in extract(relative, source):
+            query = first_paragraph(doc, name)
+            # Duplicate descriptions would make the relevant chunk ambiguous
+            if len(query.split()) < MIN_QUERY_WORDS or query.lower() in seen or len(code) > max_chunk_chars:
+                continue
+            seen.add(query.lower())
+            chunk_id = f'{relative}:{name}'
+            chunks.append({'id': chunk_id, 'path': relative, 'content': code})
+            queries.append({'query': query, 'relevant': [chunk_id]})
+
+    try:
+        revision = subprocess.run(['git', 'rev-parse', 'HEAD'], cwd=root, capture_output=True,
+                                  text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        revision = None
+    fixture = {'version': FIXTURE_VERSION, 'revision': revision, 'chunks': chunks, 'queries': queries}
+    fixture['sha256'] = fixture_digest(fixture)
+    return fixture
+
+def fixture_digest(fixture):
+    """SHA-256 of a fixture's chunks and queries, independent of formatting"""
+    content = json.dumps({'chunks': fixture['chunks'], 'queries': fixture['queries']},
+                         sort_keys=True, separators=(',', ':'), ensure_ascii=False)
+    return hashlib.sha256(content.encode('utf-8')).hexdigest()
+
+class UnixHTTPConnection(http.client.HTTPConnection):
+    """HTTP connection over a Unix domain socket"""
+
+    def __init__(self, path, timeout=300):
+        super().__init__('localhost', timeout=timeout)
+        self.socket_path = path
+
+    def connect(self):
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.settimeout(self.timeout)
+        self.sock.connect(self.socket_path)
+
+class ServiceClient:
+    """Minimal keep-alive JSON client for codebert_service.py over TCP or a Unix socket"""
+
+    def __init__(self, url=None, socket_path=None, timeout=300):
+        if socket_path:
+            self.connection = UnixHTTPConnection(str(socket_path), timeout)
+        else:
+            from urllib.parse import urlparse
+            parsed = urlparse(url or 'http://127.0.0.1:3090')
+            self.connection = http.client.HTTPConnection(parsed.hostname, parsed.port or 80, timeout=timeout)
+
+    def post(self, route, body):
+        """POST a JSON body and return the decoded response, raising on errors"""
+        payload = json.dumps(body).encode()
+        self.connection.request('POST', route, payload, {'Content-Type': 'application/json'})
+        response = self.connection.getresponse()
+        data = json.loads(response.read().decode('utf-8'))
+        if response.status != 200:
+            raise RuntimeError(f"{route} returned {response.status}: {data.get('error')}")
+        return data
+
+    def embed(self, texts, options=None, batch_size=32):
+        """Embed texts in batches; returns (float32 matrix, seconds spent in requests)"""
+        rows = []
+        seconds = 0.0
+        for start in range(0, len(texts), batch_size):
+            began = time.perf_counter()
+            data = self.post('/embed', {'texts': texts[start:start + batch_size], **(options or {})})
+            seconds += time.perf_counter() - began
+            rows.extend(data['embeddings'])
+        return np.asarray(rows, dtype=np.float32), seconds
+
+def normalize(rows):
+    """L2-normalize rows"""
+    return rows / np.maximum(np.linalg.norm(rows, axis=1, keepdims=True), 1e-12)
+
+def retrieval_metrics(chunk_vectors, query_vectors, chunk_ids, queries, ks=RECALL_KS):
+    """MRR and recall@k of cosine search over the fixture chunks"""
+    scores = normalize(query_vectors) @ normalize(chunk_vectors).T
+    position = {chunk_id: i for i, chunk_id in enumerate(chunk_ids)}
+    reciprocal_ranks = []
+    hits = {k: 0 for k in ks}
+    for row, query in zip(scores, queries):
+        relevant = [position[chunk_id] for chunk_id in query['relevant']]
+        # Rank of the best relevant chunk: 1 + number of chunks scored strictly higher
+        rank = 1 + int(min((row > row[i]).sum() for i in relevant))
+        reciprocal_ranks.append(1.0 / rank)
+        for k in ks:
+            hits[k] += rank <= k
+    metrics = {'mrr': float(np.mean(reciprocal_ranks))}
+    metrics.update({f'recall@{k}': hits[k] / len(queries) for k in ks})
+    return metrics
+
+def cosine_drift(vectors, baseline):
+    """Per-row cosine similarity between two embeddings of the same texts"""
+    similarity = np.sum(normalize(vectors) * normalize(baseline), axis=1)
+    return {'mean': float(similarity.mean()), 'min': float(similarity.min()), 'p05': float(np.percentile(similarity, 5))}
+
+def check_thresholds(report, baseline_metrics, args):
+    """List threshold violations of a report"""
+    failures = []
+    metrics = report['metrics']
+    if args.min_mrr is not None and metrics['mrr'] < args.min_mrr:
+        failures.append(f"MRR {metrics['mrr']:.4f} < {args.min_mrr}")
+    if args.min_recall is not None and metrics[f'recall@{args.k}'] < args.min_recall:
+        failures.append(f"recall@{args.k} {metrics[f'recall@{args.k}']:.4f} < {args.min_recall}")
+    if baseline_metrics:
+        mrr_drop = baseline_metrics['mrr'] - metrics['mrr']
+        if mrr_drop > args.max_mrr_drop:
+            failures.append(f"MRR dropped {mrr_drop:.4f} from baseline (max {args.max_mrr_drop})")
+        recall_drop = baseline_metrics[f'recall@{args.k}'] - metrics[f'recall@{args.k}']
+        if recall_drop > args.max_recall_drop:
+            failures.append(f"recall@{args.k} dropped {recall_drop:.4f} from baseline (max {args.max_recall_drop})")
+    drift = report.get('cosine_drift')
+    if drift and drift['mean'] < args.min_cosine:
+        failures.append(f"mean cosine to baseline {drift['mean']:.4f} < {args.min_cosine}")
+    return failures
+
+def parse_options(values):
+    """Parse key=value /embed options, decoding JSON values where possible"""
+    options = {}
+    for value in values or []:
+        key, sep, raw = value.partition('=')
+        if not sep:
+            raise ValueError(f"Invalid option '{value}', expected key=value")
+        try:
+            options[key] = json.loads(raw)
+        except ValueError:
+            options[key] = raw
+    return options
+
+def run(args):
+    with open(args.fixture, 'r', encoding='utf-8') as f:
+        fixture = json.load(f)
+    digest = fixture_digest(fixture)
+    expected = args.fixture_sha256 or fixture.get('sha256')
+    if expected and digest != expected:
+        print(f"Fixture {args.fixture} has SHA-256 {digest}, expected {expected}", file=sys.stderr)
+        return 2
+    chunk_ids = [chunk['id'] for chunk in fixture['chunks']]
+    options = parse_options(args.option)
+    client = ServiceClient(args.url, None if args.url else args.socket)
+
+    chunk_vectors, seconds = client.embed([chunk['content'] for chunk in fixture['chunks']], options, args.batch_size)
+    query_vectors, query_seconds = client.embed([query['query'] for query in fixture['queries']], options, args.batch_size)
+
+    report = {
+        'fixture': str(args.fixture),
+        'fixture_sha256': digest,
+        'revision': fixture.get('revision'),
+        'options': options,
+        'chunks': len(chunk_ids),
+        'queries': len(fixture['queries']),
+        'metrics': retrieval_metrics(chunk_vectors, query_vectors, chunk_ids, fixture['queries']),
+        'throughput': {
+            'chunks_per_second': round(len(chunk_ids) / max(seconds, 1e-9), 2),
+            'queries_per_second': round(len(fixture['queries']) / max(query_seconds, 1e-9), 2)
+        }
+    }
+
+    baseline_metrics = None
+    if args.save_baseline:
+        Path(args.baseline).parent.mkdir(parents=True, exist_ok=True)
+        np.savez(args.baseline, chunks=chunk_vectors, queries=query_vectors, fixture_sha256=digest,
+                 metrics=json.dumps(report['metrics']), options=json.dumps(options))
+        print(f"Saved baseline to {args.baseline}")
+    elif Path(args.baseline).exists():
+        baseline = np.load(args.baseline)
+        # Same count is not enough: the vectors are compared row by row with the same texts
+        if 'fixture_sha256' not in baseline.files or str(baseline['fixture_sha256']) != digest:
+            print(f"Baseline {args.baseline} was recorded with a different fixture; rerun with --save-baseline",
+                  file=sys.stderr)
+            return 2
+        baseline_metrics = json.loads(str(baseline['metrics']))
+        report['baseline'] = baseline_metrics
+        report['cosine_drift'] = cosine_drift(np.concatenate([chunk_vectors, query_vectors]),
+                                              np.concatenate([baseline['chunks'], baseline['queries']]))
+
+    report['failures'] = check_thresholds(report, baseline_metrics, args)
+
+    metrics = report['metrics']
+    print(f"Fixture: {report['chunks']} chunks, {report['queries']} queries (revision {report['revision']})")
+    print(f"Options: {json.dumps(options) if options else 'service defaults'}")
+    print(f"MRR: {metrics['mrr']:.4f}" + (f" (baseline {baseline_metrics['mrr']:.4f})" if baseline_metrics else ''))
+    for k in RECALL_KS:
+        line = f"recall@{k}: {metrics[f'recall@{k}']:.4f}"
+        if baseline_metrics:
+            line += f" (baseline {baseline_metrics[f'recall@{k}']:.4f})"
+        print(line)
+    if 'cosine_drift' in report:
+        drift = report['cosine_drift']
+        print(f"Cosine to baseline: mean {drift['mean']:.4f}, p05 {drift['p05']:.4f}, min {drift['min']:.4f}")
+    print(f"Throughput: {report['throughput']['chunks_per_second']} chunks/s, "
+          f"{report['throughput']['queries_per_second']} queries/s")
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2)
+
+    for failure in report['failures']:
+        print(f"FAIL: {failure}", file=sys.stderr)
+    return 1 if report['failures'] else 0
+
+def main():
+    parser = argparse.ArgumentParser(description='Measure code-search quality of an embedding service configuration')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    build = subparsers.add_parser('build', help='Build the fixture from documented functions in this repository')
+    build.add_argument('--root', type=str, default=str(Path(__file__).resolve().parent.parent), help='Repository root')
+    build.add_argument('--fixture', type=str, default=str(DEFAULT_FIXTURE), help='Fixture file to write')
+
+    evaluate = subparsers.add_parser('run', help='Embed the fixture and report retrieval quality')
+    evaluate.add_argument('--fixture', type=str, default=str(DEFAULT_FIXTURE), help='Fixture file')
+    evaluate.add_argument('--fixture-sha256', type=str, help='Refuse to run unless the fixture content has this SHA-256')
+    evaluate.add_argument('--baseline', type=str, default=str(DEFAULT_BASELINE), help='Baseline embeddings file')
+    evaluate.add_argument('--save-baseline', action='store_true', help='Record this run as the baseline')
+    evaluate.add_argument('--url', type=str, help='Service URL (default: Unix socket, then http://127.0.0.1:3090)')
+    evaluate.add_argument('--socket', type=str, default=str(DEFAULT_SOCKET), help='Service Unix socket')
+    evaluate.add_argument('--option', action='append', help='/embed option as key=value, e.g. layers=6 (repeatable)')
+    evaluate.add_argument('--batch-size', type=int, default=32, help='Texts per /embed request')
+    evaluate.add_argument('-k', type=int, default=10, choices=RECALL_KS, help='Recall cutoff used for thresholds')
+    evaluate.add_argument('--min-mrr', type=float, help='Fail if MRR is below this')
+    evaluate.add_argument('--min-recall', type=float, help='Fail if recall@k is below this')
+    evaluate.add_argument('--max-mrr-drop', type=float, default=0.02, help='Fail if MRR drops more than this from baseline')
+    evaluate.add_argument('--max-recall-drop', type=float, default=0.02,
+                          help='Fail if recall@k drops more than this from baseline')
+    evaluate.add_argument('--min-cosine', type=float, default=0.98,
+                          help='Fail if mean cosine similarity to baseline embeddings is below this')
+    evaluate.add_argument('--output', type=str, help='Write the report as JSON')
+    args = parser.parse_args()
+
+    if args.command == 'build':
+        fixture = build_fixture(args.root)
+        Path(args.fixture).parent.mkdir(parents=True, exist_ok=True)
+        with open(args.fixture, 'w', encoding='utf-8') as f:
+            json.dump(fixture, f, indent=1)
+        print(f"Wrote {len(fixture['queries'])} queries over {len(fixture['chunks'])} chunks to {args.fixture}")
+        print(f"Fixture SHA-256: {fixture['sha256']}")
+        return 0
+
+    if not args.url and not os.path.exists(args.socket):
+        args.url = 'http://127.0.0.1:3090'
+    return run(args)
+
+if __name__ == "__main__":
+    sys.exit(main())
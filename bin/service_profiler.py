@@ -0,0 +1,250 @@
+#!/usr/bin/env python3
+"""
+Profiling Helpers for the Embedding Service
+
+Three tools for diagnosing latency in a running codebert_service.py without
+restarting it or attaching a debugger:
+
+- SamplingProfiler samples the stacks of every Python thread at a fixed
+  interval and exports them in the speedscope file format
+  (https://www.speedscope.app), which also renders them as flame graphs.
+- TorchTrace records torch.profiler traces of the forward passes that run
+  while it is active and merges them into one Chrome trace
+  (chrome://tracing or https://ui.perfetto.dev).
+- StageTimer accumulates per-request stage durations (lock wait, tokenize,
+  forward, pooling, serialization) into a Server-Timing header.
+"""
+
+import os
+import sys
+import json
+import time
+import logging
+import tempfile
+import threading
+from contextlib import contextmanager, ExitStack
+
+SPEEDSCOPE_SCHEMA = 'https://www.speedscope.app/file-format-schema.json'
+DEFAULT_INTERVAL = 0.005
+
+logger = logging.getLogger(__name__)
+
+class SamplingProfiler:
+    """Periodically samples the Python stacks of all threads"""
+
+    def __init__(self, interval=DEFAULT_INTERVAL, exclude=()):
+        self.interval = interval
+        self.exclude = set(exclude)
+        self._frames = []
+        self._frame_index = {}
+        self._samples = {}
+        self._stop = threading.Event()
+        self._thread = None
+        self._started = None
+        self._stopped = None
+
+    def _frame_id(self, code, line):
+        key = (code.co_name, code.co_filename, line)
+        index = self._frame_index.get(key)
+        if index is None:
+            index = self._frame_index[key] = len(self._frames)
+            self._frames.append({'name': code.co_name, 'file': code.co_filename, 'line': line})
+        return index
+
+    def _sample(self, now):
+        for thread_id, frame in sys._current_frames().items():
+            if thread_id in self.exclude:
+                continue
+            stack = []
+            while frame is not None:
+                stack.append(self._frame_id(frame.f_code, frame.f_lineno))
+                frame = frame.f_back
+            stack.reverse()
+            self._samples.setdefault(thread_id, []).append((now, stack))
+
+    def _run(self):
+        self.exclude.add(threading.get_ident())
+        while not self._stop.is_set():
+            self._sample(time.perf_counter())
+            self._stop.wait(self.interval)
+
+    def start(self):
+        """Start sampling in a background thread"""
+        self._started = time.perf_counter()
+        self._thread = threading.Thread(target=self._run, name='sampling-profiler', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """Stop sampling"""
+        self._stop.set()
+        self._thread.join()
+        self._stopped = time.perf_counter()
+
+    def sample_count(self):
+        """Number of stack samples taken across all threads"""
+        return sum(len(samples) for samples in self._samples.values())
+
+    def to_speedscope(self, name='profile'):
+        """Export one sampled profile per thread in the speedscope file format"""
+        thread_names = {thread.ident: thread.name for thread in threading.enumerate()}
+        profiles = []
+        for thread_id, samples in self._samples.items():
+            # Each sample stands for the time until the next one on the same thread
+            times = [t for t, _ in samples] + [self._stopped]
+            weights = [max(times[i + 1] - times[i], 0.0) for i in range(len(samples))]
+            profiles.append({
+                'type': 'sampled',
+                'name': f"{thread_names.get(thread_id, 'thread')} ({thread_id})",
+                'unit': 'seconds',
+                'startValue': 0,
+                'endValue': self._stopped - self._started,
+                'samples': [stack for _, stack in samples],
+                'weights': weights
+            })
+        return {
+            '$schema': SPEEDSCOPE_SCHEMA,
+            'name': name,
+            'exporter': 'cloi service_profiler',
+            'activeProfileIndex': 0,
+            'shared': {'frames': self._frames},
+            'profiles': profiles
+        }
+
+    def top_functions(self, limit=10):
+        """Functions most often found at the top of a stack, as (name, file:line, share)"""
+        counts = {}
+        total = 0
+        for samples in self._samples.values():
+            for _, stack in samples:
+                if stack:
+                    counts[stack[-1]] = counts.get(stack[-1], 0) + 1
+                    total += 1
+        ranked = sorted(counts.items(), key=lambda item: item[1], reverse=True)[:limit]
+        return [
+            {
+                'function': self._frames[index]['name'],
+                'location': f"{self._frames[index]['file']}:{self._frames[index]['line']}",
+                'share': round(count / total, 4)
+            }
+            for index, count in ranked
+        ]
+
+class TorchTrace:
+    """Collects torch.profiler traces of code wrapped in capture() while active"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        # Held while a block is being profiled
+        self._tracing = threading.Lock()
+        self._events = []
+        self.active = False
+
+    def start(self):
+        """Begin collecting traces"""
+        with self._lock:
+            self._events = []
+            self.active = True
+
+    def stop(self):
+        """Stop collecting and return the merged Chrome trace"""
+        with self._lock:
+            self.active = False
+            events, self._events = self._events, []
+        return {'traceEvents': events, 'displayTimeUnit': 'ms'}
+
+    @contextmanager
+    def capture(self, label):
+        """
+        Profile the enclosed block with torch.profiler if a trace is being collected
+
+        torch.profiler allows one active profile per process, so a block that
+        starts while another is being traced on a different thread runs
+        untraced. Profiler errors are logged and never fail the block.
+        """
+        if not self.active or not self._tracing.acquire(blocking=False):
+            yield
+            return
+
+        try:
+            stack = ExitStack()
+            prof = None
+            try:
+                from torch.profiler import profile, record_function, ProfilerActivity
+                prof = stack.enter_context(profile(activities=[ProfilerActivity.CPU], record_shapes=True))
+                stack.enter_context(record_function(label))
+            except Exception as e:
+                logger.warning(f"Could not start torch profiler: {e}")
+                stack.close()
+                prof = None
+
+            try:
+                yield
+            finally:
+                try:
+                    stack.close()
+                except Exception as e:
+                    logger.warning(f"Could not stop torch profiler: {e}")
+                    prof = None
+
+            if prof is not None:
+                try:
+                    self._collect(prof)
+                except Exception as e:
+                    logger.warning(f"Could not export torch trace: {e}")
+        finally:
+            self._tracing.release()
+
+    def _collect(self, prof):
+        """Add the events of a finished profile to the trace"""
+        fd, path = tempfile.mkstemp(suffix='.json')
+        os.close(fd)
+        try:
+            prof.export_chrome_trace(path)
+            with open(path, 'r', encoding='utf-8') as f:
+                events = json.load(f).get('traceEvents', [])
+        finally:
+            os.unlink(path)
+        with self._lock:
+            if self.active:
+                self._events.extend(events)
+
+class StageTimer:
+    """Accumulates time spent in named request stages"""
+
+    def __init__(self):
+        self.started = self._last = time.perf_counter()
+        self.stages = {}
+
+    def lap(self, name):
+        """Attribute the time since the previous lap to a stage"""
+        now = time.perf_counter()
+        self.stages[name] = self.stages.get(name, 0.0) + now - self._last
+        self._last = now
+
+    def server_timing(self):
+        """Format the stages as a Server-Timing header value in milliseconds"""
+        parts = [f"{name};dur={seconds * 1000:.2f}" for name, seconds in self.stages.items()]
+        parts.append(f"total;dur={(time.perf_counter() - self.started) * 1000:.2f}")
+        return ', '.join(parts)
+
+# The stage timer of the request being served on the current thread, if profiled
+_request = threading.local()
+
+def start_request_timer():
+    """Start timing stages of the request on this thread"""
+    _request.timer = StageTimer()
+    return _request.timer
+
+def clear_request_timer():
+    """Stop timing stages on this thread"""
+    _request.timer = None
+
+def current_timer():
+    """The stage timer of this thread's request, or None"""
+    return getattr(_request, 'timer', None)
+
+def lap(name):
+    """Record a stage boundary for the current request; no-op unless it is profiled"""
+    timer = getattr(_request, 'timer', None)
+    if timer is not None:
+        timer.lap(name)
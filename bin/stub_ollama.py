@@ -0,0 +1,224 @@
+#!/usr/bin/env python3
+"""
+Stub Ollama Server
+
+A small stand-in for the parts of the Ollama HTTP API that CLOI's Python
+tools use (/api/version, /api/tags, /api/ps, /api/generate, /api/chat,
+/api/pull), with simulated model load time and per-token generation
+delay. It lets llm_benchmark.py and the other Ollama tooling be exercised
+offline and gives predictable numbers to test against.
+
+Generated text is a deterministic sequence of words; eval_count and the
+duration fields in the final chunk follow Ollama's conventions
+(nanoseconds).
+
+Usage:
+    python bin/stub_ollama.py --port 11434 --model phi4 --model llama3.2:1b
+    python bin/stub_ollama.py --token-delay 0.005 --load-delay 1.5
+"""
+
+import sys
+import json
+import time
+import argparse
+import threading
+from datetime import datetime, timezone
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+from ollama_setup import parse_keep_alive
+
+DEFAULT_KEEP_ALIVE = "5m"
+# Reported per loaded model by /api/ps
+MODEL_SIZE = 512 * 1024 * 1024
+
+def full_name(model):
+    """Ollama's canonical name ('phi4' -> 'phi4:latest')"""
+    return model if ':' in model else model + ':latest'
+
+class StubOllama:
+    """Stub server state: installed and loaded models, timing knobs and request counters"""
+
+    def __init__(self, models=('phi4',), load_delay=0.2, token_delay=0.002, max_tokens=64,
+                 host='127.0.0.1', port=0):
+        """
+        Args:
+            models: Installed model names
+            load_delay: Seconds to "load" a model that is not in memory
+            token_delay: Seconds per generated token
+            max_tokens: Tokens generated when the request sets no num_predict
+            host, port: Address to listen on (port 0 picks a free one)
+        """
+        self.models = [full_name(model) for model in models]
+        # Reported by /api/tags; change one to simulate a re-pulled model
+        self.digests = {name: f'stub-{name}' for name in self.models}
+        self.load_delay = load_delay
+        self.token_delay = token_delay
+        self.max_tokens = max_tokens
+        self.loaded = {}
+        self.requests = []
+        self.active = 0
+        self.peak_active = 0
+        self.lock = threading.Lock()
+        self.load_lock = threading.Lock()
+        self.server = ThreadingHTTPServer((host, port), self._handler())
+        self.server.daemon_threads = True
+        self.url = f"http://{host}:{self.server.server_port}"
+        self._thread = None
+
+    def start(self):
+        """Serve in a background thread; returns self"""
+        self._thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def _load(self, name, keep_alive):
+        """Load a model if needed (loads are serialized, as in Ollama); returns the load time"""
+        with self.load_lock:
+            seconds = 0.0
+            if name not in self.loaded:
+                time.sleep(self.load_delay)
+                seconds = self.load_delay
+            expiry = parse_keep_alive(keep_alive)
+            self.loaded[name] = time.time() + (expiry if expiry >= 0 else 365 * 86400)
+            return seconds
+
+    def _handler(self):
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def log_message(self, *args):
+                pass
+
+            def send_json(self, body, status_code=200):
+                payload = json.dumps(body).encode()
+                self.send_response(status_code)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(payload)))
+                self.end_headers()
+                self.wfile.write(payload)
+
+            def write_chunk(self, data):
+                self.wfile.write(f'{len(data):x}\r\n'.encode() + data + b'\r\n')
+                self.wfile.flush()
+
+            def do_GET(self):
+                stub.requests.append((self.path, None))
+                if self.path == '/api/version':
+                    self.send_json({'version': '0.0.0-stub'})
+                elif self.path == '/api/tags':
+                    self.send_json({'models': [{'name': name, 'model': name,
+                                                'digest': stub.digests.get(name, f'stub-{name}')}
+                                               for name in stub.models]})
+                elif self.path == '/api/ps':
+                    self.send_json({'models': [
+                        {'name': name, 'model': name, 'size': MODEL_SIZE, 'size_vram': 0,
+                         'expires_at': datetime.fromtimestamp(expiry, timezone.utc).isoformat()}
+                        for name, expiry in list(stub.loaded.items()) if expiry > time.time()
+                    ]})
+                else:
+                    self.send_json({'error': 'not found'}, 404)
+
+            def do_POST(self):
+                request = json.loads(self.rfile.read(int(self.headers.get('Content-Length') or 0)) or b'{}')
+                stub.requests.append((self.path, request))
+                if self.path == '/api/pull':
+                    name = full_name(request.get('model') or request.get('name', ''))
+                    if name not in stub.models:
+                        stub.models.append(name)
+                    return self.send_json({'status': 'success'})
+                if self.path not in ('/api/generate', '/api/chat'):
+                    return self.send_json({'error': 'not found'}, 404)
+
+                name = full_name(request.get('model', ''))
+                if name not in stub.models:
+                    return self.send_json({'error': f"model '{request.get('model')}' not found"}, 404)
+                keep_alive = request.get('keep_alive', DEFAULT_KEEP_ALIVE)
+                if parse_keep_alive(keep_alive) == 0:
+                    stub.loaded.pop(name, None)
+                    return self.send_json({'model': name, 'done': True, 'done_reason': 'unload'})
+                started = time.monotonic()
+                load_seconds = stub._load(name, keep_alive)
+                prompt = request.get('prompt') or ''.join(m.get('content', '') for m in request.get('messages', []))
+                if not prompt:
+                    return self.send_json({'model': name, 'response': '', 'done': True, 'done_reason': 'load'})
+                self.generate(request, name, prompt, started, load_seconds)
+
+            def generate(self, request, name, prompt, started, load_seconds):
+                with stub.lock:
+                    stub.active += 1
+                    stub.peak_active = max(stub.peak_active, stub.active)
+                try:
+                    count = int((request.get('options') or {}).get('num_predict') or stub.max_tokens)
+                    is_chat = self.path == '/api/chat'
+                    stream = request.get('stream', True) is not False
+
+                    def piece(text, done):
+                        body = {'model': name, 'created_at': datetime.now(timezone.utc).isoformat(), 'done': done}
+                        if is_chat:
+                            body['message'] = {'role': 'assistant', 'content': text}
+                        else:
+                            body['response'] = text
+                        return body
+
+                    if stream:
+                        self.send_response(200)
+                        self.send_header('Content-Type', 'application/x-ndjson')
+                        self.send_header('Transfer-Encoding', 'chunked')
+                        self.end_headers()
+                    eval_started = time.monotonic()
+                    words = []
+                    for index in range(count):
+                        time.sleep(stub.token_delay)
+                        word = f"tok{index % 10} "
+                        words.append(word)
+                        if stream:
+                            self.write_chunk(json.dumps(piece(word, False)).encode() + b'\n')
+                    final = piece('' if stream else ''.join(words), True)
+                    final.update(
+                        done_reason='length',
+                        total_duration=int((time.monotonic() - started) * 1e9),
+                        load_duration=int(load_seconds * 1e9),
+                        prompt_eval_count=len(prompt.split()),
+                        eval_count=count,
+                        eval_duration=int((time.monotonic() - eval_started) * 1e9)
+                    )
+                    if stream:
+                        self.write_chunk(json.dumps(final).encode() + b'\n')
+                        self.write_chunk(b'')
+                    else:
+                        self.send_json(final)
+                finally:
+                    with stub.lock:
+                        stub.active -= 1
+
+        return Handler
+
+def main():
+    parser = argparse.ArgumentParser(description='Run a stub Ollama server for offline testing')
+    parser.add_argument('--host', type=str, default='127.0.0.1', help='Address to listen on')
+    parser.add_argument('--port', type=int, default=11434, help='Port to listen on (default: 11434)')
+    parser.add_argument('--model', action='append', help='Installed model (repeatable, default: phi4)')
+    parser.add_argument('--load-delay', type=float, default=0.2, help='Seconds to load a model')
+    parser.add_argument('--token-delay', type=float, default=0.002, help='Seconds per generated token')
+    parser.add_argument('--max-tokens', type=int, default=64, help='Tokens per response without num_predict')
+    args = parser.parse_args()
+
+    stub = StubOllama(args.model or ['phi4'], args.load_delay, args.token_delay, args.max_tokens,
+                      args.host, args.port)
+    print(f"Stub Ollama serving {', '.join(stub.models)} on {stub.url}")
+    try:
+        stub.server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        stub.server.server_close()
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,314 @@
+#!/usr/bin/env python3
+"""
+Pre-tokenized Corpus Cache
+
+Tokenizes a repository's chunks once with the fast tokenizer from the
+generated tokenizer.json and stores the token ids packed into a single
+memory-mapped uint16 file (the ~50k RoBERTa vocabulary fits in 16 bits),
+alongside an offsets index and per-chunk content hashes. Embedding runs and
+token-count queries then read ids straight from the cache. Unchanged chunks
+are reused on rebuild; the whole cache is invalidated when the tokenizer
+changes.
+
+Chunks are read as JSON lines with at least a `content` field, e.g. the
+output of src/rag/chunking.js serialized one chunk per line.
+"""
+
+import os
+import sys
+import json
+import hashlib
+import argparse
+from pathlib import Path
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from dedup import DEFAULT_THRESHOLD, find_duplicates
+
+CACHE_VERSION = 1
+TOKENS_FILE = 'tokens.bin'
+OFFSETS_FILE = 'offsets.npy'
+INDEX_FILE = 'index.json'
+MAX_LENGTH = 512
+BATCH_SIZE = 256
+
+def default_tokenizer_path():
+    """Return the tokenizer.json installed by codebert_setup.py"""
+    return Path(os.environ.get('CLOI_DATA_DIR', Path.home() / '.cloi')) / 'models' / 'codebert-base' / 'tokenizer.json'
+
+def file_hash(path):
+    """SHA-256 of a file, used to detect tokenizer changes"""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def content_hash(text):
+    """Stable hash of a chunk's content"""
+    return hashlib.sha256(text.encode('utf-8')).hexdigest()
+
+# Per-process tokenizer, created by the pool initializer
+_worker_tokenizer = None
+
+def _init_worker(tokenizer_path, max_length):
+    global _worker_tokenizer
+    from tokenizers import Tokenizer
+    _worker_tokenizer = Tokenizer.from_file(str(tokenizer_path))
+    _worker_tokenizer.enable_truncation(max_length)
+
+def _encode_batch(texts):
+    """Encode a batch of texts in a worker process and return their id lists"""
+    return [encoding.ids for encoding in _worker_tokenizer.encode_batch(texts)]
+
+class TokenCache:
+    """Packed token-id cache for one repository's chunks"""
+
+    def __init__(self, cache_dir, tokenizer_path=None, max_length=MAX_LENGTH):
+        self.cache_dir = Path(cache_dir)
+        self.tokenizer_path = Path(tokenizer_path or default_tokenizer_path())
+        self.max_length = max_length
+        self._index = None
+        self._tokens = None
+        self._offsets = None
+
+    @property
+    def index(self):
+        """Cache metadata: tokenizer hash, dtype and per-chunk records"""
+        if self._index is None:
+            try:
+                with open(self.cache_dir / INDEX_FILE, 'r', encoding='utf-8') as f:
+                    self._index = json.load(f)
+            except (OSError, ValueError):
+                self._index = None
+        return self._index
+
+    def is_valid(self):
+        """True if the cache exists and was built with the current tokenizer"""
+        index = self.index
+        return bool(
+            index
+            and index.get('version') == CACHE_VERSION
+            and index.get('tokenizer_hash') == file_hash(self.tokenizer_path)
+            and index.get('max_length') == self.max_length
+        )
+
+    def _open(self):
+        """Memory-map the token and offset arrays"""
+        if self._tokens is None:
+            dtype = np.dtype(self.index['dtype'])
+            tokens_path = self.cache_dir / TOKENS_FILE
+            if tokens_path.stat().st_size:
+                self._tokens = np.memmap(tokens_path, dtype=dtype, mode='r')
+            else:
+                self._tokens = np.zeros(0, dtype=dtype)
+            self._offsets = np.load(self.cache_dir / OFFSETS_FILE, mmap_mode='r')
+        return self._tokens, self._offsets
+
+    def close(self):
+        """Drop the memory maps and cached index"""
+        self._index = self._tokens = self._offsets = None
+
+    def __len__(self):
+        return len(self.index['chunks']) if self.index else 0
+
+    def chunks(self):
+        """Per-chunk records (id, content hash, token count and any passthrough fields)"""
+        return self.index['chunks']
+
+    def ids(self, i):
+        """Token ids of chunk i as a read-only view into the cache"""
+        tokens, offsets = self._open()
+        return tokens[offsets[i]:offsets[i + 1]]
+
+    def token_counts(self):
+        """Token counts of all chunks, computed from the offsets alone"""
+        _, offsets = self._open()
+        return np.diff(offsets)
+
+    def iter_batches(self, batch_size=32, order=None):
+        """
+        Yield (indices, input_ids, attention_mask) int64 arrays padded per batch
+
+        Passing order (e.g. indices sorted by length) reduces padding.
+        """
+        tokens, offsets = self._open()
+        pad_id = self.index.get('pad_id', 1)
+        order = np.arange(len(self)) if order is None else np.asarray(order)
+        for start in range(0, len(order), batch_size):
+            indices = order[start:start + batch_size]
+            lengths = offsets[indices + 1] - offsets[indices]
+            width = max(int(lengths.max()), 1)
+            input_ids = np.full((len(indices), width), pad_id, dtype=np.int64)
+            attention_mask = np.zeros((len(indices), width), dtype=np.int64)
+            for row, (i, length) in enumerate(zip(indices, lengths)):
+                input_ids[row, :length] = tokens[offsets[i]:offsets[i + 1]]
+                attention_mask[row, :length] = 1
+            yield indices, input_ids, attention_mask
+
+    def build(self, chunks, workers=None):
+        """
+        Tokenize chunks into the cache, reusing ids of unchanged content
+
+        Args:
+            chunks: Iterable of dicts with a 'content' field; other fields are kept in the index
+            workers: Number of tokenizer processes (default: CPU count)
+
+        Returns a dict with the number of chunks tokenized and reused.
+        """
+        from tokenizers import Tokenizer
+
+        tokenizer_hash = file_hash(self.tokenizer_path)
+        tokenizer = Tokenizer.from_file(str(self.tokenizer_path))
+        vocab_size = tokenizer.get_vocab_size()
+        dtype = np.uint16 if vocab_size <= np.iinfo(np.uint16).max + 1 else np.uint32
+        pad_id = tokenizer.token_to_id('<pad>')
+
+        # Ids of unchanged chunks can be copied from the previous cache
+        previous = {}
+        if self.is_valid():
+            for i, record in enumerate(self.chunks()):
+                previous.setdefault(record['content_hash'], i)
+
+        records = []
+        texts = []
+        for chunk in chunks:
+            record = {key: value for key, value in chunk.items() if key != 'content'}
+            record['content_hash'] = content_hash(chunk['content'])
+            records.append(record)
+            texts.append(chunk['content'])
+
+        missing = [i for i, record in enumerate(records) if record['content_hash'] not in previous]
+        encoded = {}
+        if missing:
+            batches = [missing[start:start + BATCH_SIZE] for start in range(0, len(missing), BATCH_SIZE)]
+            with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                                     initargs=(self.tokenizer_path, self.max_length)) as pool:
+                results = pool.map(_encode_batch, [[texts[i] for i in batch] for batch in batches])
+                for batch, ids in zip(batches, results):
+                    encoded.update(zip(batch, ids))
+
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        tmp_tokens = self.cache_dir / (TOKENS_FILE + '.tmp')
+        offsets = np.zeros(len(records) + 1, dtype=np.int64)
+        with open(tmp_tokens, 'wb') as out:
+            for i, record in enumerate(records):
+                if i in encoded:
+                    ids = np.asarray(encoded[i], dtype=dtype)
+                else:
+                    ids = np.asarray(self.ids(previous[record['content_hash']]), dtype=dtype)
+                out.write(ids.tobytes())
+                record['tokens'] = int(len(ids))
+                offsets[i + 1] = offsets[i] + len(ids)
+
+        # Release maps of the old cache before replacing its files
+        self.close()
+        tmp_offsets = self.cache_dir / ('offsets.tmp.npy')
+        np.save(tmp_offsets, offsets)
+        os.replace(tmp_tokens, self.cache_dir / TOKENS_FILE)
+        os.replace(tmp_offsets, self.cache_dir / OFFSETS_FILE)
+
+        index = {
+            'version': CACHE_VERSION,
+            'tokenizer_hash': tokenizer_hash,
+            'max_length': self.max_length,
+            'dtype': np.dtype(dtype).name,
+            'pad_id': pad_id if pad_id is not None else 1,
+            'total_tokens': int(offsets[-1]),
+            'chunks': records
+        }
+        tmp_index = self.cache_dir / (INDEX_FILE + '.tmp')
+        with open(tmp_index, 'w', encoding='utf-8') as f:
+            json.dump(index, f)
+        os.replace(tmp_index, self.cache_dir / INDEX_FILE)
+        self._index = index
+
+        return {'tokenized': len(encoded), 'reused': len(records) - len(encoded), 'total_tokens': int(offsets[-1])}
+
+def embed_cache(cache, model_dir, output_file, batch_size=32, dedup=None):
+    """
+    Embed every cached chunk straight from the token ids and save an N x hidden float32 .npy
+
+    Chunks are batched in length order to minimise padding; rows keep the cache order.
+    With a dedup threshold, duplicate and near-duplicate chunks copy the embedding of
+    their group's representative instead of being embedded (see dedup.py).
+
+    Returns the output shape and the dedup report (or None).
+    """
+    import torch
+    from transformers import AutoModel
+
+    model = AutoModel.from_pretrained(str(model_dir), local_files_only=True)
+    model.eval()
+
+    counts = cache.token_counts()
+    order = np.argsort(counts)
+    plan = None
+    if dedup:
+        plan = find_duplicates([cache.ids(i) for i in range(len(cache))], dedup)
+        order = plan.representatives[np.argsort(counts[plan.representatives])]
+        groups = plan.members()
+
+    embeddings = np.lib.format.open_memmap(output_file, mode='w+', dtype=np.float32,
+                                           shape=(len(cache), model.config.hidden_size))
+    with torch.no_grad():
+        for indices, input_ids, attention_mask in cache.iter_batches(batch_size, order):
+            mask = torch.from_numpy(attention_mask)
+            hidden = model(input_ids=torch.from_numpy(input_ids), attention_mask=mask).last_hidden_state
+            mask = mask.unsqueeze(-1).to(hidden.dtype)
+            pooled = (hidden * mask).sum(dim=1) / torch.clamp(mask.sum(dim=1), min=1e-9)
+            rows = torch.nn.functional.normalize(pooled, p=2, dim=1).numpy()
+            if plan is not None:
+                indices, rows = plan.expand(indices, rows, groups)
+            embeddings[indices] = rows
+    embeddings.flush()
+    return embeddings.shape, plan.report() if plan is not None else None
+
+def read_chunks(path):
+    """Read chunk records from a JSON lines file ('-' for stdin)"""
+    stream = sys.stdin if path == '-' else open(path, 'r', encoding='utf-8')
+    try:
+        return [json.loads(line) for line in stream if line.strip()]
+    finally:
+        if stream is not sys.stdin:
+            stream.close()
+
+def main():
+    parser = argparse.ArgumentParser(description='Build and query the pre-tokenized corpus cache')
+    parser.add_argument('--cache-dir', type=str, required=True, help='Cache directory for one repository')
+    parser.add_argument('--tokenizer', type=str, help='Path to tokenizer.json (default: installed CodeBERT tokenizer)')
+    parser.add_argument('--chunks', type=str, help="JSON lines file of chunks to tokenize ('-' for stdin)")
+    parser.add_argument('--workers', type=int, help='Number of tokenizer processes')
+    parser.add_argument('--counts', action='store_true', help='Print per-chunk token counts from the cache')
+    parser.add_argument('--embed-output', type=str, help='Embed all cached chunks with CodeBERT into this .npy file')
+    parser.add_argument('--model-dir', type=str, help='Model directory for --embed-output')
+    parser.add_argument('--dedup', type=float, nargs='?', const=DEFAULT_THRESHOLD,
+                        help='Embed one chunk per duplicate group, grouping near duplicates at this Jaccard threshold')
+    args = parser.parse_args()
+
+    cache = TokenCache(args.cache_dir, args.tokenizer)
+    if args.chunks:
+        stats = cache.build(read_chunks(args.chunks), args.workers)
+        print(f"Tokenized {stats['tokenized']} chunks, reused {stats['reused']} ({stats['total_tokens']} tokens)")
+
+    if (args.counts or args.embed_output) and not cache.is_valid():
+        print("Token cache is missing or was built with a different tokenizer", file=sys.stderr)
+        return 1
+
+    if args.embed_output:
+        model_dir = args.model_dir or cache.tokenizer_path.parent
+        shape, report = embed_cache(cache, model_dir, args.embed_output, dedup=args.dedup)
+        print(f"Wrote {shape[0]} x {shape[1]} embeddings to {args.embed_output}")
+        if report:
+            print(f"Dedup: embedded {report['embedded']} of {report['chunks']} chunks "
+                  f"({report['exact_duplicates']} exact, {report['near_duplicates']} near duplicates), "
+                  f"{report['compute_saved']:.1%} of tokens saved")
+
+    if args.counts:
+        for record, count in zip(cache.chunks(), cache.token_counts()):
+            print(json.dumps({'id': record.get('id'), 'tokens': int(count)}))
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -13,6 +13,8 @@ from pathlib import Path
 import subprocess
 import importlib.util
 
+from model_registry import ModelRegistry, resolve_snapshot
+
 # Check if required packages are installed
 def check_required_packages():
     required_packages = ['transformers', 'huggingface_hub']
@@ -39,36 +41,47 @@ def check_required_packages():
 # Check for required packages
 check_required_packages()
 
-# Now import the required packages
-try:
-    from transformers import (
-        AutoTokenizer, 
-        AutoModel,
-        RobertaTokenizer,
-        RobertaTokenizerFast
-    )
-    from huggingface_hub import snapshot_download
-except ImportError as e:
-    print(f"Error importing required packages: {e}")
-    print("Please ensure you have the correct versions installed:")
-    print("pip install transformers==4.38.2 huggingface_hub==0.21.4 torch==2.2.1")
-    sys.exit(1)
+# Heavy imports are deferred until a model actually needs processing, so that
+# registry hits on a warm machine do not pay for importing transformers/torch
+AutoTokenizer = AutoModel = RobertaTokenizer = RobertaTokenizerFast = snapshot_download = None
+HAS_BACKEND = None
+
+def load_backends():
+    """Import transformers, huggingface_hub and (optionally) PyTorch on first use"""
+    global AutoTokenizer, AutoModel, RobertaTokenizer, RobertaTokenizerFast, snapshot_download, HAS_BACKEND
+    if HAS_BACKEND is not None:
+        return
+
+    # Now import the required packages
+    try:
+        from transformers import (
+            AutoTokenizer, 
+            AutoModel,
+            RobertaTokenizer,
+            RobertaTokenizerFast
+        )
+        from huggingface_hub import snapshot_download
+    except ImportError as e:
+        print(f"Error importing required packages: {e}")
+        print("Please ensure you have the correct versions installed:")
+        print("pip install transformers==4.38.2 huggingface_hub==0.21.4 torch==2.2.1")
+        sys.exit(1)
 
-# Check if PyTorch/TensorFlow is available - we can still generate tokenizer.json without them
-HAS_BACKEND = True
-try:
-    import torch
-except ImportError:
-    print("WARNING: PyTorch not found. Only tokenizer generation will be available.")
-    print("For full functionality, install PyTorch: pip install torch==2.2.1")
-    HAS_BACKEND = False
+    # Check if PyTorch/TensorFlow is available - we can still generate tokenizer.json without them
+    HAS_BACKEND = True
+    try:
+        import torch
+    except ImportError:
+        print("WARNING: PyTorch not found. Only tokenizer generation will be available.")
+        print("For full functionality, install PyTorch: pip install torch==2.2.1")
+        HAS_BACKEND = False
 
 # Models to process - Only use the base CodeBERT model for code search
 CODEBERT_MODELS = [
     "microsoft/codebert-base"  # Base model is best for code search/semantic understanding
 ]
 
-def download_and_fix_model(model_name, cache_dir=None, force_download=False):
+def download_and_fix_model(model_name, cache_dir=None, force_download=False, registry=None, revalidate=False):
     """
     Download a CodeBERT/GraphCodeBERT model and generate missing tokenizer.json
     
@@ -76,8 +89,19 @@ def download_and_fix_model(model_name, cache_dir=None, force_download=False):
         model_name (str): The model name/path on Hugging Face
         cache_dir (str, optional): Directory to cache models
         force_download (bool): Whether to force re-download
+        registry (ModelRegistry, optional): Registry consulted before and updated after processing
+        revalidate (bool): Re-run validation even if the registry says the model is ready
     """
     print(f"\n=== Processing {model_name} ===")
+
+    # A validated registry entry whose snapshot still exists means there is nothing to do
+    if registry is not None and not (force_download or revalidate) and registry.is_ready(model_name, cache_dir):
+        entry = registry.get(model_name, cache_dir)
+        print(f"✓ {model_name} already validated at {entry['snapshot_path']} (use --revalidate to re-check)")
+        return True
+
+    load_backends()
+    validation = {'tokenizer': None, 'model': None}
     
     try:
         # Set up cache directory
@@ -108,6 +132,7 @@ def download_and_fix_model(model_name, cache_dir=None, force_download=False):
                 cache_dir=cache_dir
             )
             print("✓ Fast tokenizer loaded successfully")
+            validation['tokenizer'] = 'fast'
         except Exception as e1:
             print(f"Fast tokenizer failed: {e1}")
             try:
@@ -118,6 +143,7 @@ def download_and_fix_model(model_name, cache_dir=None, force_download=False):
                     cache_dir=cache_dir
                 )
                 print("✓ Slow tokenizer loaded successfully")
+                validation['tokenizer'] = 'slow'
             except Exception as e2:
                 print(f"Slow tokenizer also failed: {e2}")
                 # Try RoBERTa tokenizer specifically (CodeBERT is based on RoBERTa)
@@ -128,6 +154,7 @@ def download_and_fix_model(model_name, cache_dir=None, force_download=False):
                         cache_dir=cache_dir
                     )
                     print("✓ RoBERTa tokenizer loaded as fallback")
+                    validation['tokenizer'] = 'roberta-fallback'
                 except Exception as e3:
                     print(f"RoBERTa tokenizer failed: {e3}")
                     raise Exception(f"All tokenizer loading attempts failed")
@@ -217,6 +244,11 @@ def download_and_fix_model(model_name, cache_dir=None, force_download=False):
                 test_code = "def hello(): print('Hello, world!')"
                 tokens = tokenizer(test_code, return_tensors="pt")
                 print(f"  - Test tokenization successful: {tokens['input_ids'].shape}")
+                validation['model'] = {
+                    'type': type(model).__name__,
+                    'hidden_size': model.config.hidden_size,
+                    'vocab_size': model.config.vocab_size
+                }
             except Exception as e:
                 print(f"✗ Model loading failed: {e}")
                 print("This is expected without PyTorch, but tokenizer.json may still be generated correctly")
@@ -232,6 +264,10 @@ def download_and_fix_model(model_name, cache_dir=None, force_download=False):
         # Return true if we've made it this far and generated the tokenizer.json file
         if os.path.exists(tokenizer_json_path):
             print(f"✓ Successfully generated tokenizer.json at {tokenizer_json_path}")
+            if registry is not None:
+                # Ready only once both the tokenizer and the model loaded; otherwise re-checked next run
+                validation['ok'] = validation['tokenizer'] is not None and validation['model'] is not None
+                registry.record(model_name, model_path, Path(model_path).name, validation, cache_dir)
             return True
             
     except Exception as e:
@@ -243,37 +279,20 @@ def copy_tokenizer_to_huggingface_cache(model_name, source_path, target_cache_di
     Copy generated tokenizer.json to Hugging Face cache directory
     """
     try:
-        from huggingface_hub import cached_download
         import shutil
         
-        if target_cache_dir is None:
-            # Use default Hugging Face cache
-            from huggingface_hub.constants import HUGGINGFACE_HUB_CACHE
-            target_cache_dir = HUGGINGFACE_HUB_CACHE
-        
-        # Find the model's cache directory
-        model_cache_pattern = f"models--{model_name.replace('/', '--')}"
-        
-        # Look for the model directory in the cache
-        for root, dirs, _ in os.walk(target_cache_dir):
-            for dir_name in dirs:
-                if dir_name.startswith(model_cache_pattern):
-                    model_cache_dir = os.path.join(root, dir_name, "snapshots")
-                    
-                    # Find the latest snapshot
-                    if os.path.exists(model_cache_dir):
-                        snapshots = os.listdir(model_cache_dir)
-                        if snapshots:
-                            latest_snapshot = os.path.join(model_cache_dir, snapshots[0])
-                            target_path = os.path.join(latest_snapshot, "tokenizer.json")
-                            
-                            # Copy the file
-                            shutil.copy2(source_path, target_path)
-                            print(f"✓ Copied tokenizer.json to cache: {target_path}")
-                            return True
+        # Resolve the snapshot the main ref points at, directly from the cache layout
+        snapshot_path, _ = resolve_snapshot(model_name, target_cache_dir)
+        if snapshot_path is None:
+            print("✗ Could not find model cache directory")
+            return False
+
+        target_path = snapshot_path / "tokenizer.json"
         
-        print("✗ Could not find model cache directory")
-        return False
+        # Copy the file
+        shutil.copy2(source_path, target_path)
+        print(f"✓ Copied tokenizer.json to cache: {target_path}")
+        return True
     
     except Exception as e:
         print(f"✗ Failed to copy tokenizer to cache: {e}")
@@ -290,9 +309,13 @@ def main():
     parser.add_argument("--all", action="store_true", help="Process all supported models")
     parser.add_argument("--cache-dir", type=str, help="Directory to cache models")
     parser.add_argument("--force", action="store_true", help="Force re-download of models")
+    parser.add_argument("--revalidate", action="store_true",
+                        help="Re-run tokenizer and model validation even for models already in the registry")
+    parser.add_argument("--registry", type=str, help="Model registry file (default: ~/.cloi/models/registry.json)")
     
     # Parse arguments
     args = parser.parse_args()
+    registry = ModelRegistry(args.registry)
     
     if args.all:
         # Process all models
@@ -300,14 +323,14 @@ def main():
         success_count = 0
         
         for model_name in CODEBERT_MODELS:
-            if download_and_fix_model(model_name, args.cache_dir, args.force):
+            if download_and_fix_model(model_name, args.cache_dir, args.force, registry, args.revalidate):
                 success_count += 1
         
         print(f"\nProcessed {len(CODEBERT_MODELS)} models, {success_count} successful")
     
     elif args.model:
         # Process a single model
-        download_and_fix_model(args.model, args.cache_dir, args.force)
+        download_and_fix_model(args.model, args.cache_dir, args.force, registry, args.revalidate)
     
     else:
         # No model specified
@@ -318,6 +341,7 @@ def test_models():
     """
     Test function to verify models work after generation
     """
+    load_backends()
     if not HAS_BACKEND:
         print("\nSkipping model tests because PyTorch is not available")
         print("To test models fully, install PyTorch: pip install torch==2.2.1")
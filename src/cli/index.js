@@ -85,6 +85,11 @@ const __dirname = dirname(__filename);
  * Main unified CLI entry point
  */
 async function main() {
+  // Let a running CodeBERT service reload an idle-unloaded model while the command starts up
+  import('../rag/embeddings.js')
+    .then(({ warmCodeBERTService }) => warmCodeBERTService())
+    .catch(() => {});
+
   const argv = yargs(hideBin(process.argv))
     .scriptName('cloi')
     .usage('$0 <command> [options]')
@@ -10,6 +10,8 @@
 // import { pipeline } from '@huggingface/transformers'; // Moved to conditional import
 import path from 'path';
 import fs from 'fs';
+import os from 'os';
+import http from 'http';
 // import seedrandom from 'seedrandom'; // Moved to conditional import
 import { chunkCodeFile } from './chunking.js';
 
@@ -17,12 +19,131 @@ import { chunkCodeFile } from './chunking.js';
 const MAX_LENGTH = 512; // Maximum sequence length for CodeBERT
 const EMBEDDING_DIMENSION = 768; // CodeBERT embedding dimension
 const BATCH_SIZE = 4; // Batch size for processing
+const CODEBERT_PORT = 3090; // TCP port of the CodeBERT service
+const CODEBERT_SOCKET = process.env.CLOI_CODEBERT_SOCKET ||
+  path.join(os.homedir(), '.cloi', 'run', 'codebert.sock'); // Unix domain socket of the CodeBERT service
+const READINESS_TTL_MS = 30000; // How long a successful health check or request counts as "ready"
+
+// Persistent connections to the local CodeBERT service
+const serviceAgent = new http.Agent({ keepAlive: true, maxSockets: 8 });
+let serviceTarget = null; // { socketPath } or { host, port }, resolved on readiness checks
+let serviceReadyAt = 0;
 
 // Cache for the model to avoid reloading
 let embeddingModel = null;
 let currentModel = null;
 let modelType = null; // 'codebert'
 
+/**
+ * Pick how to reach the service: the Unix domain socket when present, TCP otherwise
+ * @returns {Object} http.request connection options
+ */
+function resolveServiceTarget() {
+  return fs.existsSync(CODEBERT_SOCKET)
+    ? { socketPath: CODEBERT_SOCKET }
+    : { host: '127.0.0.1', port: CODEBERT_PORT };
+}
+
+/**
+ * Send a JSON request to the CodeBERT service over a kept-alive connection
+ * @param {string} method - HTTP method
+ * @param {string} route - Request path, e.g. '/embed'
+ * @param {Object} body - Optional JSON body
+ * @param {number} timeout - Socket timeout in milliseconds
+ * @returns {Promise<Object>} Status code and parsed JSON body
+ */
+function serviceRequest(method, route, body = null, timeout = 30000) {
+  const payload = body ? JSON.stringify(body) : null;
+  serviceTarget = serviceTarget || resolveServiceTarget();
+  
+  return new Promise((resolve, reject) => {
+    const request = http.request({
+      ...serviceTarget,
+      method,
+      path: route,
+      agent: serviceAgent,
+      timeout,
+      headers: payload
+        ? { 'Content-Type': 'application/json', 'Content-Length': Buffer.byteLength(payload) }
+        : {}
+    }, (response) => {
+      const chunks = [];
+      response.on('data', (chunk) => chunks.push(chunk));
+      response.on('end', () => {
+        try {
+          resolve({ status: response.statusCode, data: JSON.parse(Buffer.concat(chunks).toString('utf-8')) });
+        } catch (error) {
+          reject(new Error(`Invalid JSON from CodeBERT service: ${error.message}`));
+        }
+      });
+    });
+    request.on('timeout', () => request.destroy(new Error(`CodeBERT service timed out after ${timeout}ms`)));
+    request.on('error', reject);
+    if (payload) {
+      request.write(payload);
+    }
+    request.end();
+  });
+}
+
+/**
+ * Check whether the service is ready, reusing a recent positive answer
+ * @returns {Promise<boolean>} Whether the service answered /health
+ */
+async function isServiceReady() {
+  if (Date.now() - serviceReadyAt < READINESS_TTL_MS) {
+    return true;
+  }
+  serviceTarget = resolveServiceTarget();
+  try {
+    const { status } = await serviceRequest('GET', '/health', null, 1000);
+    if (status === 200) {
+      serviceReadyAt = Date.now();
+      return true;
+    }
+  } catch (e) {
+    // Not reachable
+  }
+  return false;
+}
+
+/**
+ * Wait for the service to become ready, polling with exponential backoff
+ * @param {number} timeoutMs - Maximum time to wait
+ * @returns {Promise<boolean>} Whether the service became ready in time
+ */
+async function waitForService(timeoutMs = 30000) {
+  const deadline = Date.now() + timeoutMs;
+  let delay = 50;
+  while (Date.now() < deadline) {
+    if (await isServiceReady()) {
+      return true;
+    }
+    await new Promise((resolve) => setTimeout(resolve, delay));
+    delay = Math.min(delay * 2, 1000);
+  }
+  return false;
+}
+
+/**
+ * Ask a running CodeBERT service to reload its model ahead of the first request.
+ * The service may have unloaded an idle model; /warm starts the reload in the
+ * background and answers at once. Never starts the service and never throws.
+ * @returns {Promise<boolean>} Whether a running service accepted the request
+ */
+export async function warmCodeBERTService() {
+  if (!fs.existsSync(CODEBERT_SOCKET)) {
+    return false;
+  }
+  try {
+    serviceTarget = { socketPath: CODEBERT_SOCKET };
+    const { status } = await serviceRequest('POST', '/warm', null, 1000);
+    return status === 200 || status === 202;
+  } catch (e) {
+    return false;
+  }
+}
+
 /**
  * Start the CodeBERT Python service
  * @returns {Promise<void>}
@@ -33,8 +154,6 @@ export async function startCodeBERTService() {
   const fs = await import('fs');
   const { fileURLToPath } = await import('url');
   
-  const CODEBERT_PORT = 3090;
-  
   // Get the Cloi installation directory (not current working directory)
   const __filename = fileURLToPath(import.meta.url);
   const __dirname = path.dirname(__filename);
@@ -49,7 +168,7 @@ export async function startCodeBERTService() {
   }
   
   // Start the Python service
-  const pythonProcess = spawn('python', [scriptPath, '--port', CODEBERT_PORT], {
+  const pythonProcess = spawn('python', [scriptPath, '--port', CODEBERT_PORT, '--socket', CODEBERT_SOCKET], {
     detached: true,
     stdio: 'ignore'
   });
@@ -87,11 +206,19 @@ export async function initializeCodeModel() {
       throw new Error(`Model directory not found at ${modelFilesDir}. Please run: npm run codebert-setup`);
     }
     
-    // Verify PyTorch model exists
-    const pytorchFile = path.join(modelFilesDir, 'pytorch_model.bin');
+    // The artifact manifest written by codebert_setup.py lists every installed file
+    const manifestPath = path.join(modelFilesDir, 'manifest.json');
+    let installedFiles = null;
+    try {
+      installedFiles = JSON.parse(fs.readFileSync(manifestPath, 'utf-8')).files || null;
+    } catch (e) {
+      // No manifest (older install), fall back to probing the files
+    }
+    const hasFile = (file) => installedFiles ? file in installedFiles : fs.existsSync(path.join(modelFilesDir, file));
     
-    if (!fs.existsSync(pytorchFile)) {
-      throw new Error(`PyTorch model file not found at ${pytorchFile}. Please run: npm run codebert-setup`);
+    // Verify PyTorch weights exist (safetensors after conversion, pickle otherwise)
+    if (!hasFile('model.safetensors') && !hasFile('pytorch_model.bin')) {
+      throw new Error(`PyTorch model weights not found in ${modelFilesDir}. Please run: npm run codebert-setup`);
     }
     
     // Verify other required files
@@ -102,28 +229,15 @@ export async function initializeCodeModel() {
     ];
     
     for (const file of requiredFiles) {
-      const filePath = path.join(modelFilesDir, file);
-      if (!fs.existsSync(filePath)) {
+      if (!hasFile(file)) {
         throw new Error(`Required file not found: ${file}. Please run: npm run codebert-setup`);
       }
     }
     
-    // Port for the CodeBERT service
-    const CODEBERT_PORT = 3090;
-    const CODEBERT_URL = `http://localhost:${CODEBERT_PORT}`;
-    
     // Start the Python service if it's not already running
     
     // Try to connect to the service first to see if it's already running
-    let serviceRunning = false;
-    try {
-      const response = await fetch(`${CODEBERT_URL}/health`);
-      if (response.ok) {
-        serviceRunning = true;
-      }
-    } catch (e) {
-      // Service not running, will start it below
-    }
+    const serviceRunning = await isServiceReady();
     
     // Start the service if it's not running
     if (!serviceRunning) {
@@ -142,7 +256,7 @@ export async function initializeCodeModel() {
       }
       
       // Start the Python service
-      const pythonProcess = spawn('python', [scriptPath, '--port', CODEBERT_PORT]);
+      const pythonProcess = spawn('python', [scriptPath, '--port', CODEBERT_PORT, '--socket', CODEBERT_SOCKET]);
       
       // Log stdout and stderr
       pythonProcess.stdout.on('data', (data) => {
@@ -162,40 +276,32 @@ export async function initializeCodeModel() {
       
       // Wait for the service to start
       console.log('Waiting for CodeBERT service to start...');
-      await new Promise((resolve) => setTimeout(resolve, 3000));
+      await waitForService();
     }
     
     // Create a client for the CodeBERT service
     embeddingModel = async function(text, options = {}) {
       try {
-        // Check if service is running first
-        let serviceRunning = false;
+        // Call the Python service directly; readiness is only re-checked when a request fails
+        let response;
         try {
-          const healthCheck = await fetch(`${CODEBERT_URL}/health`, { timeout: 1000 });
-          serviceRunning = healthCheck.ok;
+          response = await serviceRequest('POST', '/embed', { text });
         } catch (e) {
-          // Try to start the service if it's not running
-          await startCodeBERTService();
-          // Wait a bit longer for it to initialize
-          await new Promise(resolve => setTimeout(resolve, 5000));
+          // Connection failed: start the service if it's not running and retry once
+          serviceReadyAt = 0;
+          if (!(await isServiceReady())) {
+            await startCodeBERTService();
+            await waitForService();
+          }
+          response = await serviceRequest('POST', '/embed', { text });
         }
         
-
-        
-        // Call the Python service to get embeddings
-        const response = await fetch(`${CODEBERT_URL}/embed`, {
-          method: 'POST',
-          headers: {
-            'Content-Type': 'application/json'
-          },
-          body: JSON.stringify({ text })
-        });
-        
-        if (!response.ok) {
-          throw new Error(`Service returned ${response.status}: ${response.statusText}`);
+        if (response.status !== 200) {
+          throw new Error(`Service returned ${response.status}: ${response.data.error || 'unknown error'}`);
         }
+        serviceReadyAt = Date.now();
         
-        const data = await response.json();
+        const data = response.data;
         if (!data.embedding) {
           throw new Error('No embedding returned from service');
         }
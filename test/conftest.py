@@ -0,0 +1,87 @@
+"""Pytest configuration for the Python helpers in bin/"""
+
+import sys
+import json
+import threading
+from pathlib import Path
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+import pytest
+
+# The Python tooling lives in bin/ as standalone scripts rather than a package
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / 'bin'))
+
+
+class JSONStub:
+    """
+    In-process HTTP/1.1 server answering JSON requests through a handler function
+
+    handle(method, path, body) returns (status, body) with body a JSON-encodable
+    value; requests are recorded as (method, path, body). While dead is set every
+    request gets a 503 and its connection is closed, like a service that crashed
+    behind a client's keep-alive pool.
+    """
+
+    def __init__(self, handle):
+        self.handle = handle
+        self.requests = []
+        self.dead = False
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def log_message(self, *args):
+                pass
+
+            def respond(self, method):
+                length = int(self.headers.get('Content-Length') or 0)
+                body = json.loads(self.rfile.read(length)) if length else None
+                stub.requests.append((method, self.path, body))
+                if stub.dead:
+                    status, answer = 503, {'error': 'down'}
+                else:
+                    status, answer = stub.handle(method, self.path, body)
+                payload = json.dumps(answer).encode()
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(payload)))
+                if stub.dead:
+                    self.send_header('Connection', 'close')
+                    self.close_connection = True
+                self.end_headers()
+                self.wfile.write(payload)
+
+            def do_GET(self):
+                self.respond('GET')
+
+            def do_POST(self):
+                self.respond('POST')
+
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.server.daemon_threads = True
+        self.url = f"http://127.0.0.1:{self.server.server_port}"
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def paths(self):
+        """Paths requested so far"""
+        return [path for _, path, _ in self.requests]
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+@pytest.fixture
+def json_stub():
+    """Factory for JSONStub servers that are shut down after the test"""
+    servers = []
+
+    def make(handle):
+        server = JSONStub(handle)
+        servers.append(server)
+        return server
+
+    yield make
+    for server in servers:
+        server.close()
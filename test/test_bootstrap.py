@@ -0,0 +1,142 @@
+"""
+Tests for the parallel environment bootstrap
+Run with: python -m pytest test/test_bootstrap.py
+"""
+
+import sys
+import time
+import socket
+
+import pytest
+
+from bootstrap import Bootstrap
+from ollama_setup import OllamaSetup, wait_until_ready, model_matches
+from stub_ollama import StubOllama
+
+# Serves Ollama's /api/version and /api/tags plus CodeBERT's /health after a startup delay
+STUB_SERVICE = """
+import sys, json, time
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+port, delay = int(sys.argv[1]), float(sys.argv[2])
+class Handler(BaseHTTPRequestHandler):
+    def log_message(self, *args):
+        pass
+    def do_GET(self):
+        body = json.dumps({'models': [{'name': 'phi4:latest'}], 'version': '0.0.0', 'status': 'ok'}).encode()
+        self.send_response(200)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+time.sleep(delay)
+ThreadingHTTPServer(('127.0.0.1', port), Handler).serve_forever()
+"""
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+@pytest.fixture
+def stubs(json_stub):
+    """Stub Ollama and a stand-in CodeBERT service answering /health"""
+    ollama = StubOllama(['phi4']).start()
+    codebert = json_stub(lambda method, path, body: (200, {'status': 'ok'}) if path == '/health'
+                         else (404, {'error': 'Not found'}))
+    yield ollama, codebert
+    ollama.close()
+
+
+@pytest.fixture
+def processes():
+    spawned = []
+    yield spawned
+    for bootstrap in spawned:
+        for process in bootstrap.processes:
+            process.kill()
+            process.wait()
+
+
+def test_reuses_running_services_without_spawning(stubs):
+    ollama, codebert = stubs
+    bootstrap = Bootstrap(['phi4'], ollama.url, codebert.url, timeout=5,
+                          ollama_command=['false'], codebert_command=['false'])
+    report = bootstrap.run()
+
+    assert report['ok']
+    assert report['ollama']['status'] == 'running'
+    assert report['codebert']['status'] == 'running'
+    assert report['models']['available'] == ['phi4']
+    assert bootstrap.processes == []
+    assert ('/api/tags', None) in ollama.requests
+
+
+def test_reports_missing_models(stubs):
+    ollama, codebert = stubs
+    report = Bootstrap(['phi4', 'llama3.2:1b'], ollama.url, codebert.url, timeout=5).run()
+
+    assert not report['ok']
+    assert report['models']['available'] == ['phi4']
+    assert report['models']['missing'] == ['llama3.2:1b']
+
+
+def test_starts_services_in_parallel(processes):
+    delay = 0.6
+    ollama_port, codebert_port = free_port(), free_port()
+    bootstrap = Bootstrap(
+        ['phi4'], f"http://127.0.0.1:{ollama_port}", f"http://127.0.0.1:{codebert_port}", timeout=10,
+        ollama_command=[sys.executable, '-c', STUB_SERVICE, str(ollama_port), str(delay)],
+        codebert_command=[sys.executable, '-c', STUB_SERVICE, str(codebert_port), str(delay)]
+    )
+    processes.append(bootstrap)
+    report = bootstrap.run()
+
+    assert report['ok'], report
+    assert report['ollama']['status'] == 'started'
+    assert report['codebert']['status'] == 'started'
+    assert report['ollama']['ready_seconds'] >= delay
+    # Both services waited out their startup delay at the same time
+    one_after_the_other = report['ollama']['total_seconds'] + report['codebert']['total_seconds']
+    assert report['total_seconds'] < 0.8 * one_after_the_other
+    assert report['sequential_seconds'] > report['total_seconds']
+
+
+def test_fails_fast_when_spawned_service_exits(stubs, processes):
+    _, codebert = stubs
+    bootstrap = Bootstrap(
+        ['phi4'], f"http://127.0.0.1:{free_port()}", codebert.url, timeout=30,
+        ollama_command=[sys.executable, '-c', 'import sys; sys.exit(3)']
+    )
+    processes.append(bootstrap)
+    began = time.monotonic()
+    report = bootstrap.run()
+
+    assert not report['ok']
+    assert report['ollama']['status'] == 'failed'
+    assert 'code 3' in report['ollama']['error']
+    assert report['models'] is None
+    assert time.monotonic() - began < 5
+
+
+def test_wait_until_ready_backs_off_and_times_out():
+    calls = []
+
+    def check():
+        calls.append(time.monotonic())
+        return False
+
+    assert wait_until_ready(check, timeout=0.5, initial_delay=0.01, max_delay=0.2) is None
+    gaps = [b - a for a, b in zip(calls, calls[1:])]
+    assert gaps[-1] > gaps[0]
+    assert len(calls) < 15
+
+
+def test_model_check_uses_the_tags_api(stubs):
+    ollama, _ = stubs
+    setup = OllamaSetup('phi4', ollama.url)
+
+    assert setup.has_model()
+    assert not setup.has_model('phi4:14b-q8')
+    assert model_matches('llama3.2:1b', 'llama3.2:1b')
+    assert not model_matches('llama3.2', 'llama3.2:1b')
@@ -0,0 +1,54 @@
+"""
+Tests for the shared result buffers of bulk embedding jobs
+Run with: python -m pytest test/test_bulk_buffer.py
+"""
+
+from pathlib import Path
+
+import numpy as np
+import pytest
+
+from bulk_buffer import BulkBuffer
+
+
+@pytest.fixture(params=['shm', 'file'])
+def buffer(request, tmp_path):
+    created = BulkBuffer.create(5, 3, request.param, tmp_path / 'job.f32')
+    yield created
+    if created.matrix is not None:
+        created.close()
+
+
+def test_reader_sees_rows_and_progress_in_place(buffer):
+    reader = BulkBuffer.attach(buffer.name, buffer.transport)
+    assert reader.progress() == {'status': 'running', 'completed': 0, 'total': 5, 'dim': 3}
+
+    buffer.write_rows(0, np.ones((2, 3)))
+    assert reader.progress()['completed'] == 2
+    buffer.matrix[2:5] = 2.0
+    buffer.publish(5)
+    buffer.finish()
+
+    assert reader.wait(timeout=1) == {'status': 'done', 'completed': 5, 'total': 5, 'dim': 3}
+    np.testing.assert_array_equal(reader.matrix[:, 0], [1, 1, 2, 2, 2])
+    reader.close()
+
+
+def test_failed_jobs_and_timeouts(buffer):
+    reader = BulkBuffer.attach(buffer.name, buffer.transport)
+    with pytest.raises(TimeoutError):
+        reader.wait(poll_interval=0.01, timeout=0.05)
+    buffer.finish(failed=True)
+    assert reader.progress()['status'] == 'failed'
+    reader.close()
+
+
+def test_owner_close_removes_the_region(tmp_path):
+    buffer = BulkBuffer.create(2, 2, 'file', tmp_path / 'job.f32')
+    assert Path(buffer.name).stat().st_size == 64 + 2 * 2 * 4
+    buffer.close()
+    assert not Path(buffer.name).exists()
+
+    (tmp_path / 'other.bin').write_bytes(b'x' * 64)
+    with pytest.raises(ValueError):
+        BulkBuffer.attach(str(tmp_path / 'other.bin'), 'file')
@@ -0,0 +1,195 @@
+"""
+Tests for the CodeBERT model downloader
+Run with: python -m pytest test/test_codebert_setup.py
+"""
+
+import json
+import hashlib
+import threading
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+import pytest
+
+import codebert_setup
+from codebert_setup import CodeBERTDownloader, DownloadError
+
+
+def git_sha1(content):
+    return hashlib.sha1(f"blob {len(content)}\0".encode() + content).hexdigest()
+
+
+class StubHub:
+    """Local stand-in for the Hugging Face Hub API and resolve endpoints"""
+
+    def __init__(self, files):
+        self.files = files
+        self.requests = []
+        self.corrupt = set()
+        self.truncated = set()
+        self.ignore_range = False
+        hub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, *args):
+                pass
+
+            def do_GET(self):
+                hub.requests.append((self.path, self.headers.get('Range')))
+                if self.path.startswith('/api/models/'):
+                    siblings = []
+                    for name, content in hub.files.items():
+                        sibling = {'rfilename': name, 'size': len(content)}
+                        if name.endswith('.bin'):
+                            sibling['lfs'] = {'size': len(content), 'sha256': hashlib.sha256(content).hexdigest()}
+                        else:
+                            sibling['blobId'] = git_sha1(content)
+                        siblings.append(sibling)
+                    body = json.dumps({'siblings': siblings}).encode()
+                    self.send_response(200)
+                    self.send_header('Content-Length', str(len(body)))
+                    self.end_headers()
+                    self.wfile.write(body)
+                    return
+
+                name = self.path.rsplit('/', 1)[-1]
+                if name not in hub.files:
+                    self.send_response(404)
+                    self.send_header('Content-Length', '0')
+                    self.end_headers()
+                    return
+                content = hub.files[name]
+                if name in hub.corrupt:
+                    content = bytes(len(content))
+                start, end, status = 0, len(content) - 1, 200
+                range_header = self.headers.get('Range')
+                if range_header and not hub.ignore_range:
+                    first, _, last = range_header.split('=', 1)[1].partition('-')
+                    start = int(first)
+                    end = int(last) if last else len(content) - 1
+                    status = 206
+                body = content[start:end + 1]
+                if name in hub.truncated:
+                    body = body[:-1]
+                self.send_response(status)
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.url = f"http://127.0.0.1:{self.server.server_address[1]}"
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+
+    def __enter__(self):
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+@pytest.fixture
+def model_files():
+    return {
+        'config.json': b'{"hidden_size": 768}',
+        'tokenizer.json': b'{"model": {}}' * 50,
+        'tokenizer_config.json': b'{}',
+        'vocab.json': b'{"<s>": 0}',
+        'merges.txt': b'#version: 0.2\n',
+        'pytorch_model.bin': bytes(range(256)) * 4000
+    }
+
+
+def make_downloader(hub, tmp_path):
+    downloader = CodeBERTDownloader(install_dir=tmp_path, hub_url=hub.url, max_workers=4)
+    metadata = downloader.fetch_file_metadata(downloader.model_name)
+    return downloader, metadata
+
+
+def test_downloads_all_files_concurrently_and_verifies(tmp_path, model_files):
+    with StubHub(model_files) as hub:
+        downloader, metadata = make_downloader(hub, tmp_path)
+        downloader.download_files([
+            (f"{downloader.huggingface_url}/resolve/main/{name}", tmp_path / name, metadata[name])
+            for name in model_files
+        ])
+
+    for name, content in model_files.items():
+        assert (tmp_path / name).read_bytes() == content
+    assert not list(tmp_path.glob('*.partial*'))
+
+
+def test_large_files_are_split_into_range_parts(tmp_path, model_files, split_parts):
+    with StubHub(model_files) as hub:
+        downloader, metadata = make_downloader(hub, tmp_path)
+        downloader.download_file(f"{downloader.huggingface_url}/resolve/main/pytorch_model.bin",
+                                 tmp_path / 'pytorch_model.bin', metadata['pytorch_model.bin'])
+        ranges = sorted(r for path, r in hub.requests if path.endswith('pytorch_model.bin'))
+
+    assert ranges == ['bytes=0-299999', 'bytes=300000-599999', 'bytes=600000-899999', 'bytes=900000-1023999']
+    assert (tmp_path / 'pytorch_model.bin').read_bytes() == model_files['pytorch_model.bin']
+
+
+def test_resumes_from_partial_file(tmp_path, model_files):
+    content = model_files['pytorch_model.bin']
+    (tmp_path / 'pytorch_model.bin.partial').write_bytes(content[:5000])
+    with StubHub(model_files) as hub:
+        downloader, metadata = make_downloader(hub, tmp_path)
+        downloader.download_file(f"{downloader.huggingface_url}/resolve/main/pytorch_model.bin",
+                                 tmp_path / 'pytorch_model.bin', metadata['pytorch_model.bin'])
+        ranges = [r for path, r in hub.requests if path.endswith('pytorch_model.bin')]
+
+    assert ranges == ['bytes=5000-']
+    assert (tmp_path / 'pytorch_model.bin').read_bytes() == content
+
+
+def test_hash_mismatch_leaves_no_final_file(tmp_path, model_files):
+    with StubHub(model_files) as hub:
+        hub.corrupt.add('pytorch_model.bin')
+        downloader, metadata = make_downloader(hub, tmp_path)
+        with pytest.raises(DownloadError, match='SHA-256'):
+            downloader.download_file(f"{downloader.huggingface_url}/resolve/main/pytorch_model.bin",
+                                     tmp_path / 'pytorch_model.bin', metadata['pytorch_model.bin'])
+
+    assert not (tmp_path / 'pytorch_model.bin').exists()
+    assert not (tmp_path / 'pytorch_model.bin.partial').exists()
+
+
+@pytest.fixture
+def split_parts(monkeypatch):
+    monkeypatch.setattr(codebert_setup, 'RANGE_SPLIT_THRESHOLD', 100_000)
+    monkeypatch.setattr(codebert_setup, 'RANGE_PART_SIZE', 300_000)
+
+
+def test_falls_back_to_one_stream_when_range_is_ignored(tmp_path, model_files, split_parts):
+    with StubHub(model_files) as hub:
+        hub.ignore_range = True
+        downloader, metadata = make_downloader(hub, tmp_path)
+        downloader.download_file(f"{downloader.huggingface_url}/resolve/main/pytorch_model.bin",
+                                 tmp_path / 'pytorch_model.bin', metadata['pytorch_model.bin'])
+        ranges = [r for path, r in hub.requests if path.endswith('pytorch_model.bin')]
+
+    assert ranges[-1] is None and len(ranges) == 5
+    assert (tmp_path / 'pytorch_model.bin').read_bytes() == model_files['pytorch_model.bin']
+    assert not list(tmp_path.glob('*.partial*'))
+
+
+def test_short_parts_are_kept_and_resumed(tmp_path, model_files, split_parts):
+    name = 'pytorch_model.bin'
+    with StubHub(model_files) as hub:
+        downloader, metadata = make_downloader(hub, tmp_path)
+        url = f"{downloader.huggingface_url}/resolve/main/{name}"
+        hub.truncated.add(name)
+        with pytest.raises(DownloadError, match='expected'):
+            downloader.download_file(url, tmp_path / name, metadata[name])
+        assert len(list(tmp_path.glob('*.partial.*'))) == 4
+
+        # Each part is one byte short: the next run fetches just those bytes
+        hub.truncated.clear()
+        hub.requests.clear()
+        downloader.download_file(url, tmp_path / name, metadata[name])
+        ranges = sorted(r for path, r in hub.requests if path.endswith(name))
+
+    assert ranges == ['bytes=1023999-1023999', 'bytes=299999-299999', 'bytes=599999-599999', 'bytes=899999-899999']
+    assert (tmp_path / name).read_bytes() == model_files[name]
+    assert not list(tmp_path.glob('*.partial*'))
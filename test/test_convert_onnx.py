@@ -0,0 +1,149 @@
+"""
+Tests for the ONNX export pipeline; only the pooled parity test needs torch and onnxruntime
+Run with: python -m pytest test/test_convert_onnx.py
+"""
+
+import sys
+import json
+import types
+import threading
+
+import numpy as np
+import pytest
+
+import convert_codebert_to_onnx as convert
+from convert_codebert_to_onnx import build_variants, mean_pool, pick_variant, sha256_file
+
+
+def variant(name, median, passed):
+    return {'variant': name, 'latency_ms': {'median': median}, 'parity': {'passed': passed}}
+
+
+def test_pick_variant_prefers_the_fastest_passing_variant():
+    manifest = {'variants': {
+        'fp32': variant('fp32', 40.0, True),
+        'optimized': variant('optimized', 25.0, True),
+        'int8': variant('int8', 10.0, False),
+        'fp16': {'variant': 'fp16'}
+    }}
+    assert pick_variant(manifest)['variant'] == 'optimized'
+    manifest['variants']['int8']['parity']['passed'] = True
+    assert pick_variant(manifest)['variant'] == 'int8'
+    assert pick_variant({'variants': {'fp32': variant('fp32', 40.0, False)}}) is None
+    assert pick_variant({}) is None
+
+
+@pytest.fixture
+def fake_export(monkeypatch):
+    """Replace the torch export and onnxruntime builders with writers of small files"""
+    def write(path, content):
+        with open(path, 'wb') as f:
+            f.write(content)
+        return True
+
+    def missing_onnxruntime(source, target):
+        raise ImportError('onnxruntime')
+
+    monkeypatch.setattr(convert, 'convert_to_onnx', lambda model_dir, output_file, opset, pooled: write(output_file, b'fp32'))
+    monkeypatch.setattr(convert, 'optimize_onnx', lambda source, target, *args: write(target, b'optimized!'))
+    monkeypatch.setattr(convert, 'convert_fp16', lambda source, target, *args: write(target, b'fp16'))
+    monkeypatch.setattr(convert, 'quantize_int8', missing_onnxruntime)
+
+
+def test_manifest_records_every_built_variant(tmp_path, fake_export):
+    manifest = build_variants(tmp_path / 'model', tmp_path / 'onnx', ['fp32', 'optimized', 'int8'],
+                              opset_version=14, skip_parity=True)
+
+    assert manifest == json.loads((tmp_path / 'onnx' / 'manifest.json').read_text())
+    assert (manifest['opset'], manifest['output'], manifest['pooling']) == (14, 'last_hidden_state', None)
+    # int8 needs onnxruntime, which is missing: it is left out rather than failing the build
+    assert list(manifest['variants']) == ['fp32', 'optimized']
+    optimized = manifest['variants']['optimized']
+    assert optimized['file'] == 'model_optimized.onnx' and optimized['size_bytes'] == 10
+    assert optimized['sha256'] == sha256_file(tmp_path / 'onnx' / 'model_optimized.onnx')
+    # Without parity measurements no variant can be recommended
+    assert 'parity' not in optimized and manifest['recommended'] is None
+
+
+def test_parity_decides_the_recommended_variant(tmp_path, fake_export, monkeypatch):
+    loader = types.SimpleNamespace(from_pretrained=lambda path, **kwargs: types.SimpleNamespace(eval=lambda: None))
+    monkeypatch.setitem(sys.modules, 'transformers', types.SimpleNamespace(AutoModel=loader, AutoTokenizer=loader))
+    monkeypatch.setattr(convert, 'reference_embeddings', lambda model, tokenizer, samples: 'reference')
+    measured = {'model.onnx': (40.0, 1.0), 'model_optimized.onnx': (25.0, 0.999), 'model_fp16.onnx': (15.0, 0.97)}
+
+    def evaluate(path, tokenizer, samples, reference):
+        median, cosine = measured[path.name]
+        return {'latency_ms': {'median': median, 'min': median, 'batch_size': len(samples)},
+                'parity': {'cosine_min': cosine, 'cosine_mean': cosine}}
+
+    monkeypatch.setattr(convert, 'evaluate_variant', evaluate)
+    manifest = build_variants(tmp_path / 'model', tmp_path / 'onnx', ['optimized', 'fp16'], parity_threshold=0.99)
+
+    assert {name: entry['parity']['passed'] for name, entry in manifest['variants'].items()} == {
+        'fp32': True, 'optimized': True, 'fp16': False}
+    # fp16 is the fastest but drifts from PyTorch, so the optimized fp32 graph wins
+    assert manifest['recommended'] == 'optimized'
+
+
+def test_failed_export_writes_no_manifest(tmp_path, monkeypatch):
+    monkeypatch.setattr(convert, 'convert_to_onnx', lambda *args: False)
+    assert build_variants(tmp_path, tmp_path / 'onnx', ['int8']) is None
+    assert not (tmp_path / 'onnx' / 'manifest.json').exists()
+
+
+@pytest.mark.parametrize('argv', [
+    ['--variants', 'int8', '--output-file', 'model.onnx'],
+    ['--output-dir', 'onnx'],
+    ['--variants', 'int8,bf16'],
+])
+def test_cli_rejects_inconsistent_arguments(tmp_path, monkeypatch, argv):
+    monkeypatch.setattr(convert, 'build_variants', lambda *args: pytest.fail('should not build'))
+    monkeypatch.setattr(sys, 'argv', ['convert_codebert_to_onnx.py', '--model-dir', str(tmp_path)] + argv)
+    with pytest.raises(SystemExit) as exit_info:
+        convert.main()
+    assert exit_info.value.code == 2
+
+
+def test_mean_pool_ignores_padding_and_normalizes():
+    hidden = np.array([[[0.0, 0.0], [6.0, 8.0], [100.0, 100.0]],
+                       [[0.0, 2.0], [50.0, 50.0], [50.0, 50.0]]], dtype=np.float32)
+    mask = np.array([[1, 1, 0], [1, 0, 0]])
+    pooled = mean_pool(hidden, mask)
+
+    np.testing.assert_allclose(pooled, [[0.6, 0.8], [0.0, 1.0]], rtol=1e-6)
+    # A row with no tokens stays finite instead of dividing by zero
+    assert np.isfinite(mean_pool(hidden, np.zeros_like(mask))).all()
+
+
+def test_pooled_export_matches_the_service_pooling(tmp_path, monkeypatch):
+    torch = pytest.importorskip('torch')
+    transformers = pytest.importorskip('transformers')
+    ort = pytest.importorskip('onnxruntime')
+    from tokenizers import Tokenizer, models, pre_tokenizers
+
+    # A tiny random RoBERTa encoder and word-level tokenizer stand in for CodeBERT
+    vocab = {'<unk>': 0, '<pad>': 1, 'def': 2, 'return': 3, 'x': 4, 'y': 5}
+    words = Tokenizer(models.WordLevel(vocab, unk_token='<unk>'))
+    words.pre_tokenizer = pre_tokenizers.Whitespace()
+    transformers.PreTrainedTokenizerFast(tokenizer_object=words, unk_token='<unk>', pad_token='<pad>').save_pretrained(tmp_path)
+    torch.manual_seed(0)
+    config = transformers.RobertaConfig(vocab_size=len(vocab), hidden_size=32, num_hidden_layers=2, num_attention_heads=2,
+                                        intermediate_size=64, max_position_embeddings=64)
+    model = transformers.RobertaModel(config).eval()
+    model.save_pretrained(tmp_path)
+
+    assert convert.convert_to_onnx(str(tmp_path), str(tmp_path / 'pooled.onnx'), pooled=True)
+
+    tokenizer = transformers.AutoTokenizer.from_pretrained(tmp_path)
+    inputs = tokenizer(['def x return y', 'x'], return_tensors='np', padding=True)
+    session = ort.InferenceSession(str(tmp_path / 'pooled.onnx'), providers=['CPUExecutionProvider'])
+    (exported,) = session.run(None, {'input_ids': inputs['input_ids'].astype(np.int64),
+                                     'attention_mask': inputs['attention_mask'].astype(np.int64)})
+
+    monkeypatch.setattr(sys, 'argv', ['codebert_service.py', '--model-dir', str(tmp_path)])
+    import codebert_service
+    entry = types.SimpleNamespace(model=model, lock=threading.Lock(), path=tmp_path)
+    expected = codebert_service.pool_embeddings(entry, torch.from_numpy(inputs['input_ids']),
+                                                torch.from_numpy(inputs['attention_mask']))
+    assert exported.shape == (2, 32)
+    np.testing.assert_allclose(exported, expected, atol=1e-5)
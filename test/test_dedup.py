@@ -0,0 +1,45 @@
+"""
+Tests for exact and near-duplicate chunk detection
+Run with: python -m pytest test/test_dedup.py
+"""
+
+import numpy as np
+
+from dedup import find_duplicates, choose_bands, EXACT, NEAR, UNIQUE
+
+BASE = list(range(1000, 1200))
+# One token changed in 200: Jaccard of the 5-token shingle sets is about 0.95
+NEAR_COPY = BASE[:100] + [7] + BASE[101:]
+OTHER = list(range(5000, 5200))
+
+
+def test_exact_and_near_duplicates_copy_their_representative():
+    plan = find_duplicates([BASE, OTHER, list(BASE), NEAR_COPY], threshold=0.8)
+
+    assert list(plan.source) == [0, 1, 0, 0]
+    assert list(plan.kind) == [UNIQUE, UNIQUE, EXACT, NEAR]
+    assert 0.8 <= plan.similarity[3] < 1.0
+    assert plan.members() == {0: [0, 2, 3], 1: [1]}
+
+    report = plan.report()
+    assert (report['embedded'], report['exact_duplicates'], report['near_duplicates']) == (2, 1, 1)
+    assert report['compute_saved'] == 0.5
+
+
+def test_threshold_of_one_keeps_only_exact_duplicates():
+    plan = find_duplicates([BASE, NEAR_COPY, list(BASE)], threshold=1.0)
+    assert list(plan.source) == [0, 1, 0]
+    assert plan.report()['near_duplicates'] == 0
+
+
+def test_expand_repeats_rows_for_every_member():
+    plan = find_duplicates([BASE, OTHER, list(BASE)], threshold=1.0)
+    indices, rows = plan.expand([0, 1], np.array([[1.0], [2.0]]))
+    assert list(indices) == [0, 2, 1]
+    assert rows[:, 0].tolist() == [1.0, 1.0, 2.0]
+
+
+def test_choose_bands_divides_the_signature():
+    bands, rows = choose_bands(64, 0.9)
+    assert bands * rows == 64
+    assert abs((1 / bands) ** (1 / rows) - 0.9) < 0.1
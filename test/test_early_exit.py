@@ -0,0 +1,58 @@
+"""
+Tests for the early-exit alignment maths (the torch parts need a model and are not covered)
+Run with: python -m pytest test/test_early_exit.py
+"""
+
+import os
+
+import numpy as np
+
+from early_exit import (fit_alignment, apply_alignment, save_alignment, load_alignment, alignment_path,
+                        retrieval_agreement)
+
+
+def normalized(rows):
+    return rows / np.linalg.norm(rows, axis=1, keepdims=True)
+
+
+def test_alignment_recovers_a_linear_map(tmp_path):
+    rng = np.random.default_rng(0)
+    truncated = rng.normal(size=(400, 8)).astype(np.float32)
+    true_weight = rng.normal(size=(8, 8)).astype(np.float32)
+    full = truncated @ true_weight + 0.5
+
+    weight, bias = fit_alignment(truncated, full, ridge=1e-6)
+    aligned = apply_alignment(truncated, (weight, bias))
+    cosine = np.sum(aligned * normalized(full), axis=1)
+    assert cosine.min() > 0.999
+    assert np.allclose(np.linalg.norm(aligned, axis=1), 1, atol=1e-5)
+
+    save_alignment(tmp_path, 6, weight, bias, {'cosine': 1.0})
+    loaded_weight, loaded_bias = load_alignment(tmp_path, 6)
+    np.testing.assert_allclose(loaded_weight, weight, rtol=1e-5)
+    assert load_alignment(tmp_path, 4) is None
+    assert apply_alignment(truncated, None) is truncated
+
+
+def test_alignment_fitted_later_is_picked_up(tmp_path):
+    assert load_alignment(str(tmp_path), 6) is None
+    save_alignment(tmp_path, 6, np.eye(2), np.zeros(2), {})
+    assert load_alignment(str(tmp_path), 6) is not None
+
+    # A refit written by another process (the running service never sees save_alignment)
+    path = alignment_path(tmp_path, 6)
+    np.savez(path, weight=2 * np.eye(2), bias=np.ones(2), metrics='{}')
+    stat = path.stat()
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000_000))
+    weight, bias = load_alignment(str(tmp_path), 6)
+    np.testing.assert_array_equal(bias, [1, 1])
+
+
+def test_retrieval_agreement_compares_neighbours():
+    index = np.eye(4, dtype=np.float32)
+    queries = np.array([[1, 0.5, 0, 0], [0, 0, 1, 0.2]], dtype=np.float32)
+    assert retrieval_agreement(index, queries, queries, k=2) == (1.0, 1.0)
+
+    swapped = np.array([[0.5, 1, 0, 0], [0, 0, 0.2, 1]], dtype=np.float32)
+    overlap, top1 = retrieval_agreement(index, queries, swapped, k=2)
+    assert (overlap, top1) == (1.0, 0.0)
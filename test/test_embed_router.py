@@ -0,0 +1,160 @@
+"""
+Tests for the multi-replica embedding router
+Run with: python -m pytest test/test_embed_router.py
+"""
+
+import time
+import socket
+import threading
+
+import pytest
+import requests
+
+from embed_router import Router, ReplicaUnavailable, make_server
+
+
+class StubReplica:
+    """Stand-in for codebert_service.py: /health with a settable queue depth, /embed, /warm and /jobs"""
+
+    def __init__(self, ident, json_stub):
+        self.ident = ident
+        self.queue_depth = 0
+        self.batches = []
+        self.job_delay = 0
+        self.server = json_stub(self.handle)
+        self.url = self.server.url
+
+    def handle(self, method, path, body):
+        if path == '/health':
+            return 200, {'status': 'ok', 'queue_depth': self.queue_depth, 'jobs_running': 0}
+        if path == '/jobs/abc':
+            return 200, {'job_id': 'abc', 'status': 'done', 'replica': self.ident}
+        if path == '/warm':
+            return 200, {'status': 'ready', 'model': 'codebert'}
+        if path == '/jobs':
+            time.sleep(self.job_delay)
+            return 202, {'job_id': 'abc', 'status': 'running'}
+        if path != '/embed':
+            return 404, {'error': 'Not found'}
+        texts = body.get('texts', [body.get('text')])
+        self.batches.append(len(texts))
+        rows = [[float(text), float(self.ident)] for text in texts]
+        return 200, {'embeddings': rows} if 'texts' in body else {'embedding': rows[0]}
+
+
+@pytest.fixture
+def replicas(json_stub):
+    return [StubReplica(ident, json_stub) for ident in range(3)]
+
+
+@pytest.fixture
+def routed(replicas):
+    router = Router([stub.url for stub in replicas], health_interval=60, split_min=8)
+    router.start()
+    server = make_server(router, port=0)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield router, f"http://127.0.0.1:{server.server_port}"
+    server.shutdown()
+    server.server_close()
+    router.stop()
+
+
+def test_sends_requests_to_the_shortest_queue(replicas, routed):
+    router, url = routed
+    replicas[0].queue_depth = 4
+    replicas[2].queue_depth = 2
+    router.check_all()
+
+    for _ in range(5):
+        response = requests.post(f"{url}/embed", json={'text': '7'})
+        assert response.json()['embedding'] == [7.0, 1.0]
+    assert replicas[1].batches == [1] * 5 and not replicas[0].batches
+
+
+def test_splits_large_batches_and_keeps_input_order(replicas, routed):
+    _, url = routed
+    texts = [str(i) for i in range(30)]
+    body = requests.post(f"{url}/embed", json={'texts': texts}).json()
+
+    assert [row[0] for row in body['embeddings']] == [float(i) for i in range(30)]
+    assert body['shards'] == 3
+    assert sorted(len(stub.batches) for stub in replicas) == [1, 1, 1]
+    # Small batches stay on one replica
+    assert 'shards' not in requests.post(f"{url}/embed", json={'texts': ['1', '2']}).json()
+
+
+def test_retries_elsewhere_when_a_replica_dies(replicas, routed):
+    router, url = routed
+    # Make the replica that is about to die the preferred one
+    replicas[0].queue_depth = replicas[2].queue_depth = 5
+    router.check_all()
+    replicas[1].server.dead = True
+
+    assert requests.post(f"{url}/embed", json={'text': '3'}).json()['embedding'][1] in (0.0, 2.0)
+    texts = [str(i) for i in range(30)]
+    body = requests.post(f"{url}/embed", json={'texts': texts}).json()
+    assert [row[0] for row in body['embeddings']] == [float(i) for i in range(30)]
+    assert {row[1] for row in body['embeddings']} <= {0.0, 2.0}
+
+    health = requests.get(f"{url}/health").json()
+    assert health['healthy_replicas'] == 2
+    dead = health['replicas'][1]
+    assert not dead['healthy'] and dead['failures'] >= 1
+
+    replicas[0].server.dead = replicas[2].server.dead = True
+    assert requests.post(f"{url}/embed", json={'text': '1'}).status_code == 503
+    assert requests.get(f"{url}/health").status_code == 503
+
+
+def test_embed_sharded_without_healthy_replicas(routed):
+    router, _ = routed
+    for replica in router.replicas:
+        replica.healthy = False
+    with pytest.raises(ReplicaUnavailable):
+        router.embed_sharded({'texts': ['1'] * 40})
+
+
+def test_jobs_stay_on_their_replica_and_warm_reaches_all(replicas, routed):
+    _, url = routed
+    job_id = requests.post(f"{url}/jobs", json={'texts': ['a']}).json()['job_id']
+    index = int(job_id.split('.')[0])
+    assert requests.get(f"{url}/jobs/{job_id}").json()['replica'] == index
+    assert requests.get(f"{url}/jobs/9.abc").status_code == 404
+
+    warm = requests.post(f"{url}/warm", json={})
+    assert warm.status_code == 200
+    assert len(warm.json()['replicas']) == 3
+
+
+def job_posts(replicas):
+    return sum(stub.server.requests.count(('POST', '/jobs', {'texts': ['a']})) for stub in replicas)
+
+
+def test_job_creation_is_not_retried_after_a_timeout(replicas):
+    router = Router([stub.url for stub in replicas], timeout=0.3)
+    replicas[1].queue_depth = replicas[2].queue_depth = 5
+    router.check_all()
+    replicas[0].job_delay = 1
+
+    # The slow replica may still create the job, so it must not be submitted elsewhere too
+    with pytest.raises(ReplicaUnavailable):
+        router.send('POST', '/jobs', b'{"texts": ["a"]}', idempotent=False)
+    assert job_posts(replicas) == 1
+    # Idempotent requests still move on to the next replica
+    assert router.send('POST', '/embed', b'{"text": "1"}')[0].index in (1, 2)
+    router.stop()
+
+
+def test_job_creation_moves_on_from_a_refused_connection(replicas):
+    with socket.socket() as closed:
+        closed.bind(('127.0.0.1', 0))
+        refused = f"http://127.0.0.1:{closed.getsockname()[1]}"
+    router = Router([refused, replicas[1].url])
+    router.check_all()
+    router.replicas[0].healthy = True
+    router.replicas[1].reported_queue = 3
+
+    target, status, _ = router.send('POST', '/jobs', b'{"texts": ["a"]}', idempotent=False)
+    assert (target.index, status) == (1, 202)
+    assert not router.replicas[0].healthy
+    router.stop()
@@ -0,0 +1,54 @@
+"""
+Tests for token-bounded line windows
+Run with: python -m pytest test/test_line_chunker.py
+"""
+
+import re
+
+import pytest
+
+from line_chunker import chunk_lines
+
+# Byte-level-BPE-like stub: a newline is merged with the following indentation
+TOKEN = re.compile(r'\n +| ?\w+| ?[^\w\s]+| +|\s')
+
+
+def encode(text):
+    return [match.span() for match in TOKEN.finditer(text)]
+
+
+INDENTED = '\n'.join(
+    f"{'    ' * (i % 4)}value_{i} = compute(value_{i - 1}, {i})" for i in range(60)
+)
+
+
+def test_windows_never_exceed_the_budget_on_indented_code():
+    lines = INDENTED.split('\n')
+    # Only some budgets pack a window exactly full, which is when a miscounted indent overflows
+    for budget in range(4, 70):
+        chunks = chunk_lines(INDENTED, budget, encode)
+
+        for chunk in chunks:
+            assert chunk['tokens'] == len(encode(chunk['content']))
+            assert chunk['tokens'] <= budget, (budget, chunk)
+        covered = [i for chunk in chunks for i in range(chunk['startLine'], chunk['endLine'] + 1)]
+        assert sorted(set(covered)) == list(range(len(lines)))
+
+
+def test_long_line_is_split_at_token_boundaries():
+    text = 'short\n' + ' '.join(f'word{i}' for i in range(25)) + '\nend'
+    chunks = chunk_lines(text, 10, encode)
+
+    long_parts = [chunk for chunk in chunks if chunk['startLine'] == 1]
+    assert len(long_parts) == 3
+    assert all(chunk['tokens'] <= 10 for chunk in chunks)
+    assert ''.join(chunk['content'] for chunk in long_parts) == text.split('\n')[1]
+
+
+def test_overlap_repeats_lines_and_negative_overlap_is_rejected():
+    text = '\n'.join(f'line {i}' for i in range(10))
+    chunks = chunk_lines(text, 6, encode, overlap_lines=1)
+
+    assert all(b['startLine'] == a['endLine'] for a, b in zip(chunks, chunks[1:]))
+    with pytest.raises(ValueError):
+        chunk_lines(text, 6, encode, overlap_lines=-1)
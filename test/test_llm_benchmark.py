@@ -0,0 +1,99 @@
+"""
+Tests for the LLM benchmark harness, run against the bundled stub Ollama server
+Run with: python -m pytest test/test_llm_benchmark.py
+"""
+
+import sys
+import json
+import subprocess
+from pathlib import Path
+
+import pytest
+
+from llm_benchmark import LLMBenchmark, SUITE, percentiles, compare
+from ollama_setup import OllamaSetup
+from stub_ollama import StubOllama
+
+BIN = Path(__file__).resolve().parent.parent / 'bin'
+
+
+@pytest.fixture
+def stub():
+    server = StubOllama(['phi4', 'llama3.2:1b'], load_delay=0.3, token_delay=0.002).start()
+    yield server
+    server.close()
+
+
+def test_percentiles():
+    stats = percentiles([4, 1, 3, 2, 5])
+    assert (stats['min'], stats['p50'], stats['max'], stats['mean']) == (1, 3, 5, 3)
+    assert stats['p90'] == pytest.approx(4.6)
+    assert percentiles([]) is None
+
+
+def test_benchmark_measures_each_model_and_level(stub):
+    setup = OllamaSetup('phi4', stub.url)
+    report = LLMBenchmark(setup, ['phi4', 'llama3.2:1b'], concurrency=[1, 4], max_tokens=16, cold=True).run()
+
+    assert [(r['model'], r['concurrency']) for r in report['results']] == [
+        ('phi4', 1), ('phi4', 4), ('llama3.2:1b', 1), ('llama3.2:1b', 4)]
+    assert report['suite'] == [name for name, _, _ in SUITE]
+    assert report['ollama_version'] == '0.0.0-stub'
+    for result in report['results']:
+        assert result['requests'] == len(SUITE) and result['errors'] == 0
+        # Loading happened before the measured runs
+        assert result['ttft']['max'] < stub.load_delay
+        assert result['latency']['p50'] >= result['ttft']['p50']
+        assert result['decode_tokens_per_second']['p50'] > 0
+        assert result['memory']['size'] > 0
+        assert result['tokens'] == 16 * len(SUITE)
+    assert report['models']['phi4']['cold_start']['ttft_seconds'] >= stub.load_delay
+    assert stub.peak_active == 4
+
+    # More requests in flight finish the suite sooner on the parallel stub
+    one, four = report['results'][0], report['results'][1]
+    assert four['wall_seconds'] < one['wall_seconds']
+    assert four['aggregate_tokens_per_second'] > one['aggregate_tokens_per_second']
+
+    # Requests use CLOI's per-type options, capped by max_tokens
+    options = [request['options'] for path, request in stub.requests if path == '/api/chat']
+    assert {'temperature': 0.1, 'num_predict': 16} in options
+    assert {'temperature': 0.3, 'num_predict': 16} in options
+
+
+def test_missing_model_is_reported_not_fatal(stub):
+    report = LLMBenchmark(OllamaSetup('phi4', stub.url), ['nope', 'phi4'], concurrency=[1], max_tokens=4).run()
+    assert 'error' in report['models']['nope']
+    assert [r['model'] for r in report['results']] == ['phi4']
+
+
+def test_compare_flags_regressions():
+    base = {'results': [{'model': 'phi4', 'concurrency': 1, 'ttft': {'p50': 0.2}, 'latency': {'p90': 2.0},
+                         'decode_tokens_per_second': {'p50': 20.0}, 'aggregate_tokens_per_second': 20.0}]}
+    new = {'results': [{'model': 'phi4', 'concurrency': 1, 'ttft': {'p50': 0.3}, 'latency': {'p90': 1.0},
+                        'decode_tokens_per_second': {'p50': 20.0}, 'aggregate_tokens_per_second': 25.0}]}
+    row, = compare(new, base)
+    assert row['ttft p50']['change'] == 0.5 and not row['ttft p50']['better']
+    assert row['latency p90']['better'] and row['total tok/s']['better']
+    # An unchanged metric is neither better nor worse
+    assert row['decode tok/s']['change'] == 0 and row['decode tok/s']['better'] is None
+
+
+def test_cli_writes_json_report(stub, tmp_path):
+    output = tmp_path / 'report.json'
+    process = subprocess.run(
+        [sys.executable, str(BIN / 'llm_benchmark.py'), '--ollama-url', stub.url, '--model', 'phi4',
+         '--concurrency', '1,2', '--max-tokens', '4', '--output', str(output)],
+        capture_output=True, text=True, timeout=60
+    )
+    assert process.returncode == 0, process.stderr
+    report = json.loads(output.read_text())
+    assert [r['concurrency'] for r in report['results']] == [1, 2]
+
+    process = subprocess.run(
+        [sys.executable, str(BIN / 'llm_benchmark.py'), '--ollama-url', stub.url, '--model', 'mistral',
+         '--output', str(tmp_path / 'other.json')],
+        capture_output=True, text=True, timeout=60
+    )
+    assert process.returncode == 1
+    assert 'not pulled: mistral' in process.stderr
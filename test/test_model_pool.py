@@ -0,0 +1,132 @@
+"""
+Tests for the embedding service's model pool, with a fake transformers loader
+Run with: python -m pytest test/test_model_pool.py
+"""
+
+import sys
+import time
+import types
+import threading
+
+import pytest
+
+from model_pool import ModelPool, MB, parse_model_specs
+
+
+class FakeTensor:
+    def __init__(self, size):
+        self.size = size
+
+    def numel(self):
+        return self.size
+
+    def element_size(self):
+        return 1
+
+
+class FakeModel:
+    """Stands in for a transformers encoder whose weights take sizes[path] bytes"""
+
+    sizes = {}
+    loads = []
+    delay = 0.0
+
+    @classmethod
+    def from_pretrained(cls, path, **kwargs):
+        cls.loads.append(path)
+        time.sleep(cls.delay)
+        model = cls()
+        model.weights = [FakeTensor(cls.sizes.get(path, MB))]
+        return model
+
+    def eval(self):
+        pass
+
+    def parameters(self):
+        return self.weights
+
+    def buffers(self):
+        return []
+
+
+@pytest.fixture(autouse=True)
+def fake_transformers(monkeypatch):
+    tokenizer = types.SimpleNamespace(from_pretrained=lambda path, **kwargs: object())
+    monkeypatch.setitem(sys.modules, 'transformers', types.SimpleNamespace(AutoModel=FakeModel, AutoTokenizer=tokenizer))
+    FakeModel.sizes, FakeModel.loads, FakeModel.delay = {}, [], 0.0
+
+
+def test_parse_model_specs():
+    assert parse_model_specs('small=org/small, big=~/models/big') == {
+        'small': 'org/small', 'big': str(__import__('pathlib').Path('~/models/big').expanduser())}
+    with pytest.raises(ValueError):
+        parse_model_specs('nameonly')
+
+
+def test_concurrent_requests_share_one_load():
+    FakeModel.delay = 0.2
+    pool = ModelPool({'a': 'path-a'})
+    entries = []
+
+    def use():
+        with pool.acquire() as entry:
+            entries.append(entry)
+
+    threads = [threading.Thread(target=use) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert FakeModel.loads == ['path-a']
+    assert len({id(entry) for entry in entries}) == 1
+    assert pool.stats()['loaded']['a']['in_use'] == 0
+
+
+def test_memory_budget_unloads_least_recently_used_idle_model():
+    FakeModel.sizes = {'path-a': 40 * MB, 'path-b': 40 * MB, 'path-c': 40 * MB}
+    pool = ModelPool({'a': 'path-a', 'b': 'path-b', 'c': 'path-c'}, memory_budget=100 * MB)
+    with pool.acquire('a'):
+        pass
+    with pool.acquire('b'):
+        pass
+    with pool.acquire('a'):
+        pass
+    with pool.acquire('c'):
+        pass
+
+    assert sorted(pool.stats()['loaded']) == ['a', 'c']
+    # A model in use is never evicted, even over budget
+    with pool.acquire('a'), pool.acquire('c'):
+        with pool.acquire('b'):
+            assert sorted(pool.stats()['loaded']) == ['a', 'b', 'c']
+
+
+def test_idle_models_are_unloaded_after_the_timeout():
+    pool = ModelPool({'a': 'path-a', 'b': 'path-b'}, idle_timeout=60)
+    with pool.acquire('a'):
+        with pool.acquire('b'):
+            pass
+        assert pool.unload_idle(now=time.monotonic() + 120) == ['b']
+    assert pool.unload_idle(now=time.monotonic() + 30) == []
+    assert pool.unload_idle(now=time.monotonic() + 120) == ['a']
+    assert not pool.is_loaded('a')
+
+    with pool.acquire('a'):
+        pass
+    assert pool.stats()['load_history']['a']['loads'] == 2
+
+
+def test_new_model_cannot_be_evicted_before_its_request_uses_it(monkeypatch):
+    pool = ModelPool({'a': 'path-a'}, idle_timeout=60)
+    make_room = pool._make_room
+
+    def reaper_runs_right_after_publishing(needed, exclude=None):
+        make_room(needed, exclude)
+        if needed == 0:
+            pool.unload_idle(now=time.monotonic() + 120)
+
+    monkeypatch.setattr(pool, '_make_room', reaper_runs_right_after_publishing)
+    with pool.acquire('a') as entry:
+        assert entry.model is not None
+    assert FakeModel.loads == ['path-a']
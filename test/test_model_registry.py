@@ -0,0 +1,106 @@
+"""
+Tests for the local model registry
+Run with: python -m pytest test/test_model_registry.py
+"""
+
+import os
+import sys
+import types
+import importlib.machinery
+
+import pytest
+
+from model_registry import ModelRegistry, resolve_snapshot, scan_artifacts
+
+
+def make_snapshot(cache, commit, files):
+    snapshot = cache / 'models--microsoft--codebert-base' / 'snapshots' / commit
+    for name in files:
+        (snapshot / name).parent.mkdir(parents=True, exist_ok=True)
+        (snapshot / name).write_text('x')
+    return snapshot
+
+
+def test_resolve_snapshot_follows_the_ref(tmp_path):
+    old = make_snapshot(tmp_path, 'aaa', ['config.json'])
+    new = make_snapshot(tmp_path, 'bbb', ['config.json'])
+    os.utime(old, (2_000_000_000, 2_000_000_000))
+    refs = tmp_path / 'models--microsoft--codebert-base' / 'refs'
+    refs.mkdir()
+    (refs / 'main').write_text('bbb\n')
+
+    assert resolve_snapshot('microsoft/codebert-base', tmp_path) == (new, 'bbb')
+    # Without a ref the most recently modified snapshot wins
+    (refs / 'main').unlink()
+    assert resolve_snapshot('microsoft/codebert-base', tmp_path) == (old, 'aaa')
+    assert resolve_snapshot('microsoft/unknown', tmp_path) == (None, None)
+
+
+def test_scan_artifacts_lists_weights_and_onnx(tmp_path):
+    snapshot = make_snapshot(tmp_path, 'aaa', ['config.json', 'model.safetensors', 'onnx/model_quantized.onnx'])
+    artifacts = scan_artifacts(snapshot)
+    assert artifacts['config.json'] and artifacts['model.safetensors'] and not artifacts['pytorch_model.bin']
+    assert artifacts['onnx'] == ['onnx/model_quantized.onnx']
+
+
+def test_registry_round_trip(tmp_path):
+    snapshot = make_snapshot(tmp_path, 'aaa', ['config.json'])
+    registry = ModelRegistry(tmp_path / 'registry.json')
+    registry.record('microsoft/codebert-base', snapshot, 'aaa', {'ok': True})
+
+    reopened = ModelRegistry(tmp_path / 'registry.json')
+    assert reopened.get('microsoft/codebert-base')['revision'] == 'aaa'
+    assert reopened.is_ready('microsoft/codebert-base')
+    # The same model in another cache directory is a separate entry
+    assert not reopened.is_ready('microsoft/codebert-base', tmp_path / 'other-cache')
+
+    registry.record('other', snapshot, validation={'ok': False})
+    assert not registry.is_ready('other')
+    reopened.forget('microsoft/codebert-base')
+    assert ModelRegistry(tmp_path / 'registry.json').get('microsoft/codebert-base') is None
+
+
+class FakeModel:
+    config = types.SimpleNamespace(hidden_size=768, vocab_size=50265)
+    fail = False
+
+    @classmethod
+    def from_pretrained(cls, name, **kwargs):
+        if cls.fail:
+            raise OSError('weights are truncated')
+        return cls()
+
+
+@pytest.fixture
+def tokenizer_script(tmp_path, monkeypatch):
+    """bin/tokenizer.py with transformers and huggingface_hub replaced by fakes"""
+    for name in ('transformers', 'huggingface_hub'):
+        module = types.ModuleType(name)
+        module.__spec__ = importlib.machinery.ModuleSpec(name, None)
+        monkeypatch.setitem(sys.modules, name, module)
+    import tokenizer
+
+    snapshot = make_snapshot(tmp_path / 'cache', 'aaa', ['config.json', 'tokenizer.json'])
+    fake_tokenizer = types.SimpleNamespace(
+        from_pretrained=lambda name, **kwargs: lambda text, **kwargs: {'input_ids': types.SimpleNamespace(shape=(1, 8))})
+    monkeypatch.setattr(tokenizer, 'HAS_BACKEND', True)
+    monkeypatch.setattr(tokenizer, 'AutoTokenizer', fake_tokenizer)
+    monkeypatch.setattr(tokenizer, 'AutoModel', FakeModel)
+    monkeypatch.setattr(tokenizer, 'snapshot_download', lambda **kwargs: str(snapshot))
+    FakeModel.fail = False
+    return tokenizer
+
+
+def test_download_is_ready_only_when_the_model_loads(tmp_path, tokenizer_script):
+    registry = ModelRegistry(tmp_path / 'registry.json')
+    cache = str(tmp_path / 'cache')
+
+    FakeModel.fail = True
+    assert tokenizer_script.download_and_fix_model('microsoft/codebert-base', cache, registry=registry)
+    assert registry.get('microsoft/codebert-base', cache)['validation']['model'] is None
+    assert not registry.is_ready('microsoft/codebert-base', cache)
+
+    FakeModel.fail = False
+    assert tokenizer_script.download_and_fix_model('microsoft/codebert-base', cache, registry=registry)
+    assert registry.is_ready('microsoft/codebert-base', cache)
+    assert not registry.is_ready('microsoft/codebert-base')
@@ -0,0 +1,60 @@
+"""
+Tests for the content-addressed model artifact store
+Run with: python -m pytest test/test_model_store.py
+"""
+
+import hashlib
+
+import pytest
+
+from model_store import ArtifactStore, read_manifest
+
+
+@pytest.fixture
+def store(tmp_path):
+    return ArtifactStore(tmp_path)
+
+
+def test_identical_files_share_one_blob(store, tmp_path):
+    for model in ('a', 'b'):
+        (tmp_path / model).mkdir()
+        (tmp_path / model / 'vocab.json').write_bytes(b'{"<s>": 0}')
+        entry = store.add(tmp_path / model, 'vocab.json')
+
+    assert entry['sha256'] == hashlib.sha256(b'{"<s>": 0}').hexdigest()
+    assert [blob.name for blob in store.blob_dir.iterdir()] == [entry['sha256']]
+    assert (tmp_path / 'b' / 'vocab.json').read_bytes() == b'{"<s>": 0}'
+    assert read_manifest(tmp_path / 'a')['files']['vocab.json']['size'] == 10
+
+
+def test_link_exposes_a_blob_under_another_name(store, tmp_path):
+    (tmp_path / 'm').mkdir()
+    (tmp_path / 'm' / 'model.onnx').write_bytes(b'onnx')
+    entry = store.add(tmp_path / 'm', 'model.onnx')
+    store.link(tmp_path / 'm', 'onnx/model.onnx', entry['sha256'])
+
+    assert (tmp_path / 'm' / 'onnx' / 'model.onnx').read_bytes() == b'onnx'
+    assert store.has_files(tmp_path / 'm', ['model.onnx', 'onnx/model.onnx'])
+
+
+def test_has_files_notices_deleted_links(store, tmp_path):
+    (tmp_path / 'm').mkdir()
+    (tmp_path / 'm' / 'config.json').write_bytes(b'{}')
+    store.add(tmp_path / 'm', 'config.json')
+    assert store.has_files(tmp_path / 'm', ['config.json'])
+    assert not store.has_files(tmp_path / 'm', ['config.json', 'merges.txt'])
+
+    (tmp_path / 'm' / 'config.json').unlink()
+    assert not store.has_files(tmp_path / 'm', ['config.json'])
+
+
+def test_gc_frees_unreferenced_blobs(store, tmp_path):
+    (tmp_path / 'm').mkdir()
+    for name, content in (('keep.txt', b'keep'), ('drop.txt', b'dropped')):
+        (tmp_path / 'm' / name).write_bytes(content)
+        store.add(tmp_path / 'm', name)
+    store.remove(tmp_path / 'm', 'drop.txt')
+
+    assert store.gc() == len(b'dropped')
+    assert [blob.name for blob in store.blob_dir.iterdir()] == [hashlib.sha256(b'keep').hexdigest()]
+    assert store.has_files(tmp_path / 'm', ['keep.txt'])
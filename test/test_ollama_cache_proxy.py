@@ -0,0 +1,126 @@
+"""
+Tests for the Ollama caching proxy
+Run with: python -m pytest test/test_ollama_cache_proxy.py
+"""
+
+import os
+import json
+import time
+import threading
+
+import pytest
+import requests
+
+from ollama_cache_proxy import make_server, cache_key, is_cacheable, ResponseCache
+from stub_ollama import StubOllama
+
+
+# Upstream time per generate request: one token at this delay
+TOKEN_DELAY = 0.2
+
+
+@pytest.fixture
+def upstream():
+    stub = StubOllama(['phi4'], load_delay=0, token_delay=TOKEN_DELAY, max_tokens=1).start()
+    yield stub
+    stub.close()
+
+
+def generates(stub):
+    """Number of generate requests that reached the stub"""
+    return sum(1 for path, _ in stub.requests if path == '/api/generate')
+
+
+@pytest.fixture
+def proxy(upstream, tmp_path):
+    server = make_server('127.0.0.1', 0, upstream.url, tmp_path / 'cache')
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield f"http://127.0.0.1:{server.server_port}"
+    server.shutdown()
+    server.server_close()
+
+
+def generate(proxy, prompt, **fields):
+    request = dict({'model': 'phi4', 'prompt': prompt, 'options': {'temperature': 0}}, **fields)
+    started = time.monotonic()
+    response = requests.post(f"{proxy}/api/generate", json=request)
+    return response, time.monotonic() - started
+
+
+def test_replays_cached_streams_and_plain_responses(upstream, proxy):
+    first, first_seconds = generate(proxy, 'fix test_login')
+    second, second_seconds = generate(proxy, 'fix test_login', keep_alive='1h')
+
+    assert first.headers['X-Cache'] == 'MISS'
+    assert second.headers['X-Cache'] == 'HIT'
+    assert second.content == first.content
+    assert [json.loads(line)['done'] for line in second.content.splitlines()] == [False, True]
+    assert first_seconds >= TOKEN_DELAY > second_seconds
+    assert generates(upstream) == 1
+
+    plain, _ = generate(proxy, 'fix test_login', stream=False)
+    assert plain.headers['X-Cache'] == 'MISS'
+    assert generate(proxy, 'fix test_login', stream=False)[0].json()['response'] == plain.json()['response']
+    assert generates(upstream) == 2
+
+    stats = requests.get(f"{proxy}/cache/stats").json()
+    assert (stats['hits'], stats['misses'], stats['entries']) == (2, 2, 2)
+    assert stats['hit_rate'] == 0.5
+    assert stats['saved_seconds'] >= 2 * TOKEN_DELAY
+
+
+def test_non_deterministic_requests_pass_through(upstream, proxy):
+    for _ in range(2):
+        response, _ = generate(proxy, 'explain', options={'temperature': 0.7})
+        assert response.headers['X-Cache'] == 'BYPASS'
+    assert generates(upstream) == 2
+    assert generate(proxy, 'explain', options={'temperature': 0.7, 'seed': 42})[0].headers['X-Cache'] == 'MISS'
+    assert requests.get(f"{proxy}/cache/stats").json()['bypassed'] == 2
+
+
+def test_new_model_digest_invalidates_entries(upstream, tmp_path):
+    server = make_server('127.0.0.1', 0, upstream.url, tmp_path / 'cache')
+    server.RequestHandlerClass.digests.ttl = 0
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    proxy = f"http://127.0.0.1:{server.server_port}"
+    try:
+        generate(proxy, 'same prompt')
+        upstream.digests['phi4:latest'] = 'sha256:bbb'
+        assert generate(proxy, 'same prompt')[0].headers['X-Cache'] == 'MISS'
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+def test_cache_key_is_canonical():
+    request = {'model': 'phi4', 'prompt': 'p', 'options': {'temperature': 0, 'num_predict': 32}}
+    reordered = {'options': {'num_predict': 32, 'temperature': 0}, 'prompt': 'p', 'model': 'phi4:latest',
+                 'stream': True, 'keep_alive': '5m'}
+    assert cache_key('/api/generate', request, 'd') == cache_key('/api/generate', reordered, 'd')
+    assert cache_key('/api/generate', request, 'd') != cache_key('/api/generate', dict(request, stream=False), 'd')
+    assert cache_key('/api/generate', request, 'd') != cache_key('/api/chat', request, 'd')
+    assert not is_cacheable('/api/generate', {'model': 'phi4', 'options': {'temperature': 0}})
+
+
+def test_lru_eviction_keeps_recent_entries(tmp_path):
+    cache = ResponseCache(tmp_path, max_bytes=400)
+    for key in 'abc':
+        cache.put(key, {'content_type': 'application/json'}, b'x' * 80)
+    cache.get('a')
+    cache.put('d', {'content_type': 'application/json'}, b'x' * 80)
+
+    assert set(cache.entries) == {'a', 'c', 'd'}
+    assert cache.total_bytes <= 400
+    assert cache.stats()['evicted'] == 1
+    # Recency and size are rebuilt from disk on restart
+    reopened = ResponseCache(tmp_path, max_bytes=400)
+    assert set(reopened.entries) == {'a', 'c', 'd'}
+    assert reopened.total_bytes == cache.total_bytes
+
+    # A lower limit on restart evicts the oldest entries right away
+    for age, key in enumerate('dac'):
+        os.utime(tmp_path / f'{key}.entry', (1000 - age, 1000 - age))
+    smaller = ResponseCache(tmp_path, max_bytes=cache.entries['a'] * 2)
+    assert set(smaller.entries) == {'d', 'a'}
+    assert not (tmp_path / 'c.entry').exists()
+    assert smaller.stats()['evicted'] == 1
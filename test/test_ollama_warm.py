@@ -0,0 +1,108 @@
+"""
+Tests for Ollama model warm-up and the keep-alive keeper
+Run with: python -m pytest test/test_ollama_warm.py
+"""
+
+import time
+
+import pytest
+
+from ollama_setup import OllamaSetup, WarmKeeper, parse_keep_alive, parse_timestamp
+from stub_ollama import StubOllama
+
+
+@pytest.fixture
+def ollama():
+    stub = StubOllama(['phi4'], load_delay=0.3).start()
+    yield stub
+    stub.close()
+
+
+def generates(stub):
+    """Bodies of the /api/generate requests the stub received"""
+    return [request for path, request in stub.requests if path == '/api/generate']
+
+
+def test_parses_ollama_durations_and_timestamps():
+    assert parse_keep_alive('30m') == 1800
+    assert parse_keep_alive('1h') == 3600
+    assert parse_keep_alive(-1) == -1
+    assert parse_timestamp('2024-06-04T14:38:31.837531234-07:00') == pytest.approx(1717537111.837531)
+    with pytest.raises(ValueError):
+        parse_keep_alive('soon')
+
+
+def test_warm_up_loads_model_and_improves_ttft(ollama):
+    setup = OllamaSetup('phi4', ollama.url)
+    assert not setup.is_model_loaded()
+
+    result = setup.warm_up(keep_alive='10m', measure=True)['phi4']
+
+    assert not result['was_loaded']
+    assert setup.is_model_loaded()
+    assert result['ttft_before']['ttft_seconds'] >= ollama.load_delay
+    assert result['ttft_before']['load_seconds'] == pytest.approx(ollama.load_delay)
+    assert result['ttft_after']['ttft_seconds'] < ollama.load_delay
+    assert generates(ollama)[1] == {'model': 'phi4', 'keep_alive': '10m'}
+
+
+def test_unload_model(ollama):
+    setup = OllamaSetup('phi4', ollama.url)
+    setup.warm_model()
+    setup.unload_model()
+    assert not setup.is_model_loaded()
+
+
+def test_keeper_rewarms_only_while_models_are_used(ollama):
+    setup = OllamaSetup('phi4', ollama.url)
+    keeper = WarmKeeper(setup, interval=10, min_keep_alive=60, max_keep_alive=600, idle_limit=1000)
+    now = time.time()
+
+    # First pass warms unconditionally, a loaded and unused model is then left alone
+    assert keeper.poll(now) == ['phi4']
+    assert keeper.poll(now + 5) == []
+
+    # A client request pushes the expiry past what the keeper set: counted as a use
+    ollama.loaded['phi4:latest'] = now + 400
+    keeper.poll(now + 100)
+    ollama.loaded['phi4:latest'] = now + 700
+    keeper.poll(now + 300)
+    assert keeper.uses['phi4'] == [now + 100, now + 300]
+    assert keeper.keep_alive_for('phi4') == 400
+
+    # Expiring soon after recent use: re-warmed with the derived keep_alive
+    assert keeper.poll(now + 690) == ['phi4']
+    assert generates(ollama)[-1]['keep_alive'] == 400
+
+    # Once idle for longer than idle_limit the model is allowed to unload
+    ollama.loaded.clear()
+    assert keeper.poll(now + 2000) == []
+
+
+def test_keeper_counts_shorter_keep_alive_requests_as_uses(ollama):
+    setup = OllamaSetup('phi4', ollama.url)
+    keeper = WarmKeeper(setup, interval=10, min_keep_alive=600, idle_limit=1000)
+    now = time.time()
+    assert keeper.poll(now) == ['phi4']
+
+    # A client asked for a shorter keep_alive than the keeper's: the expiry moves earlier
+    ollama.loaded['phi4:latest'] = now + 50 + 120
+    keeper.poll(now + 50)
+    assert keeper.uses['phi4'] == [now + 50]
+    # Sub-second rounding of the reported expiry is not a use
+    ollama.loaded['phi4:latest'] += 0.5
+    keeper.poll(now + 60)
+    assert keeper.uses['phi4'] == [now + 50]
+
+
+def test_keeper_slow_load_is_not_a_use():
+    ollama = StubOllama(['phi4'], load_delay=1.5).start()
+    try:
+        keeper = WarmKeeper(OllamaSetup('phi4', ollama.url), interval=10, min_keep_alive=60)
+        now = time.time()
+        # The model's timer starts after the 1.5s load, later than the poll's timestamp
+        assert keeper.poll(now) == ['phi4']
+        assert keeper.poll(now + 5) == []
+        assert keeper.uses['phi4'] == []
+    finally:
+        ollama.close()
@@ -0,0 +1,104 @@
+"""
+Tests for the retrieval quality regression harness
+Run with: python -m pytest test/test_retrieval_eval.py
+"""
+
+import json
+import argparse
+
+import numpy as np
+import pytest
+
+import retrieval_eval
+from retrieval_eval import first_paragraph, build_fixture, retrieval_metrics, run
+
+SOURCE = '''
+def load_weights(path):
+    """Load the model weights from a safetensors file"""
+    return open(path).read()
+
+def split_window(text):
+    """
+    Args:
+        text: Text to split into token windows
+    """
+    return text.split()
+
+def tiny():
+    """Too short"""
+    return 1
+'''
+
+
+def test_first_paragraph_stops_at_tags_and_sections():
+    assert first_paragraph('Embed texts in batches\nof 32\n\nArgs:\n  texts: inputs') == 'Embed texts in batches of 32'
+    assert first_paragraph('* Analyze an error\n* @param {string} error') == 'Analyze an error'
+    # No prose before the first section: the function name is the query
+    assert first_paragraph('Args:\n    text: Text to split', 'split_window') == 'split window'
+    assert first_paragraph('@returns {Promise}', 'queryOllamaStream') == 'query ollama stream'
+
+
+def test_build_fixture_pairs_queries_with_chunks(tmp_path):
+    (tmp_path / 'bin').mkdir()
+    (tmp_path / 'bin' / 'model.py').write_text(SOURCE)
+    fixture = build_fixture(tmp_path, paths=('bin',))
+
+    assert [chunk['id'] for chunk in fixture['chunks']] == ['bin/model.py:load_weights']
+    assert fixture['queries'] == [{'query': 'Load the model weights from a safetensors file',
+                                   'relevant': ['bin/model.py:load_weights']}]
+    assert 'safetensors' not in fixture['chunks'][0]['content']
+    assert fixture['sha256'] == retrieval_eval.fixture_digest(fixture)
+
+
+def test_retrieval_metrics_ranks_relevant_chunks():
+    chunks = np.eye(3, dtype=np.float32)
+    queries = np.array([[1, 0.1, 0], [0.2, 0.1, 1], [0, 0.5, 0.6]], dtype=np.float32)
+    relevant = [{'relevant': ['a']}, {'relevant': ['c']}, {'relevant': ['b']}]
+    metrics = retrieval_metrics(chunks, queries, ['a', 'b', 'c'], relevant, ks=(1, 5))
+    assert metrics == {'mrr': pytest.approx(5 / 6), 'recall@1': 2 / 3, 'recall@5': 1.0}
+
+
+@pytest.fixture
+def evaluation(tmp_path, monkeypatch):
+    fixture = {'version': 2, 'revision': None,
+               'chunks': [{'id': f'c{i}', 'path': 'x.py', 'content': f'chunk {i}'} for i in range(3)],
+               'queries': [{'query': f'query {i}', 'relevant': [f'c{i}']} for i in range(3)]}
+    fixture['sha256'] = retrieval_eval.fixture_digest(fixture)
+    (tmp_path / 'fixture.json').write_text(json.dumps(fixture))
+
+    def embed(self, texts, options=None, batch_size=32):
+        return np.array([[1.0 + int(text[-1]) * (i == int(text[-1])) for i in range(3)] for text in texts],
+                        dtype=np.float32), 0.01
+
+    monkeypatch.setattr(retrieval_eval.ServiceClient, '__init__', lambda self, *args: None)
+    monkeypatch.setattr(retrieval_eval.ServiceClient, 'embed', embed)
+    return argparse.Namespace(
+        fixture=str(tmp_path / 'fixture.json'), fixture_sha256=None, baseline=str(tmp_path / 'baseline.npz'),
+        save_baseline=False, url='http://127.0.0.1:1', socket=None, option=None, batch_size=32, k=10,
+        min_mrr=None, min_recall=None, max_mrr_drop=0.02, max_recall_drop=0.02, min_cosine=0.98, output=None)
+
+
+def test_baseline_must_match_the_fixture_content(evaluation, tmp_path):
+    evaluation.save_baseline = True
+    assert run(evaluation) == 0
+    evaluation.save_baseline = False
+    assert run(evaluation) == 0
+
+    # Same number of chunks, different texts: the baseline no longer applies
+    fixture = json.loads((tmp_path / 'fixture.json').read_text())
+    fixture['chunks'][0]['content'] = 'edited chunk 0'
+    fixture['sha256'] = retrieval_eval.fixture_digest(fixture)
+    (tmp_path / 'fixture.json').write_text(json.dumps(fixture))
+    assert run(evaluation) == 2
+
+
+def test_fixture_is_frozen_by_hash(evaluation, tmp_path):
+    fixture = json.loads((tmp_path / 'fixture.json').read_text())
+    evaluation.fixture_sha256 = fixture['sha256']
+    assert run(evaluation) == 0
+
+    fixture['queries'][0]['query'] = 'changed by hand'
+    (tmp_path / 'fixture.json').write_text(json.dumps(fixture))
+    assert run(evaluation) == 2
+    evaluation.fixture_sha256 = None
+    assert run(evaluation) == 2
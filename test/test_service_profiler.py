@@ -0,0 +1,107 @@
+"""
+Tests for the embedding service profiling helpers
+Run with: python -m pytest test/test_service_profiler.py
+"""
+
+import sys
+import json
+import types
+import threading
+from contextlib import nullcontext
+
+import pytest
+
+from service_profiler import TorchTrace, StageTimer
+
+
+class FakeProfile:
+    """Minimal torch.profiler.profile that writes one event per profiled block"""
+
+    active = 0
+    fail_export = False
+
+    def __init__(self, **kwargs):
+        pass
+
+    def __enter__(self):
+        FakeProfile.active += 1
+        assert FakeProfile.active == 1, 'nested torch profiles'
+        return self
+
+    def __exit__(self, *exc):
+        FakeProfile.active -= 1
+
+    def export_chrome_trace(self, path):
+        if FakeProfile.fail_export:
+            raise RuntimeError('export failed')
+        with open(path, 'w') as f:
+            json.dump({'traceEvents': [{'name': 'forward'}]}, f)
+
+
+@pytest.fixture(autouse=True)
+def fake_torch(monkeypatch):
+    profiler = types.SimpleNamespace(profile=FakeProfile, record_function=lambda label: nullcontext(),
+                                     ProfilerActivity=types.SimpleNamespace(CPU='cpu'))
+    monkeypatch.setitem(sys.modules, 'torch', types.SimpleNamespace(profiler=profiler))
+    monkeypatch.setitem(sys.modules, 'torch.profiler', profiler)
+    FakeProfile.active = 0
+    FakeProfile.fail_export = False
+
+
+def test_capture_records_only_while_active():
+    trace = TorchTrace()
+    with trace.capture('forward'):
+        pass
+    trace.start()
+    with trace.capture('forward'):
+        pass
+    assert trace.stop()['traceEvents'] == [{'name': 'forward'}]
+
+
+def test_concurrent_blocks_are_not_traced_twice():
+    trace = TorchTrace()
+    trace.start()
+    inside, release = threading.Event(), threading.Event()
+
+    def first():
+        with trace.capture('forward'):
+            inside.set()
+            release.wait(5)
+
+    thread = threading.Thread(target=first)
+    thread.start()
+    inside.wait(5)
+    # Runs untraced instead of starting a second profile
+    with trace.capture('forward'):
+        ran = True
+    release.set()
+    thread.join()
+
+    assert ran
+    assert len(trace.stop()['traceEvents']) == 1
+
+
+def test_profiler_errors_do_not_fail_the_block():
+    trace = TorchTrace()
+    trace.start()
+    FakeProfile.fail_export = True
+    with trace.capture('forward'):
+        result = 42
+    assert result == 42 and trace.stop()['traceEvents'] == []
+
+    # Errors from the block itself still propagate
+    trace.start()
+    with pytest.raises(ValueError):
+        with trace.capture('forward'):
+            raise ValueError('bad input')
+    with trace.capture('forward'):
+        pass
+
+
+def test_stage_timer_formats_server_timing():
+    timer = StageTimer()
+    timer.lap('tokenize')
+    timer.lap('forward')
+    timer.lap('forward')
+    header = timer.server_timing()
+    assert [part.split(';')[0] for part in header.split(', ')] == ['tokenize', 'forward', 'total']
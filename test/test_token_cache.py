@@ -0,0 +1,51 @@
+"""
+Tests for the pre-tokenized corpus cache, with a small word-level tokenizer
+Run with: python -m pytest test/test_token_cache.py
+"""
+
+import numpy as np
+import pytest
+
+from token_cache import TokenCache
+
+VOCAB = {'<pad>': 1, '<unk>': 0, 'def': 2, 'return': 3, 'x': 4, 'y': 5, 'class': 6}
+
+
+@pytest.fixture
+def tokenizer_path(tmp_path):
+    from tokenizers import Tokenizer, models, pre_tokenizers
+    tokenizer = Tokenizer(models.WordLevel(VOCAB, unk_token='<unk>'))
+    tokenizer.pre_tokenizer = pre_tokenizers.Whitespace()
+    path = tmp_path / 'tokenizer.json'
+    tokenizer.save(str(path))
+    return path
+
+
+def test_builds_packed_ids_and_pads_batches(tmp_path, tokenizer_path):
+    cache = TokenCache(tmp_path / 'cache', tokenizer_path)
+    stats = cache.build([{'id': 'a', 'content': 'def x return y'}, {'id': 'b', 'content': 'class x'}], workers=1)
+
+    assert stats == {'tokenized': 2, 'reused': 0, 'total_tokens': 6}
+    assert cache.is_valid() and cache.index['dtype'] == 'uint16'
+    assert cache.ids(0).tolist() == [2, 4, 3, 5]
+    assert cache.token_counts().tolist() == [4, 2]
+    assert [chunk['id'] for chunk in cache.chunks()] == ['a', 'b']
+
+    indices, input_ids, attention_mask = next(cache.iter_batches(batch_size=2, order=[1, 0]))
+    assert indices.tolist() == [1, 0]
+    np.testing.assert_array_equal(input_ids, [[6, 4, 1, 1], [2, 4, 3, 5]])
+    np.testing.assert_array_equal(attention_mask.sum(axis=1), [2, 4])
+
+
+def test_rebuild_reuses_unchanged_chunks(tmp_path, tokenizer_path):
+    cache = TokenCache(tmp_path / 'cache', tokenizer_path)
+    cache.build([{'content': 'def x'}, {'content': 'class y'}], workers=1)
+    stats = TokenCache(tmp_path / 'cache', tokenizer_path).build(
+        [{'content': 'class y'}, {'content': 'return x'}], workers=1)
+    assert (stats['tokenized'], stats['reused']) == (1, 1)
+
+
+def test_a_different_tokenizer_invalidates_the_cache(tmp_path, tokenizer_path):
+    TokenCache(tmp_path / 'cache', tokenizer_path).build([{'content': 'def x'}], workers=1)
+    tokenizer_path.write_text(tokenizer_path.read_text().replace('"class"', '"klass"'))
+    assert not TokenCache(tmp_path / 'cache', tokenizer_path).is_valid()